@@ -1,87 +1,152 @@
+import argparse
+import csv
 import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
-import face_recognition
-import sqlite3
-from utils import preprocess_image_for_face_recognition
+from utils import preprocess_image_for_face_recognition, reduire_pour_detection, agrandir_boite
+from db import creer_base_donnees, inserer_utilisateur, inserer_utilisateurs_par_lot, verifier_identifiants
+from galerie_faciale import TOLERANCE, obtenir_galerie, signaler_inscription
+
+# face_recognition (dlib et ses modèles) n'est chargé qu'au premier visage à traiter :
+# ni l'ouverture des pages ni la vérification du mot de passe n'en paient le coût
+def _face_recognition():
+    import face_recognition
+    return face_recognition
 
 def hash_mot_de_passe(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+# Encodage facial d'une image (premier visage détecté), ou None sans visage.
+# La détection (l'étape la plus coûteuse) se fait sur une copie réduite ; sans visage, on s'arrête là
+def calculer_encodage(image):
+    # Prétraitement de l'image pour la reconnaissance faciale
+    image = preprocess_image_for_face_recognition(image)
+    
+    face_recognition = _face_recognition()
+    petite, echelle = reduire_pour_detection(image)
+    faces = face_recognition.face_locations(petite)
+    if not faces:
+        return None
+    
+    # Extraction de l'encodage sur l'image prétraitée, dans la boîte remise à son échelle
+    boite = agrandir_boite(faces[0], echelle, image.shape)
+    return face_recognition.face_encodings(image, [boite])[0]
+
+def encoder_visage(image):
+    encodage_facial = calculer_encodage(image)
+    if encodage_facial is None:
+        raise ValueError("Aucun visage détecté dans l'image")
+    return encodage_facial
+
 def enregistrer_utilisateur(nom_utilisateur, email, mot_de_passe, image):
+    encodage_facial = encoder_visage(image)
+    mot_de_passe_hash = hash_mot_de_passe(mot_de_passe)
+    
+    # Insertion dans la base de données (un email déjà utilisé est refusé par la contrainte UNIQUE)
+    id_utilisateur = inserer_utilisateur(nom_utilisateur, email, mot_de_passe_hash, encodage_facial.tobytes())
+    signaler_inscription(email, encodage_facial, id_utilisateur)
+    return True
+
+# Inscription de plusieurs utilisateurs [(nom_utilisateur, email, mot_de_passe, image)] en une transaction.
+# Renvoie (emails inscrits, rejets [(email, raison)])
+def enregistrer_utilisateurs_par_lot(utilisateurs):
+    resultats = []
+    for nom_utilisateur, email, mot_de_passe, image in utilisateurs:
+        try:
+            resultats.append((nom_utilisateur, email, mot_de_passe, encoder_visage(image), None))
+        except Exception as e:
+            resultats.append((nom_utilisateur, email, mot_de_passe, None, str(e)))
+    return _inscrire_encodages(resultats)
+
+# Insertion en une transaction des utilisateurs encodés [(nom, email, mot_de_passe, encodage ou None, erreur)].
+# Les encodages restent alignés sur les lignes : un email présent deux fois dans le lot n'inscrit que
+# la première ligne, avec son propre visage
+def _inscrire_encodages(resultats):
+    lignes, encodages, rejets = [], [], []
+    for nom_utilisateur, email, mot_de_passe, encodage_facial, erreur in resultats:
+        if encodage_facial is None:
+            rejets.append((email, erreur))
+            continue
+        encodages.append(encodage_facial)
+        lignes.append((nom_utilisateur, email, hash_mot_de_passe(mot_de_passe), encodage_facial.tobytes()))
+    
+    inseres, doublons = inserer_utilisateurs_par_lot(lignes)
+    for position, id_utilisateur, email in inseres:
+        signaler_inscription(email, encodages[position], id_utilisateur)
+    return [email for _, _, email in inseres], rejets + doublons
+
+# Encodage d'une photo (exécuté dans un processus du pool) : (encodage ou None, erreur)
+def _encoder_fichier(chemin):
     try:
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
-        
-        # Prétraitement de l'image pour la reconnaissance faciale
-        image = preprocess_image_for_face_recognition(image)
-        
-        # Détection des visages et extraction des encodages
-        faces = face_recognition.face_locations(image)
-        if not faces:
-            raise ValueError("Aucun visage détecté dans l'image")
-        
-        encodage_facial = face_recognition.face_encodings(image, [faces[0]])[0]
-        mot_de_passe_hash = hash_mot_de_passe(mot_de_passe)
-       
-        # Vérification si l'email existe déjà
-        cursor.execute("SELECT id FROM utilisateurs WHERE email = ?", (email,))
-        if cursor.fetchone():
-            conn.close()
-            raise ValueError("Cet email est déjà utilisé")
-            
-        # Insertion dans la base de données
-        cursor.execute('''INSERT INTO utilisateurs (nom_utilisateur, email, mot_de_passe, descripteur_facial)
-                          VALUES (?, ?, ?, ?)
-                       ''', (nom_utilisateur, email, mot_de_passe_hash, encodage_facial.tobytes()))
-        conn.commit()
-        conn.close()
-        return True
+        image = cv2.imread(chemin)
+        if image is None:
+            raise ValueError(f"Impossible de lire l'image: {chemin}")
+        return encoder_visage(image), None
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
-        raise e
+        return None, str(e)
+
+def _initialiser_processus():
+    cv2.setNumThreads(1)
+
+# Inscription depuis un dossier de photos décrit par un fichier CSV (colonnes nom_utilisateur, email,
+# mot_de_passe, image ; image relative au dossier). Les visages sont encodés en parallèle sur
+# n_processus (tous les coeurs par défaut), puis les utilisateurs insérés en une transaction.
+# Renvoie (emails inscrits, rejets [(email, raison)])
+def inscrire_depuis_dossier(chemin_dossier, fichier_liste="utilisateurs.csv", n_processus=None):
+    with open(os.path.join(chemin_dossier, fichier_liste), newline="", encoding="utf-8") as f:
+        utilisateurs = [(ligne["nom_utilisateur"], ligne["email"], ligne["mot_de_passe"],
+                         os.path.join(chemin_dossier, ligne["image"])) for ligne in csv.DictReader(f)]
+    
+    chemins = [chemin for _, _, _, chemin in utilisateurs]
+    if n_processus is None:
+        n_processus = os.cpu_count() or 1
+    if n_processus <= 1 or len(chemins) <= 1:
+        encodages = list(map(_encoder_fichier, chemins))
+    else:
+        with ProcessPoolExecutor(max_workers=n_processus, initializer=_initialiser_processus) as executor:
+            encodages = list(executor.map(_encoder_fichier, chemins))
+    
+    return _inscrire_encodages([(nom_utilisateur, email, mot_de_passe, encodage_facial, erreur)
+                                for (nom_utilisateur, email, mot_de_passe, _), (encodage_facial, erreur)
+                                in zip(utilisateurs, encodages)])
 
 def authentifier_utilisateur(email, mot_de_passe):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    mot_de_passe_hash = hash_mot_de_passe(mot_de_passe)
-    cursor.execute("SELECT * FROM utilisateurs WHERE email = ? AND mot_de_passe = ?", (email, mot_de_passe_hash))
-    utilisateur = cursor.fetchone()
-    conn.close()
-    return utilisateur is not None
+    return verifier_identifiants(email, hash_mot_de_passe(mot_de_passe))
 
 def authentification_par_facial(image):
     try:
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
-       
-        # Prétraitement de l'image
-        image = preprocess_image_for_face_recognition(image)
-        
-        # Extraction des encodages faciaux
-        faces = face_recognition.face_locations(image)
-        if not faces:
+        # Détection sur une copie réduite puis extraction de l'encodage facial
+        encodage_facial = calculer_encodage(image)
+        if encodage_facial is None:
             return None  # Aucun visage détecté
         
-        encodage_facial = face_recognition.face_encodings(image, [faces[0]])[0]
-        
-        # Récupération de tous les descripteurs faciaux
-        cursor.execute('SELECT descripteur_facial, email FROM utilisateurs')
-        utilisateurs = cursor.fetchall()
-        conn.close()
-        
-        # Comparaison avec chaque utilisateur
-        for descripteur_binaire, email in utilisateurs:
-            descripteur = np.frombuffer(descripteur_binaire, dtype=np.float64)
-
-            match = face_recognition.compare_faces([descripteur], encodage_facial, tolerance=0.7)
-            if match[0]:
-                return email
-        
-        return None  
+        # Comparaison avec tous les utilisateurs en une seule opération : l'utilisateur le plus proche
+        # est retenu s'il est sous la tolérance
+        galerie = obtenir_galerie()
+        galerie.rafraichir()
+        email, _ = galerie.identifier(encodage_facial, tolerance=TOLERANCE)
+        return email
     except Exception as e:
         print(f"Erreur lors de l'authentification faciale: {e}")
-        if 'conn' in locals() and conn:
-            conn.close()
-        return None
\ No newline at end of file
+        return None
+
+#---------------------Outil en ligne de commande-------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Inscription d'utilisateurs depuis un dossier de photos")
+    parser.add_argument("dossier", help="Dossier contenant les photos et le fichier CSV")
+    parser.add_argument("--liste", default="utilisateurs.csv",
+                        help="Fichier CSV (nom_utilisateur, email, mot_de_passe, image) dans le dossier")
+    parser.add_argument("--processus", type=int, help="Nombre de processus (tous les coeurs par défaut)")
+    args = parser.parse_args()
+
+    creer_base_donnees()
+    inscrits, rejets = inscrire_depuis_dossier(args.dossier, args.liste, args.processus)
+    print(f"{len(inscrits)} utilisateurs inscrits, {len(rejets)} rejetés")
+    for email, raison in rejets:
+        print(f"  {email}: {raison}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.commun import ecrire_rapport, environnement, percentiles, signatures_synthetiques
+from index_approx import IndexApprox, construire_index_approx
+from moteur import calculer_distances, selection_top_k
+from stockage import ecrire_index, ouvrir_index
+
+# Rappel@k et latence de l'index approximatif par rapport à la recherche exacte.
+#   python -m benchmarks.approx Signatures*.idx
+#   python -m benchmarks.approx --synthetique 200000 99
+
+def evaluer_index(fichier, distance, k, n_requetes, liste_sondes, reclassement, graine=0):
+    index = ouvrir_index(fichier, mmap=False)
+    debut = time.perf_counter()
+    fichier_approx = construire_index_approx(fichier)
+    duree_construction = time.perf_counter() - debut
+    approx = IndexApprox(fichier_approx)
+
+    generateur = np.random.default_rng(graine)
+    requetes = index.caracteristiques[generateur.choice(len(index), min(n_requetes, len(index)), replace=False)]
+
+    # Vérité terrain et latence de la recherche exacte
+    verites = []
+    durees_exactes = []
+    for requete in requetes:
+        debut = time.perf_counter()
+        verites.append(set(selection_top_k(calculer_distances(requete, index.caracteristiques, distance), k)))
+        durees_exactes.append(time.perf_counter() - debut)
+
+    resultats = []
+    for n_sondes in liste_sondes:
+        rappels = []
+        durees = []
+        for requete, verite in zip(requetes, verites):
+            debut = time.perf_counter()
+            identifiants, _ = approx.rechercher(requete, distance, k, n_sondes, index.caracteristiques, reclassement)
+            durees.append(time.perf_counter() - debut)
+            rappels.append(len(verite.intersection(identifiants.tolist())) / len(verite))
+        resultats.append({"n_sondes": n_sondes, "rappel": float(np.mean(rappels)), "latence": percentiles(durees)})
+
+    return {
+        "fichier": os.path.basename(fichier),
+        "methode": index.methode,
+        "rgb": index.rgb,
+        "dimension": index.dimension,
+        "nombre": len(index),
+        "n_listes": approx.entete["n_listes"],
+        "construction_s": duree_construction,
+        "exacte": percentiles(durees_exactes),
+        "approx": resultats,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Rappel@k et latence de l'index approximatif")
+    parser.add_argument("fichiers", nargs="*", help="Index .idx (par défaut : Signatures*.idx)")
+    parser.add_argument("--synthetique", nargs=2, type=int, metavar=("N", "DIM"),
+                        help="Utiliser une collection synthétique de N signatures de dimension DIM")
+    parser.add_argument("--distance", default="euclidienne")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--requetes", type=int, default=200)
+    parser.add_argument("--sondes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--reclassement", type=int, default=4)
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        fichiers = args.fichiers or sorted(glob.glob("Signatures*.idx"))
+        if args.synthetique:
+            n, dimension = args.synthetique
+            caracteristiques, chemins = signatures_synthetiques(n, dimension)
+            fichiers = [ecrire_index(os.path.join(dossier, "Synthetique.idx"), caracteristiques, chemins, "synthetique", False)]
+
+        rapport = {
+            "environnement": environnement(),
+            "distance": args.distance,
+            "k": args.k,
+            "reclassement": args.reclassement,
+            "index": [evaluer_index(fichier, args.distance, args.k, args.requetes, args.sondes, args.reclassement)
+                      for fichier in fichiers],
+        }
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import numpy as np
+import db
+from benchmarks.commun import ecrire_rapport, environnement
+from galerie_faciale import GalerieFaciale
+
+# Débit des connexions (vérification email/mot de passe + identification faciale) et des
+# inscriptions sous concurrence : couche d'accès partagée (pool de connexions, WAL,
+# instructions préparées, galerie en mémoire) contre l'ancien accès (une connexion par appel,
+# SELECT avant INSERT, comparaison utilisateur par utilisateur).
+# Les encodages sont aléatoires : face_recognition n'est pas nécessaire.
+#   python -m benchmarks.auth --utilisateurs 20000 --threads 1 4 8
+
+def _hash(mot_de_passe):
+    return hashlib.sha256(mot_de_passe.encode()).hexdigest()
+
+#---------------------Ancien accès-------------------------------
+
+def ancienne_connexion(chemin_base, email, mot_de_passe, encodage, tolerance=0.7):
+    conn = sqlite3.connect(chemin_base, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM utilisateurs WHERE email = ? AND mot_de_passe = ?", (email, _hash(mot_de_passe)))
+    ok = cursor.fetchone() is not None
+    conn.close()
+    conn = sqlite3.connect(chemin_base, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute('SELECT descripteur_facial, email FROM utilisateurs')
+    utilisateurs = cursor.fetchall()
+    conn.close()
+    for descripteur_binaire, email_trouve in utilisateurs:
+        descripteur = np.frombuffer(descripteur_binaire, dtype=np.float64)
+        if np.linalg.norm(descripteur - encodage) <= tolerance:
+            return ok and email_trouve == email
+    return False
+
+def ancienne_inscription(chemin_base, nom, email, mot_de_passe, encodage):
+    conn = sqlite3.connect(chemin_base, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM utilisateurs WHERE email = ?", (email,))
+    if cursor.fetchone():
+        conn.close()
+        raise ValueError("Cet email est déjà utilisé")
+    cursor.execute('''INSERT INTO utilisateurs (nom_utilisateur, email, mot_de_passe, descripteur_facial)
+                      VALUES (?, ?, ?, ?)''', (nom, email, _hash(mot_de_passe), encodage.tobytes()))
+    conn.commit()
+    conn.close()
+
+#---------------------Nouvel accès-------------------------------
+
+def nouvelle_connexion(chemin_base, galerie, email, mot_de_passe, encodage):
+    ok = db.verifier_identifiants(email, _hash(mot_de_passe), chemin_base)
+    galerie.rafraichir()
+    trouve, _ = galerie.identifier(encodage)
+    return ok and trouve == email
+
+def nouvelle_inscription(chemin_base, nom, email, mot_de_passe, encodage):
+    db.inserer_utilisateur(nom, email, _hash(mot_de_passe), encodage.tobytes(), chemin_base)
+
+#---------------------Mesures-------------------------------
+
+# Exécute operation(i) pour i dans [0, n) réparti sur n_threads ; renvoie le débit (opérations/s)
+def debit(operation, n, n_threads):
+    compteur = iter(range(n))
+    verrou = threading.Lock()
+
+    def travailleur():
+        while True:
+            with verrou:
+                i = next(compteur, None)
+            if i is None:
+                return
+            operation(i)
+
+    threads = [threading.Thread(target=travailleur) for _ in range(n_threads)]
+    debut = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return n / (time.perf_counter() - debut)
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit des connexions et inscriptions sous concurrence")
+    parser.add_argument("--utilisateurs", type=int, default=10000, help="Utilisateurs inscrits au départ")
+    parser.add_argument("--connexions", type=int, default=200, help="Connexions mesurées par configuration")
+    parser.add_argument("--inscriptions", type=int, default=500, help="Inscriptions mesurées par configuration")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    generateur = np.random.default_rng(0)
+    encodages = generateur.normal(0, 0.1, size=(args.utilisateurs, 128))
+    rapport = {"environnement": environnement(), "utilisateurs": args.utilisateurs, "mesures": []}
+
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin_base = os.path.join(dossier, "users.db")
+        db.creer_base_donnees(chemin_base)
+
+        # Import en masse des utilisateurs de départ (une transaction)
+        debut = time.perf_counter()
+        db.inserer_utilisateurs_par_lot(
+            [(f"u{i}", f"u{i}@exemple.fr", _hash(f"mdp{i}"), encodages[i].tobytes()) for i in range(args.utilisateurs)],
+            chemin_base)
+        rapport["import_par_lot_par_s"] = args.utilisateurs / (time.perf_counter() - debut)
+        print(f"Import par lot: {rapport['import_par_lot_par_s']:.0f} utilisateurs/s")
+
+        galerie = GalerieFaciale(chemin_base)
+        galerie.rafraichir()
+        tirages = generateur.integers(0, args.utilisateurs, size=args.connexions)
+        compteur_inscriptions = iter(range(10 ** 9))
+
+        for n_threads in args.threads:
+            def connexion_ancienne(i):
+                j = tirages[i]
+                ancienne_connexion(chemin_base, f"u{j}@exemple.fr", f"mdp{j}", encodages[j])
+
+            def connexion_nouvelle(i):
+                j = tirages[i]
+                nouvelle_connexion(chemin_base, galerie, f"u{j}@exemple.fr", f"mdp{j}", encodages[j])
+
+            def inscription(fonction):
+                def operation(i):
+                    j = next(compteur_inscriptions)
+                    fonction(chemin_base, f"n{j}", f"n{j}@exemple.fr", "mdp", generateur.normal(0, 0.1, 128))
+                return operation
+
+            mesure = {
+                "threads": n_threads,
+                "connexions_par_s_ancien": debit(connexion_ancienne, args.connexions, n_threads),
+                "connexions_par_s_nouveau": debit(connexion_nouvelle, args.connexions, n_threads),
+                "inscriptions_par_s_ancien": debit(inscription(ancienne_inscription), args.inscriptions, n_threads),
+                "inscriptions_par_s_nouveau": debit(inscription(nouvelle_inscription), args.inscriptions, n_threads),
+            }
+            rapport["mesures"].append(mesure)
+            print(f"{n_threads} threads: connexions {mesure['connexions_par_s_ancien']:.0f} -> "
+                  f"{mesure['connexions_par_s_nouveau']:.0f}/s, inscriptions {mesure['inscriptions_par_s_ancien']:.0f} -> "
+                  f"{mesure['inscriptions_par_s_nouveau']:.0f}/s")
+            db.fermer_connexions(chemin_base)
+
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import contextlib
+import json
+import logging
+import os
+import platform
+import time
+import cv2
+import numpy as np
+from instrumentation import journal
+
+# Outils communs aux benchmarks : chronométrage, percentiles et rapport JSON
+
+def percentiles(durees):
+    durees = np.asarray(durees, dtype=np.float64)
+    if len(durees) == 0:
+        return {"n": 0}
+    return {
+        "n": int(len(durees)),
+        "moyenne_ms": float(durees.mean() * 1000),
+        "p50_ms": float(np.percentile(durees, 50) * 1000),
+        "p95_ms": float(np.percentile(durees, 95) * 1000),
+        "p99_ms": float(np.percentile(durees, 99) * 1000),
+    }
+
+# Durées (secondes) de `repetitions` appels à fonction()
+def chronometrer(fonction, repetitions=1, preparer=None):
+    durees = []
+    for _ in range(repetitions):
+        # Préparation hors mesure (vidage d'un cache...)
+        if preparer is not None:
+            preparer()
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+# Collection synthétique de signatures : groupes gaussiens, pour mesurer la recherche sans images
+def signatures_synthetiques(n, dimension, n_groupes=64, graine=0):
+    generateur = np.random.default_rng(graine)
+    centres = generateur.uniform(0, 100, size=(n_groupes, dimension))
+    groupes = generateur.integers(0, n_groupes, size=n)
+    donnees = centres[groupes] + generateur.normal(0, 5, size=(n, dimension))
+    return np.abs(donnees).astype(np.float32), [f"synthetique/{i:08d}.png" for i in range(n)]
+
+# Image synthétique texturée (dégradé + bruit + formes), BGR uint8
+def image_synthetique(cote, generateur):
+    y, x = np.mgrid[0:cote, 0:cote].astype(np.float32) / cote
+    frequence = generateur.uniform(2, 20)
+    base = 127 + 60 * np.sin(2 * np.pi * frequence * (x * generateur.uniform(-1, 1) + y * generateur.uniform(-1, 1)))
+    image = np.stack([base * generateur.uniform(0.5, 1.0) for _ in range(3)], axis=2)
+    image += generateur.normal(0, generateur.uniform(5, 40), size=image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    for _ in range(generateur.integers(1, 6)):
+        centre = tuple(int(v) for v in generateur.integers(0, cote, size=2))
+        couleur = tuple(int(v) for v in generateur.integers(0, 256, size=3))
+        cv2.circle(image, centre, int(generateur.integers(cote // 20 + 1, cote // 4 + 2)), couleur, -1)
+    return image
+
+# Collection d'images synthétiques écrite dans dossier ; renvoie la liste des chemins
+def generer_images(dossier, n, cote, graine=0, extension=".png"):
+    generateur = np.random.default_rng(graine)
+    os.makedirs(dossier, exist_ok=True)
+    chemins = []
+    for i in range(n):
+        chemin = os.path.join(dossier, f"img_{cote}_{i:06d}{extension}")
+        cv2.imwrite(chemin, image_synthetique(cote, generateur))
+        chemins.append(chemin)
+    return chemins
+
+# Collection étiquetée : n_classes textures (fréquence, orientation, couleurs et bruit propres à la
+# classe), par_classe images chacune (phase, bruit et formes aléatoires), dans dossier/<classe>/.
+# Renvoie la liste des (chemin, classe)
+def generer_images_etiquetees(dossier, n_classes, par_classe, cote, graine=0):
+    generateur = np.random.default_rng(graine)
+    y, x = np.mgrid[0:cote, 0:cote].astype(np.float32) / cote
+    images = []
+    for c in range(n_classes):
+        classe = f"classe_{c:02d}"
+        os.makedirs(os.path.join(dossier, classe), exist_ok=True)
+        frequence = generateur.uniform(2, 40)
+        direction = generateur.uniform(-1, 1, size=2)
+        couleurs = generateur.uniform(0.3, 1.0, size=3)
+        bruit = generateur.uniform(5, 40)
+        for i in range(par_classe):
+            phase = generateur.uniform(0, 2 * np.pi)
+            base = 127 + 60 * np.sin(2 * np.pi * frequence * (x * direction[0] + y * direction[1]) + phase)
+            image = np.stack([base * couleur for couleur in couleurs], axis=2)
+            image += generateur.normal(0, bruit, size=image.shape)
+            image = np.clip(image, 0, 255).astype(np.uint8)
+            for _ in range(generateur.integers(0, 3)):
+                centre = tuple(int(v) for v in generateur.integers(0, cote, size=2))
+                couleur = tuple(int(v) for v in generateur.integers(0, 256, size=3))
+                cv2.circle(image, centre, int(generateur.integers(cote // 20 + 1, cote // 8 + 2)), couleur, -1)
+            chemin = os.path.join(dossier, classe, f"img_{i:04d}.png")
+            cv2.imwrite(chemin, image)
+            images.append((chemin, classe))
+    return images
+
+# Exécution temporaire dans un autre dossier (les index sont écrits dans le dossier courant)
+@contextlib.contextmanager
+def dans_dossier(dossier):
+    precedent = os.getcwd()
+    os.chdir(dossier)
+    try:
+        yield
+    finally:
+        os.chdir(precedent)
+
+# Exécution sans les messages des fonctions mesurées (sortie standard et journal "cbir")
+@contextlib.contextmanager
+def silencieux():
+    niveau = journal.level
+    journal.setLevel(logging.ERROR)
+    try:
+        with open(os.devnull, "w") as nul, contextlib.redirect_stdout(nul):
+            yield
+    finally:
+        journal.setLevel(niveau)
+
+def environnement():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processeurs": os.cpu_count(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+# Ecriture du rapport (JSON) sur la sortie standard ou dans un fichier
+def ecrire_rapport(rapport, sortie=None):
+    texte = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if sortie:
+        with open(sortie, "w", encoding="utf-8") as f:
+            f.write(texte)
+        print(f"Rapport écrit dans {sortie}")
+    else:
+        print(texte)
@@ -0,0 +1,59 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from benchmarks.commun import ecrire_rapport, environnement, percentiles
+
+# Démarrage à froid : durée (processus Python neuf) des imports et d'une première extraction,
+# pour comparer les bibliothèques chargées au démarrage selon les versions du code.
+# Un scénario dont une dépendance manque (streamlit, face_recognition...) est signalé indisponible.
+#   python -m benchmarks.demarrage --repetitions 5
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "python": "pass",
+    "import_cbir": "import cbir",
+    "import_service": "import service",
+    "import_main": "import main",
+    "import_auth": "import auth",
+    "extraction_glcm": "from cbir import extraire_caracteristiques\n"
+                       "import numpy as np\n"
+                       "extraire_caracteristiques(np.zeros((256, 256, 3), np.uint8), 'glcm')",
+    "extraction_concat": "from cbir import extraire_caracteristiques\n"
+                         "import numpy as np\n"
+                         "extraire_caracteristiques(np.zeros((256, 256, 3), np.uint8), 'concat')",
+}
+
+# Durées d'exécution de code dans des processus neufs ; None si le code échoue
+def mesurer_scenario(code, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = subprocess.run([sys.executable, "-c", code], cwd=RACINE, capture_output=True)
+        if resultat.returncode != 0:
+            return None
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+def main():
+    parser = argparse.ArgumentParser(description="Durée de démarrage à froid")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    rapport = {"environnement": environnement(), "scenarios": {}}
+    for nom in args.scenarios:
+        durees = mesurer_scenario(SCENARIOS[nom], args.repetitions)
+        if durees is None:
+            rapport["scenarios"][nom] = {"indisponible": True}
+            print(f"{nom}: indisponible")
+            continue
+        rapport["scenarios"][nom] = percentiles(durees)
+        print(f"{nom}: {rapport['scenarios'][nom]['p50_ms']:.0f} ms (p50)")
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.commun import ecrire_rapport, environnement, signatures_synthetiques
+from doublons import paires_sous_seuil, regrouper_doublons, voisins_index
+from moteur import calculer_distances, rechercher_top_k
+from stockage import ecrire_index, ouvrir_index
+
+# Auto-jointure d'un index (quasi-doublons) : durée des k plus proches voisins de toutes les signatures
+# et des paires sous un seuil, par nombre de processus, contre une recherche exhaustive par signature
+# (extrapolée depuis un échantillon), pour chaque distance. Collection synthétique avec des groupes de
+# doublons injectés (copies légèrement bruitées), retrouvés dans les groupes détectés ; voisins vérifiés
+# sur l'échantillon. Les distances autres qu'euclidienne sont bien plus lentes (pas de produit matriciel).
+#   python -m benchmarks.doublons --collection 200000 --processus 1 4
+#   python -m benchmarks.doublons --collection 20000 --distances euclidienne manhattan tchebychev canberra
+#   OPENBLAS_NUM_THREADS=1 python -m benchmarks.doublons --collection 200000 --processus 8
+
+# Seuils par défaut : au-dessus de la distance entre copies injectées, loin de celle entre voisins naturels
+SEUILS = {"euclidienne": 1.0, "manhattan": 5.0, "tchebychev": 0.5, "canberra": 1.0}
+
+def collection_avec_doublons(n, dimension, n_groupes, taille_groupe, bruit, graine=0):
+    caracteristiques, chemins = signatures_synthetiques(n, dimension, graine=graine)
+    generateur = np.random.default_rng(graine + 1)
+    lignes = generateur.choice(n, n_groupes * taille_groupe, replace=False).reshape(n_groupes, taille_groupe)
+    for groupe in lignes:
+        copies = caracteristiques[groupe[0]] + generateur.normal(0, bruit, size=(taille_groupe - 1, dimension))
+        caracteristiques[groupe[1:]] = np.abs(copies).astype(np.float32)
+    return caracteristiques, chemins, lignes
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-jointure d'un index pour la détection des quasi-doublons")
+    parser.add_argument("--collection", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=99)
+    parser.add_argument("--groupes", type=int, default=500, help="Groupes de doublons injectés")
+    parser.add_argument("--taille-groupe", type=int, default=4)
+    parser.add_argument("--bruit", type=float, default=0.01, help="Ecart-type du bruit des copies")
+    parser.add_argument("--distances", nargs="+", default=["euclidienne"], choices=list(SEUILS))
+    parser.add_argument("--seuil", type=float, help="Seuil des paires (par défaut selon la distance)")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--processus", type=int, nargs="+", default=[1])
+    parser.add_argument("--echantillon", type=int, default=200, help="Requêtes de la recherche une à une")
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    rapport = {"environnement": environnement(), "collection": args.collection, "dimension": args.dimension,
+               "k": args.k, "mesures": []}
+    with tempfile.TemporaryDirectory() as dossier:
+        caracteristiques, chemins, injectes = collection_avec_doublons(
+            args.collection, args.dimension, args.groupes, args.taille_groupe, args.bruit)
+        fichier = ecrire_index(os.path.join(dossier, "Doublons.idx"), caracteristiques, chemins, "concat", True)
+        del caracteristiques
+        index = ouvrir_index(fichier)
+        echantillon = np.random.default_rng(0).choice(len(index), min(args.echantillon, len(index)), replace=False)
+
+        for distance in args.distances:
+            seuil = args.seuil if args.seuil is not None else SEUILS[distance]
+            # Référence : une recherche exhaustive par signature (sans extraction ni rechargement d'index)
+            debut = time.perf_counter()
+            for i in echantillon:
+                rechercher_top_k(index.caracteristiques[i], index.caracteristiques, chemins, distance, args.k + 1)
+            une_a_une = (time.perf_counter() - debut) / len(echantillon) * len(index)
+            print(f"{distance}, recherche une à une (extrapolée): {une_a_une:.0f} s")
+
+            for n_processus in args.processus:
+                debut = time.perf_counter()
+                voisins, distances = voisins_index(fichier, distance, args.k, n_processus=n_processus)
+                duree_voisins = time.perf_counter() - debut
+                debut = time.perf_counter()
+                paires, _ = paires_sous_seuil(fichier, seuil, distance, n_processus)
+                duree_paires = time.perf_counter() - debut
+
+                identiques = 0
+                for i in echantillon:
+                    reference = calculer_distances(index.caracteristiques[i], index.caracteristiques, distance)
+                    reference[i] = np.inf
+                    identiques += bool(np.array_equal(np.sort(reference)[:args.k], distances[i]))
+                groupes = {tuple(groupe.tolist()) for groupe in regrouper_doublons(len(index), paires)}
+                retrouves = sum(tuple(sorted(groupe.tolist())) in groupes for groupe in injectes)
+
+                mesure = {"distance": distance, "seuil": seuil, "processus": n_processus, "une_a_une_s": une_a_une,
+                          "voisins_s": duree_voisins, "paires_s": duree_paires,
+                          "paires": int(len(paires)), "groupes": len(groupes),
+                          "groupes_injectes_retrouves": retrouves / len(injectes),
+                          "voisins_identiques": identiques / len(echantillon)}
+                rapport["mesures"].append(mesure)
+                print(f"{distance}, {n_processus} processus: voisins {duree_voisins:.1f} s, "
+                      f"paires sous le seuil {duree_paires:.1f} s, {len(groupes)} groupes "
+                      f"({mesure['groupes_injectes_retrouves']:.0%} des injectés), "
+                      f"voisins identiques {mesure['voisins_identiques']:.0%}")
+
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
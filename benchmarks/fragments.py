@@ -0,0 +1,64 @@
+import argparse
+import os
+import tempfile
+import numpy as np
+from benchmarks.commun import chronometrer, ecrire_rapport, environnement, percentiles, signatures_synthetiques, silencieux
+from cache import obtenir_index
+from fragments import fermer_pool, fragmenter_index, rechercher_vecteur_fragments
+from moteur import rechercher_top_k
+from stockage import ecrire_index
+
+# Latence de la recherche par vecteur : index unique (en cache) contre index fragmenté,
+# par taille de collection, nombre de fragments et nombre de processus.
+#   python -m benchmarks.fragments --collections 100000 1000000 --fragments 4 8 --processus 1 4
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence de l'index fragmenté")
+    parser.add_argument("--collections", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dimension", type=int, default=99)
+    parser.add_argument("--fragments", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--processus", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--distance", default="euclidienne")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    rapport = {"environnement": environnement(), "distance": args.distance, "k": args.k, "mesures": []}
+    with tempfile.TemporaryDirectory() as dossier:
+        for taille in args.collections:
+            caracteristiques, chemins = signatures_synthetiques(taille, args.dimension, graine=args.graine)
+            fichier = ecrire_index(os.path.join(dossier, f"Fragments_{taille}.idx"), caracteristiques, chemins, "concat", True)
+            requete = caracteristiques[0]
+            del caracteristiques
+
+            index = obtenir_index(fichier)
+            reference = rechercher_top_k(requete, index.caracteristiques, index.chemins, args.distance, args.k)
+            durees = chronometrer(lambda: rechercher_top_k(requete, index.caracteristiques, index.chemins,
+                                                           args.distance, args.k), args.repetitions)
+            rapport["mesures"].append({"collection": taille, "fragments": 1, "processus": 1, "latence": percentiles(durees)})
+            print(f"{taille} signatures, index unique: {rapport['mesures'][-1]['latence']['p50_ms']:.1f} ms (p50)")
+
+            for n_fragments in args.fragments:
+                with silencieux():
+                    fichier_fragments = fragmenter_index(fichier, n_fragments=n_fragments)
+                for n_processus in args.processus:
+                    # Premier appel : démarrage des processus et ouverture des fragments
+                    resultats = rechercher_vecteur_fragments(requete, fichier_fragments, args.distance, args.k, n_processus)
+                    durees = chronometrer(lambda: rechercher_vecteur_fragments(requete, fichier_fragments, args.distance,
+                                                                               args.k, n_processus), args.repetitions)
+                    rapport["mesures"].append({
+                        "collection": taille,
+                        "fragments": n_fragments,
+                        "processus": n_processus,
+                        "identique": resultats == reference,
+                        "latence": percentiles(durees),
+                    })
+                    print(f"{taille} signatures, {n_fragments} fragments, {n_processus} processus: "
+                          f"{rapport['mesures'][-1]['latence']['p50_ms']:.1f} ms (p50)")
+        fermer_pool()
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
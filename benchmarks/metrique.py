@@ -0,0 +1,97 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.commun import ecrire_rapport, environnement, percentiles, signatures_synthetiques, silencieux
+from index_metrique import IndexMetrique, construire_index_metrique
+from moteur import DISTANCES, calculer_distances, selection_top_k
+from stockage import ecrire_index, ouvrir_index
+
+# Latence de l'index exact par arbre de points de vue (VP-tree) contre la recherche exhaustive,
+# pour chaque distance : part des signatures évaluées et identité des top-k.
+# Sans fichier, collections synthétiques aux dimensions des descripteurs
+# (glcm 6/18, haralick 13/39, bit 14/42, concat 33/99 en niveaux de gris / RGB).
+#   python -m benchmarks.metrique Signatures*.idx
+#   python -m benchmarks.metrique --synthetique 200000
+
+DIMENSIONS_DESCRIPTEURS = {"glcm": 6, "glcm_rgb": 18, "haralick": 13, "haralick_rgb": 39,
+                           "bit": 14, "bit_rgb": 42, "concat": 33, "concat_rgb": 99}
+
+def evaluer_index(fichier, distances, k, n_requetes, graine=0):
+    index = ouvrir_index(fichier, mmap=False)
+    generateur = np.random.default_rng(graine)
+    # Requêtes : signatures de l'index légèrement perturbées (pas de distance nulle)
+    requetes = index.caracteristiques[generateur.choice(len(index), min(n_requetes, len(index)), replace=False)]
+    requetes = requetes * generateur.uniform(0.98, 1.02, size=requetes.shape).astype(np.float32)
+
+    mesures = []
+    for distance in distances:
+        debut = time.perf_counter()
+        with silencieux():
+            fichier_metrique = construire_index_metrique(fichier, distance)
+        duree_construction = time.perf_counter() - debut
+        arbre = IndexMetrique(fichier_metrique, index.caracteristiques)
+
+        durees_exactes, durees, evaluees, identiques = [], [], [], 0
+        for requete in requetes:
+            debut = time.perf_counter()
+            distances_exactes = calculer_distances(requete, index.caracteristiques, distance)
+            reference = selection_top_k(distances_exactes, k)
+            durees_exactes.append(time.perf_counter() - debut)
+
+            debut = time.perf_counter()
+            identifiants, valeurs, n_evaluees = arbre.rechercher(requete, k)
+            durees.append(time.perf_counter() - debut)
+            evaluees.append(n_evaluees / len(index))
+            identiques += bool(np.array_equal(identifiants, reference)
+                               and np.array_equal(valeurs, distances_exactes[reference]))
+
+        mesure = {
+            "distance": distance,
+            "construction_s": duree_construction,
+            "noeuds": len(arbre.plages),
+            "exhaustive": percentiles(durees_exactes),
+            "vpt": percentiles(durees),
+            "part_evaluee": float(np.mean(evaluees)),
+            "identiques": identiques / len(requetes),
+        }
+        mesures.append(mesure)
+        print(f"{os.path.basename(fichier)} (dimension {index.dimension}), {distance}: "
+              f"{mesure['exhaustive']['p50_ms']:.1f} -> {mesure['vpt']['p50_ms']:.1f} ms (p50), "
+              f"{mesure['part_evaluee']:.1%} évaluées, identiques {mesure['identiques']:.0%}")
+        os.remove(fichier_metrique)
+
+    return {"fichier": os.path.basename(fichier), "methode": index.methode, "rgb": index.rgb,
+            "dimension": index.dimension, "nombre": len(index), "mesures": mesures}
+
+def main():
+    parser = argparse.ArgumentParser(description="Index métrique exact (VP-tree) contre recherche exhaustive")
+    parser.add_argument("fichiers", nargs="*", help="Index .idx (par défaut : Signatures*.idx)")
+    parser.add_argument("--synthetique", type=int, metavar="N",
+                        help="Collections synthétiques de N signatures aux dimensions des descripteurs")
+    parser.add_argument("--distances", nargs="+", default=list(DISTANCES))
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--requetes", type=int, default=100)
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        fichiers = args.fichiers or sorted(glob.glob("Signatures*.idx"))
+        if args.synthetique:
+            fichiers = []
+            for nom, dimension in DIMENSIONS_DESCRIPTEURS.items():
+                caracteristiques, chemins = signatures_synthetiques(args.synthetique, dimension)
+                fichiers.append(ecrire_index(os.path.join(dossier, f"Synthetique_{nom}.idx"), caracteristiques,
+                                             chemins, nom.split("_")[0], nom.endswith("_rgb")))
+
+        rapport = {
+            "environnement": environnement(),
+            "k": args.k,
+            "index": [evaluer_index(fichier, args.distances, args.k, args.requetes) for fichier in fichiers],
+        }
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.commun import ecrire_rapport, environnement, generer_images_etiquetees, silencieux
+from cbir import lister_images
+from descripteurs import METHODES, PROFILS, charger_image, calculer_variantes, resoudre_profil
+from moteur import calculer_distances, selection_top_k
+
+# Profils d'extraction : accélération par rapport au profil complet et effet sur la qualité
+# de recherche, sur un échantillon étiqueté (une classe par sous-dossier).
+# Chaque image sert de requête contre toutes les autres (sans elle-même) :
+#   - precision@k : part des k résultats de la même classe que la requête ;
+#   - recouvrement@k : part des k résultats identiques à ceux du profil complet.
+#   python -m benchmarks.profils --dossier ./dataSet --k 5
+#   python -m benchmarks.profils --classes 8 --par-classe 6 --cote 1024
+
+# Images étiquetées d'un dossier : la classe est le premier sous-dossier du chemin relatif
+def echantillon_etiquete(dossier):
+    images = []
+    for path_relative in lister_images(dossier):
+        parties = os.path.normpath(path_relative).split(os.sep)
+        if len(parties) > 1:
+            images.append((os.path.join(dossier, path_relative), parties[0]))
+    return images
+
+# Caractéristiques de toutes les images pour une méthode (gris et RGB) et un profil ;
+# les images sont déjà décodées pour ne mesurer que le calcul des descripteurs (durée des deux variantes)
+def extraire(images_decodees, methode, profil):
+    variantes = [(methode, False), (methode, True)]
+    debut = time.perf_counter()
+    caracs = [calculer_variantes(data, variantes, profil) for data in images_decodees]
+    duree = time.perf_counter() - debut
+    return {variante: np.asarray([c[variante] for c in caracs], dtype=np.float32) for variante in variantes}, duree
+
+# k plus proches voisins de chaque image parmi les autres
+def voisins(caracteristiques, distance, k):
+    resultats = []
+    for i, requete in enumerate(caracteristiques):
+        distances = calculer_distances(requete, caracteristiques, distance)
+        distances[i] = np.inf
+        resultats.append(selection_top_k(distances, k))
+    return np.asarray(resultats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Accélération et qualité de recherche des profils d'extraction")
+    parser.add_argument("--dossier", help="Dossier étiqueté (une classe par sous-dossier) ; sinon collection synthétique")
+    parser.add_argument("--classes", type=int, default=6)
+    parser.add_argument("--par-classe", type=int, default=5)
+    parser.add_argument("--cote", type=int, default=1024, help="Côté des images synthétiques")
+    parser.add_argument("--profils", nargs="+", default=list(PROFILS))
+    parser.add_argument("--methodes", nargs="+", default=METHODES[:3], choices=METHODES)
+    parser.add_argument("--distance", default="euclidienne")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporaire:
+        if args.dossier:
+            images = echantillon_etiquete(args.dossier)
+        else:
+            images = generer_images_etiquetees(temporaire, args.classes, args.par_classe, args.cote, args.graine)
+        if len(images) < 2:
+            raise SystemExit("Échantillon étiqueté trop petit")
+        images_decodees = [charger_image(chemin) for chemin, _ in images]
+
+    etiquettes = np.array([classe for _, classe in images])
+    k = min(args.k, len(images) - 1)
+    profils = ["complet"] + [profil for profil in args.profils if profil != "complet"]
+    rapport = {"environnement": environnement(), "images": len(images), "classes": len(set(etiquettes)),
+               "distance": args.distance, "k": k, "profils": {profil: resoudre_profil(profil) for profil in profils},
+               "mesures": []}
+
+    for methode in args.methodes:
+        reference = {}
+        for profil in profils:
+            with silencieux():
+                caracteristiques, duree = extraire(images_decodees, methode, profil)
+            if profil == "complet":
+                duree_complet = duree
+            for (_, rgb), matrice in caracteristiques.items():
+                proches = voisins(matrice, args.distance, k)
+                if profil == "complet":
+                    reference[rgb] = proches
+                precision = float(np.mean(etiquettes[proches] == etiquettes[:, None]))
+                recouvrement = float(np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(proches, reference[rgb])]))
+                mesure = {
+                    "methode": methode,
+                    "rgb": rgb,
+                    "profil": profil,
+                    "duree_s": duree,
+                    "acceleration": duree_complet / duree,
+                    f"precision@{k}": precision,
+                    f"recouvrement@{k}": recouvrement,
+                }
+                rapport["mesures"].append(mesure)
+                print(f"{methode}{'_rgb' if rgb else ''} {profil}: x{mesure['acceleration']:.1f}, "
+                      f"precision@{k} {precision:.3f}, recouvrement@{k} {recouvrement:.3f}")
+
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from benchmarks.auth import debit
+from benchmarks.commun import ecrire_rapport, environnement, percentiles, signatures_synthetiques
+from service import ClientRecherche, ServiceRecherche, creer_serveur
+from stockage import ecrire_index
+
+# Débit du service de recherche par vecteur sous concurrence : requêtes regroupées en lots
+# (calcul matriciel commun) contre traitement une à une (lots de taille 1), par nombre de clients.
+#   python -m benchmarks.service --collection 200000 --clients 1 8 32
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit du service de recherche")
+    parser.add_argument("--collection", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=99)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requetes", type=int, default=200, help="Requêtes mesurées par configuration")
+    parser.add_argument("--distance", default="euclidienne")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--delai", type=float, default=2.0, help="Attente de regroupement (ms)")
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    rapport = {"environnement": environnement(), "collection": args.collection, "distance": args.distance,
+               "k": args.k, "mesures": []}
+    with tempfile.TemporaryDirectory() as dossier:
+        caracteristiques, chemins = signatures_synthetiques(args.collection, args.dimension)
+        ecrire_index(os.path.join(dossier, "Service.idx"), caracteristiques, chemins, "concat", True)
+        requetes = caracteristiques[:args.requetes].copy()
+        del caracteristiques
+
+        for nom, taille_max in (("une_a_une", 1), ("regroupees", 64)):
+            serveur = creer_serveur(ServiceRecherche(dossier, args.delai / 1000, taille_max), port=0)
+            threading.Thread(target=serveur.serve_forever, daemon=True).start()
+            client = ClientRecherche(f"http://127.0.0.1:{serveur.server_port}")
+            client.rechercher_vecteur(requetes[0], "Service.idx", args.distance, args.k)
+
+            for n_clients in args.clients:
+                durees = []
+
+                def requete(i):
+                    debut = time.perf_counter()
+                    client.rechercher_vecteur(requetes[i], "Service.idx", args.distance, args.k)
+                    durees.append(time.perf_counter() - debut)
+
+                mesure = {"mode": nom, "clients": n_clients,
+                          "requetes_par_s": debit(requete, len(requetes), n_clients), "latence": percentiles(durees)}
+                rapport["mesures"].append(mesure)
+                print(f"{nom}, {n_clients} clients: {mesure['requetes_par_s']:.1f} requêtes/s, "
+                      f"p50 {mesure['latence']['p50_ms']:.1f} ms")
+            serveur.shutdown()
+            serveur.server_close()
+
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
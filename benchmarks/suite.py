@@ -0,0 +1,134 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import descripteurs
+from benchmarks.commun import (chronometrer, dans_dossier, ecrire_rapport, environnement, generer_images,
+                               percentiles, signatures_synthetiques, silencieux)
+from cbir import extraction_signatures, rechercher_image
+from cache import obtenir_index, vider_caches_requetes
+from moteur import DISTANCES, rechercher_top_k
+from stockage import ecrire_index
+
+# Suite de benchmarks reproductible : descripteurs, construction d'index, recherche.
+#   python -m benchmarks.suite --sortie avant.json
+#   python -m benchmarks.suite --images 20 --cotes 256 1024 --collections 1000 100000
+
+FONCTIONS_DESCRIPTEURS = ["glcm", "haralick_feat", "bitdesk_feat", "concat",
+                          "glcm_rgb", "haralick_feat_rgb", "bitdesk_feat_rgb", "concat_rgb"]
+
+DIMENSIONS = {"glcm": 6, "haralick": 13, "bit": 14, "concat": 33}
+
+# Temps de chaque descripteur par taille d'image (décodage du fichier inclus)
+def mesurer_descripteurs(dossier, n_images, cotes, graine):
+    resultats = []
+    for cote in cotes:
+        chemins = generer_images(os.path.join(dossier, f"descripteurs_{cote}"), n_images, cote, graine)
+        for nom in FONCTIONS_DESCRIPTEURS:
+            fonction = getattr(descripteurs, nom)
+            durees = [chronometrer(lambda: fonction(chemin))[0] for chemin in chemins]
+            resultats.append({
+                "descripteur": nom,
+                "cote": cote,
+                "images_par_s": len(durees) / sum(durees),
+                "latence": percentiles(durees),
+            })
+            print(f"{nom} {cote}px: {resultats[-1]['latence']['p50_ms']:.1f} ms (p50)")
+    return resultats
+
+# Construction complète d'un index sur une collection d'images
+def mesurer_construction(dossier, n_images, cote, methodes, n_processus, graine):
+    dossier_images = os.path.join(dossier, "construction")
+    generer_images(dossier_images, n_images, cote, graine)
+    resultats = []
+    for methode in methodes:
+        for rgb in (False, True):
+            with dans_dossier(dossier), silencieux():
+                debut = time.perf_counter()
+                extraction_signatures(dossier_images, methode, rgb, n_processus=n_processus)
+                duree = time.perf_counter() - debut
+            resultats.append({
+                "methode": methode,
+                "rgb": rgb,
+                "images": n_images,
+                "cote": cote,
+                "n_processus": n_processus,
+                "duree_s": duree,
+                "images_par_s": n_images / duree,
+            })
+            print(f"construction {methode}{'_rgb' if rgb else ''}: {duree:.2f} s")
+    return resultats
+
+# Latence de rechercher_image (extraction de la requête incluse) et de la recherche seule
+# (vecteur déjà extrait) par taille de collection, distance et k. Les caches de requêtes sont vidés
+# avant chaque appel mesuré de rechercher_image ; la latence d'une requête répétée (servie par le
+# cache de résultats) est rapportée à part
+def mesurer_recherche(dossier, collections, methode, rgb, distances, valeurs_k, repetitions, graine):
+    requete = generer_images(os.path.join(dossier, "requete"), 1, 256, graine + 1)[0]
+    dimension = DIMENSIONS[methode] * (3 if rgb else 1)
+    resultats = []
+    for taille in collections:
+        caracteristiques, chemins = signatures_synthetiques(taille, dimension, graine=graine)
+        fichier = ecrire_index(os.path.join(dossier, f"Recherche_{taille}.idx"), caracteristiques, chemins, methode, rgb)
+        with silencieux():
+            # Premier appel : chargement de l'index dans le cache
+            premier = chronometrer(lambda: rechercher_image(requete, fichier, distances[0], valeurs_k[0]))[0]
+        index = obtenir_index(fichier)
+        vecteur = caracteristiques[0]
+        for distance in distances:
+            for k in valeurs_k:
+                with silencieux():
+                    durees = chronometrer(lambda: rechercher_image(requete, fichier, distance, k), repetitions,
+                                          preparer=vider_caches_requetes)
+                    durees_cache = chronometrer(lambda: rechercher_image(requete, fichier, distance, k), repetitions)
+                durees_vecteur = chronometrer(
+                    lambda: rechercher_top_k(vecteur, index.caracteristiques, index.chemins, distance, k), repetitions)
+                resultats.append({
+                    "collection": taille,
+                    "methode": methode,
+                    "rgb": rgb,
+                    "distance": distance,
+                    "k": k,
+                    "premier_appel_ms": premier * 1000,
+                    "requetes_par_s": len(durees) / sum(durees),
+                    "latence": percentiles(durees),
+                    "latence_recherche_seule": percentiles(durees_vecteur),
+                    "latence_en_cache": percentiles(durees_cache),
+                })
+                print(f"recherche {taille} {distance} k={k}: {resultats[-1]['latence']['p50_ms']:.1f} ms (p50), "
+                      f"hors extraction {resultats[-1]['latence_recherche_seule']['p50_ms']:.2f} ms, "
+                      f"en cache {resultats[-1]['latence_en_cache']['p50_ms']:.2f} ms")
+    return resultats
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des descripteurs, de la construction d'index et de la recherche")
+    parser.add_argument("--images", type=int, default=10, help="Images synthétiques par taille")
+    parser.add_argument("--cotes", type=int, nargs="+", default=[128, 256, 512], help="Côtés des images (px)")
+    parser.add_argument("--construction", type=int, default=50, help="Images pour la construction d'index (0 = ignorer)")
+    parser.add_argument("--methodes", nargs="+", default=["glcm", "concat"], choices=list(DIMENSIONS))
+    parser.add_argument("--processus", type=int, default=1, help="Processus pour la construction")
+    parser.add_argument("--collections", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--methode-recherche", default="concat", choices=list(DIMENSIONS))
+    parser.add_argument("--gris", action="store_true", help="Recherche sur une variante en niveaux de gris")
+    parser.add_argument("--distances", nargs="+", default=list(DISTANCES), choices=list(DISTANCES))
+    parser.add_argument("-k", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        rapport = {
+            "environnement": environnement(),
+            "parametres": vars(args),
+            "descripteurs": mesurer_descripteurs(dossier, args.images, args.cotes, args.graine),
+            "construction": (mesurer_construction(dossier, args.construction, 256, args.methodes,
+                                                  args.processus, args.graine) if args.construction else []),
+            "recherche": mesurer_recherche(dossier, args.collections, args.methode_recherche, not args.gris,
+                                           args.distances, args.k, args.repetitions, args.graine),
+        }
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import face_recognition
+import auth
+from benchmarks.commun import chronometrer, percentiles, generer_images, ecrire_rapport, environnement
+from cbir import lister_images
+from utils import preprocess_image_for_face_recognition
+
+# Chaîne faciale : détection sur l'image prétraitée (800 px, ancien chemin) contre détection sur
+# une copie réduite et encodage dans la boîte remise à l'échelle (auth.calculer_encodage).
+# Mesure la latence par photo, l'écart entre encodages, le coût d'une image sans visage et le
+# débit d'encodage d'un dossier selon le nombre de processus.
+#   python -m benchmarks.visages --dossier ./photos --processus 1 4 8
+
+def ancien_encodage(image):
+    image = preprocess_image_for_face_recognition(image)
+    faces = face_recognition.face_locations(image)
+    if not faces:
+        return None
+    return face_recognition.face_encodings(image, [faces[0]])[0]
+
+# Encodage des photos d'un dossier sur n_processus ; renvoie le débit (photos/s)
+def debit_dossier(chemins, n_processus):
+    debut = time.perf_counter()
+    if n_processus <= 1:
+        list(map(auth._encoder_fichier, chemins))
+    else:
+        with ProcessPoolExecutor(max_workers=n_processus, initializer=auth._initialiser_processus) as executor:
+            list(executor.map(auth._encoder_fichier, chemins))
+    return len(chemins) / (time.perf_counter() - debut)
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence de la chaîne faciale et débit d'inscription")
+    parser.add_argument("--dossier", required=True, help="Dossier de photos de visages")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--sans-visage", type=int, default=20, help="Images synthétiques sans visage")
+    parser.add_argument("--processus", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--sortie", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    chemins = [os.path.join(args.dossier, chemin) for chemin in lister_images(args.dossier)]
+    images = [image for image in map(cv2.imread, chemins) if image is not None]
+    rapport = {"environnement": environnement(), "photos": len(images)}
+
+    # Latence par photo et écart entre les encodages des deux chemins
+    durees = {"ancien": [], "nouveau": []}
+    ecarts, detections = [], {"ancien": 0, "nouveau": 0}
+    for image in images:
+        encodages = {}
+        for nom, fonction in (("ancien", ancien_encodage), ("nouveau", auth.calculer_encodage)):
+            durees[nom] += chronometrer(lambda: encodages.__setitem__(nom, fonction(image)), args.repetitions)
+            detections[nom] += encodages[nom] is not None
+        if encodages["ancien"] is not None and encodages["nouveau"] is not None:
+            ecarts.append(float(np.linalg.norm(encodages["ancien"] - encodages["nouveau"])))
+    rapport["photo"] = {nom: percentiles(valeurs) for nom, valeurs in durees.items()}
+    rapport["visages_detectes"] = detections
+    rapport["ecart_encodages"] = {"max": max(ecarts, default=0.0), "moyen": float(np.mean(ecarts)) if ecarts else 0.0}
+    print(f"Photo: {rapport['photo']['ancien'].get('p50_ms', 0):.1f} -> {rapport['photo']['nouveau'].get('p50_ms', 0):.1f} ms (p50), "
+          f"visages {detections['ancien']} -> {detections['nouveau']}, écart max {rapport['ecart_encodages']['max']:.3f}")
+
+    # Images sans visage (textures synthétiques) : arrêt après la détection
+    with tempfile.TemporaryDirectory() as dossier:
+        sans_visage = [cv2.imread(chemin) for chemin in generer_images(dossier, args.sans_visage, 1024)]
+    rapport["sans_visage"] = {
+        nom: percentiles([duree for image in sans_visage for duree in chronometrer(lambda: fonction(image), args.repetitions)])
+        for nom, fonction in (("ancien", ancien_encodage), ("nouveau", auth.calculer_encodage))
+    }
+    print(f"Sans visage: {rapport['sans_visage']['ancien'].get('p50_ms', 0):.1f} -> "
+          f"{rapport['sans_visage']['nouveau'].get('p50_ms', 0):.1f} ms (p50)")
+
+    # Débit d'encodage d'un dossier (inscription par lot, sans la base)
+    rapport["dossier"] = []
+    for n_processus in args.processus:
+        mesure = {"processus": n_processus, "photos_par_s": debit_dossier(chemins, n_processus)}
+        rapport["dossier"].append(mesure)
+        print(f"Dossier, {n_processus} processus: {mesure['photos_par_s']:.1f} photos/s")
+
+    ecrire_rapport(rapport, args.sortie)
+
+if __name__ == "__main__":
+    main()
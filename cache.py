@@ -0,0 +1,163 @@
+import os
+import threading
+from collections import OrderedDict
+from stockage import charger_index
+
+# Budget mémoire par défaut du cache d'index (Mo), modifiable par variable d'environnement
+BUDGET_INDEX_MO = int(os.environ.get("CBIR_CACHE_INDEX_MO", "1024"))
+
+# Nombre d'entrées des caches de requêtes (caractéristiques et résultats)
+CAPACITE_REQUETES = int(os.environ.get("CBIR_CACHE_REQUETES", "512"))
+
+# Cache LRU thread-safe borné par une capacité ; taille(valeur) donne le coût de chaque entrée
+class CacheLRU:
+    def __init__(self, capacite, taille=None):
+        self.capacite = capacite
+        self._taille = taille or (lambda valeur: 1)
+        self._entrees = OrderedDict()
+        self._occupation = 0
+        self._verrou = threading.Lock()
+
+    def obtenir(self, cle, defaut=None):
+        with self._verrou:
+            if cle not in self._entrees:
+                return defaut
+            self._entrees.move_to_end(cle)
+            return self._entrees[cle][0]
+
+    def ajouter(self, cle, valeur):
+        cout = self._taille(valeur)
+        with self._verrou:
+            self._retirer(cle)
+            # Une entrée plus grande que la capacité n'est pas conservée
+            if cout > self.capacite:
+                return
+            self._entrees[cle] = (valeur, cout)
+            self._occupation += cout
+            while self._occupation > self.capacite:
+                _, (_, cout_ancien) = self._entrees.popitem(last=False)
+                self._occupation -= cout_ancien
+
+    def retirer(self, cle):
+        with self._verrou:
+            self._retirer(cle)
+
+    def _retirer(self, cle):
+        entree = self._entrees.pop(cle, None)
+        if entree is not None:
+            self._occupation -= entree[1]
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._occupation = 0
+
+    def redimensionner(self, capacite):
+        with self._verrou:
+            self.capacite = capacite
+            while self._occupation > self.capacite and self._entrees:
+                _, (_, cout_ancien) = self._entrees.popitem(last=False)
+                self._occupation -= cout_ancien
+
+    @property
+    def occupation(self):
+        return self._occupation
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def __contains__(self, cle):
+        return cle in self._entrees
+
+#---------------------Cache des index de signatures-------------------------------
+
+# Cache partagé par toutes les sessions du processus : {chemin absolu: (empreinte du fichier, index)}
+_cache_index = CacheLRU(BUDGET_INDEX_MO * 1024 * 1024, taille=lambda entree: entree[1].caracteristiques.nbytes)
+_verrous_chargement = {}
+_verrou_global = threading.Lock()
+
+# Empreinte d'un fichier : change dès que le fichier est réécrit ou remplacé
+def _empreinte_fichier(fichier):
+    stat = os.stat(fichier)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def _verrou_fichier(cle):
+    with _verrou_global:
+        return _verrous_chargement.setdefault(cle, threading.Lock())
+
+# Index résident en mémoire ; rechargé si le fichier a changé sur disque
+def obtenir_index(fichier):
+    cle = os.path.abspath(fichier)
+    empreinte = _empreinte_fichier(cle)
+    entree = _cache_index.obtenir(cle)
+    if entree is not None and entree[0] == empreinte:
+        return entree[1]
+
+    # Un seul chargement à la fois par fichier, même si plusieurs sessions le demandent
+    with _verrou_fichier(cle):
+        entree = _cache_index.obtenir(cle)
+        empreinte = _empreinte_fichier(cle)
+        if entree is not None and entree[0] == empreinte:
+            return entree[1]
+        index = charger_index(cle, mmap=False)
+        _cache_index.ajouter(cle, (empreinte, index))
+        return index
+
+# Modification du budget mémoire (octets) du cache d'index
+def configurer_cache_index(budget_octets):
+    _cache_index.redimensionner(budget_octets)
+
+def vider_cache_index():
+    _cache_index.vider()
+
+def etat_cache_index():
+    return {"index": len(_cache_index), "octets": _cache_index.occupation, "budget": _cache_index.capacite}
+
+#---------------------Caches des requêtes-------------------------------
+# Streamlit réexécute la page à chaque changement de widget : une même image requête est
+# retrouvée par l'empreinte de son contenu.
+#   caractéristiques : (empreinte, méthode, rgb, profil) -> vecteur de la requête
+#   résultats : (empreinte, version de l'index, distance) -> (k calculé, [(chemin, distance)])
+
+_cache_caracteristiques = CacheLRU(CAPACITE_REQUETES)
+_cache_resultats = CacheLRU(CAPACITE_REQUETES)
+
+# Version d'un fichier d'index : change dès qu'il est réécrit ou remplacé
+def version_index(fichier):
+    cle = os.path.abspath(fichier)
+    return (cle,) + _empreinte_fichier(cle)
+
+def caracteristiques_en_cache(cle):
+    return _cache_caracteristiques.obtenir(cle)
+
+def memoriser_caracteristiques(cle, caracteristiques):
+    _cache_caracteristiques.ajouter(cle, caracteristiques)
+
+# Résultats pour k voisins ; un k inférieur à celui déjà calculé est servi par le début de la liste
+def resultats_en_cache(cle, k):
+    entree = _cache_resultats.obtenir(cle)
+    if entree is None:
+        return None
+    k_calcule, resultats = entree
+    # Moins de résultats que demandé : toute la collection a déjà été renvoyée
+    if k <= k_calcule or len(resultats) < k_calcule:
+        return resultats[:k]
+    return None
+
+def memoriser_resultats(cle, k, resultats):
+    entree = _cache_resultats.obtenir(cle)
+    if entree is None or k >= entree[0]:
+        _cache_resultats.ajouter(cle, (k, list(resultats)))
+
+# Modification du nombre d'entrées des caches de requêtes
+def configurer_caches_requetes(capacite):
+    _cache_caracteristiques.redimensionner(capacite)
+    _cache_resultats.redimensionner(capacite)
+
+def vider_caches_requetes():
+    _cache_caracteristiques.vider()
+    _cache_resultats.vider()
+
+def etat_caches_requetes():
+    return {"caracteristiques": len(_cache_caracteristiques), "resultats": len(_cache_resultats),
+            "capacite": _cache_resultats.capacite}
@@ -1,141 +1,536 @@
 import cv2
-import pandas as pd
-from skimage.feature import graycomatrix, graycoprops
-from mahotas.features import haralick
-from scipy.spatial.distance import euclidean, cityblock, chebyshev, canberra
-from BiT import bio_taxo
 import numpy as np
-from descripteurs import glcm, haralick_feat, bitdesk_feat, concat, glcm_rgb, haralick_feat_rgb, bitdesk_feat_rgb, concat_rgb
+from descripteurs import METHODES, VARIANTES, extraire_variantes, calculer_variantes, charger_image, decrire_source
+from descripteurs import resoudre_profil, nom_profil, empreinte_source
+from moteur import rechercher_top_k
+from stockage import EXTENSION, decodage_obsolete, ecrire_index_par_blocs, lire_entete, ouvrir_index
+from cache import (obtenir_index, version_index, caracteristiques_en_cache, memoriser_caracteristiques,
+                   resultats_en_cache, memoriser_resultats)
+from manifeste import chemin_manifeste, scanner_dossier, lire_manifeste, ecrire_manifeste, comparer_manifestes
+from segments import (TAILLE_SEGMENT, BlocsSegments, dossier_segments, ecrire_segment, fichiers_traites, inventaire,
+                      ouvrir_travail, supprimer_travail)
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import queue
+import threading
+import time
+from instrumentation import journal, journaliser, mesurer, incrementer, collecte, collecteur
+
+EXTENSIONS_IMAGES = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Tailles des files entre les étapes de l'extraction (chemins découverts, images décodées)
+TAILLE_FILE_FICHIERS = 1024
+TAILLE_FILE_IMAGES = 8
+
+# Calcul du descripteur choisi (lève une exception en cas d'échec)
+# (méthodes du registre descripteurs.DESCRIPTEURS, complété par enregistrer_descripteur)
+def calculer_caracteristiques(image, methode="glcm", rgb=False, profil=None):
+    if methode not in METHODES:
+        raise ValueError(f"Méthode d'extraction non reconnue: {methode}")
+    return extraire_variantes(image, [(methode, rgb)], profil)[(methode, rgb)]
 
 # Fonction pour choisir le descripteur en fonction des paramètres
-def extraire_caracteristiques(image, methode="glcm", rgb=False):
+def extraire_caracteristiques(image, methode="glcm", rgb=False, profil=None):
     try:
-        if rgb:
-            if methode == "glcm":
-                return glcm_rgb(image)
-            elif methode == "haralick":
-                return haralick_feat_rgb(image)
-            elif methode == "bit":
-                return bitdesk_feat_rgb(image)
-            elif methode == "concat":
-                return concat_rgb(image)
-        else:
-            if methode == "glcm":
-                return glcm(image)
-            elif methode == "haralick":
-                return haralick_feat(image)
-            elif methode == "bit":
-                return bitdesk_feat(image)
-            elif methode == "concat":
-                return concat(image)
+        return calculer_caracteristiques(image, methode, rgb, profil)
     except Exception as e:
-        print(f"Erreur d'extraction pour {image}: {e}")
+        journal.warning(f"Erreur d'extraction pour {decrire_source(image)}: {e}")
         return None
 
-# Extraction des signatures pour toutes les images du dossier
-def extraction_signatures(chemin_dossier, methode="glcm", rgb=False):
+# Caractéristiques de l'image requête, mémorisées d'après l'empreinte de son contenu
+# (None si la source n'a pas d'empreinte : pas de cache)
+def caracteristiques_requete(image_query, methode="glcm", rgb=False, profil=None, empreinte=None):
+    cle = (empreinte, methode, rgb, tuple(sorted(resoudre_profil(profil).items())))
+    if empreinte is not None:
+        caracs = caracteristiques_en_cache(cle)
+        if caracs is not None:
+            incrementer("cache_caracteristiques")
+            return caracs
+    caracs = extraire_caracteristiques(image_query, methode, rgb, profil)
+    if caracs is not None and empreinte is not None:
+        memoriser_caracteristiques(cle, caracs)
+    return caracs
 
-    print(f"Extraction des signatures {methode}{'_rgb' if rgb else ''} depuis {chemin_dossier}")
-    liste_carac = []
-    
-    # Déterminer le nom du fichier de sortie
-    suffix = "_rgb" if rgb else ""
-    fichier_sortie = f"Signatures{methode.capitalize()}{suffix}"
-    
+# Empreinte d'une image requête ; None si la source ne peut pas être lue (l'extraction signalera l'erreur)
+def empreinte_requete(image_query):
+    try:
+        return empreinte_source(image_query)
+    except (OSError, TypeError, ValueError):
+        return None
+
+# Images du dossier (chemins relatifs) au fil du parcours, triées pour un ordre de lignes déterministe
+def parcourir_images(chemin_dossier):
     for root, dirs, files in os.walk(chemin_dossier):
-        for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-                try:
-                    # Utiliser un chemin relatif comme dans ExtractionSignatures
-                    path_relative = os.path.relpath(os.path.join(root, file), chemin_dossier)
-                    path = os.path.join(root, file)
-                    
-                    if not os.path.exists(path):
-                        print(f"Chemin invalide : {path}")
-                        continue
-                    
-                    carac = extraire_caracteristiques(path, methode, rgb)
-                    if carac is not None:
-                        liste_carac.append(carac + [path_relative])  
-                        print(f"Signature extraite pour: {path_relative}")
-                    else:
-                        print(f"Impossible d'extraire les caractéristiques pour: {path_relative}")
-                except Exception as e:
-                    print(f"Erreur pour le fichier {file}: {e}")
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(EXTENSIONS_IMAGES):
+                yield os.path.relpath(os.path.join(root, file), chemin_dossier)
+
+def lister_images(chemin_dossier):
+    return list(parcourir_images(chemin_dossier))
+
+# Nom de base du fichier de signatures d'une variante
+def nom_fichier_signatures(methode, rgb=False):
+    suffix = "_rgb" if rgb else ""
+    return f"Signatures{methode.capitalize()}{suffix}"
+
+# Extraction pour un seul fichier (un seul décodage pour toutes les variantes) :
+# renvoie (chemin relatif, {(méthode, rgb): caractéristiques}, erreur, mesures)
+def _extraire_fichier(tache):
+    chemin_dossier, path_relative, variantes, profil = tache
+    path = os.path.join(chemin_dossier, path_relative)
+    caracs, erreur = None, None
+    with collecte() as mesures:
+        if not os.path.exists(path):
+            erreur = f"Chemin invalide : {path}"
+        else:
+            try:
+                caracs = extraire_variantes(path, variantes, profil)
+            except Exception as e:
+                erreur = str(e).strip()
+        incrementer("fichiers_traites" if caracs is not None else "fichiers_echoues")
+    return path_relative, caracs, erreur, mesures.brut()
+
+# Initialisation des processus d'extraction : un seul thread OpenCV par processus
+def _initialiser_processus():
+    cv2.setNumThreads(1)
+
+# Calcul des caractéristiques de toutes les tâches, en série ou dans un pool de processus.
+# L'ordre des résultats est toujours celui des tâches.
+def _extraire_taches(taches, n_processus=1, taille_lot=None):
+    if n_processus is None:
+        n_processus = os.cpu_count() or 1
+    if n_processus <= 1 or len(taches) <= 1:
+        resultats = map(_extraire_fichier, taches)
+        yield from _fusionner_mesures(resultats)
+        return
+
+    if taille_lot is None:
+        # Environ 8 lots par processus pour équilibrer la charge sans trop de messages
+        taille_lot = max(1, min(64, len(taches) // (n_processus * 8)))
+
+    with ProcessPoolExecutor(max_workers=n_processus, initializer=_initialiser_processus) as executor:
+        yield from _fusionner_mesures(executor.map(_extraire_fichier, taches, chunksize=taille_lot))
+
+# Report des mesures de chaque fichier (éventuellement faites dans un autre processus)
+def _fusionner_mesures(resultats):
+    for path_relative, caracs, erreur, mesures in resultats:
+        collecteur().fusionner(mesures)
+        yield path_relative, caracs, erreur
+
+# Sauvegarde d'un index de signatures (.idx + .csv) et du rapport d'échecs.
+# blocs : séquence de blocs de caractéristiques (lignes dans l'ordre des chemins), parcourue
+# une fois pour l'index et une fois pour le CSV
+def _sauvegarder_signatures(fichier_sortie, blocs, chemins, echecs, methode, rgb, profil=None):
+    # pandas n'est importé que pour écrire les CSV (pas au démarrage de l'application)
+    import pandas as pd
+    if echecs:
+        try:
+            pd.DataFrame(echecs, columns=["chemin", "erreur"]).to_csv(f'{fichier_sortie}_echecs.csv', index=False)
+            journal.warning(f"{len(echecs)} fichiers en échec, voir {fichier_sortie}_echecs.csv")
+        except Exception as e:
+            journal.error(f"Erreur lors de la création du rapport d'échecs: {e}")
     
-    if not liste_carac:
-        print("Aucune signature n'a pu être extraite!")
+    if len(chemins) == 0:
+        journal.warning("Aucune signature n'a pu être extraite!")
         return None
     
-    signatures = np.array(liste_carac, dtype=object)
-    np.save(f'{fichier_sortie}.npy', signatures)
-    print(f"Fichier de signatures créé: {fichier_sortie}.npy avec {len(signatures)} signatures")
+    dimension = next(iter(blocs)).shape[1]
+    fichier_index = ecrire_index_par_blocs(f'{fichier_sortie}{EXTENSION}', blocs, chemins, methode, rgb, dimension,
+                                           profil=resoudre_profil(profil))
+    journal.info(f"Fichier de signatures créé: {fichier_index} avec {len(chemins)} signatures (profil {nom_profil(profil)})")
     
-    # Créer aussi un CSV pour la visualisation
+    # Créer aussi un CSV pour la visualisation (caractéristiques puis chemin), bloc par bloc
     try:
-        df = pd.DataFrame(signatures)
-        df.to_csv(f'{fichier_sortie}.csv', index=False)
-        print(f"Fichier CSV créé: {fichier_sortie}.csv")
+        with open(f'{fichier_sortie}.csv', 'w', newline='', encoding='utf-8') as f:
+            debut = 0
+            for bloc in blocs:
+                df = pd.DataFrame(np.asarray(bloc))
+                df[len(df.columns)] = chemins[debut:debut + len(bloc)]
+                df.to_csv(f, index=False, header=debut == 0)
+                debut += len(bloc)
+        journal.info(f"Fichier CSV créé: {fichier_sortie}.csv")
     except Exception as e:
-        print(f"Erreur lors de la création du CSV: {e}")
+        journal.error(f"Erreur lors de la création du CSV: {e}")
     
-    return f'{fichier_sortie}.npy'
+    return fichier_index
+
+# Bilan d'une extraction : compteurs et temps cumulés par étape
+def _journaliser_bilan(message, mesures, duree):
+    instantane = mesures.instantane()
+    compteurs = instantane["compteurs"]
+    etapes = {etape: round(valeurs["total_s"], 3) for etape, valeurs in instantane["durees"].items()}
+    journaliser(logging.INFO,
+                f"{message}: {compteurs.get('fichiers_traites', 0)} fichiers traités, "
+                f"{compteurs.get('fichiers_echoues', 0)} en échec, {duree:.1f} s",
+                duree_s=round(duree, 3), compteurs=compteurs, etapes_s=etapes)
+    journal.debug("Temps cumulés par étape (s): %s", etapes)
+
+#---------------------Extraction en flux-------------------------------
+# Découverte des fichiers, décodage et calcul des descripteurs se recouvrent, reliés par des files
+# bornées ; les résultats sont écrits par segments (voir segments.py) au fil de l'eau.
 
-# Recherche d'image
+_FIN = object()
+
+class _ErreurEtape:
+    def __init__(self, exception):
+        self.exception = exception
+
+# Dépôt dans une file bornée, abandonné si l'extraction est arrêtée
+def _deposer(file, element, arret):
+    while not arret.is_set():
+        try:
+            file.put(element, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+# Eléments d'une file jusqu'à _FIN ; l'exception d'une étape précédente est relancée
+def _vider(file, arret):
+    while not arret.is_set():
+        try:
+            element = file.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if element is _FIN:
+            return
+        if isinstance(element, _ErreurEtape):
+            raise element.exception
+        yield element
+
+# Etape exécutée dans un thread : les éléments produits sont déposés dans file_sortie, suivis de _FIN
+# (ou de l'exception levée). Les mesures du thread sont ajoutées à la liste mesures.
+def _lancer_etape(etape, file_sortie, arret, mesures):
+    def executer():
+        with collecte() as locales:
+            try:
+                for element in etape():
+                    if not _deposer(file_sortie, element, arret):
+                        break
+                else:
+                    _deposer(file_sortie, _FIN, arret)
+            except BaseException as e:
+                _deposer(file_sortie, _ErreurEtape(e), arret)
+        mesures.append(locales.brut())
+    thread = threading.Thread(target=executer, daemon=True)
+    thread.start()
+    return thread
+
+# Découverte : (chemin relatif, état) des images, sauf celles déjà traitées et inchangées
+def _decouvrir(chemin_dossier, avec_hash, deja_traites):
+    for path_relative in parcourir_images(chemin_dossier):
+        etat = scanner_dossier(chemin_dossier, [path_relative], avec_hash, deja_traites).get(path_relative)
+        if etat is None:
+            continue
+        ancien = deja_traites.get(path_relative)
+        if ancien is not None and ancien[:2] == etat[:2]:
+            continue
+        yield path_relative, etat
+
+# Décodage : (chemin relatif, état, image ou None, erreur)
+def _decoder(chemin_dossier, fichiers):
+    for path_relative, etat in fichiers:
+        path = os.path.join(chemin_dossier, path_relative)
+        try:
+            yield path_relative, etat, charger_image(path), None
+        except Exception as e:
+            yield path_relative, etat, None, str(e).strip()
+
+def _extraire_lot(chemin_dossier, chemins_relatifs, variantes, profil):
+    return [_extraire_fichier((chemin_dossier, path_relative, variantes, profil)) for path_relative in chemins_relatifs]
+
+# Calcul dans un pool de processus, par lots ; au plus 2 lots en cours par processus
+def _calculer_en_parallele(fichiers, chemin_dossier, variantes, profil, n_processus, taille_lot):
+    taille_lot = taille_lot or 16
+    en_cours = deque()
+
+    def resultats(lot, futur):
+        for (path_relative, etat), (_, caracs, erreur, mesures) in zip(lot, futur.result()):
+            collecteur().fusionner(mesures)
+            yield path_relative, etat, caracs, erreur
+
+    with ProcessPoolExecutor(max_workers=n_processus, initializer=_initialiser_processus) as executor:
+        lot = []
+        for fichier in fichiers:
+            lot.append(fichier)
+            if len(lot) < taille_lot:
+                continue
+            en_cours.append((lot, executor.submit(_extraire_lot, chemin_dossier, [f[0] for f in lot], variantes, profil)))
+            lot = []
+            if len(en_cours) >= 2 * n_processus:
+                yield from resultats(*en_cours.popleft())
+        if lot:
+            en_cours.append((lot, executor.submit(_extraire_lot, chemin_dossier, [f[0] for f in lot], variantes, profil)))
+        while en_cours:
+            yield from resultats(*en_cours.popleft())
+
+# Résultats de l'extraction dans l'ordre de découverte : (chemin relatif, état, caractéristiques ou None, erreur)
+def _flux_extraction(chemin_dossier, variantes, profil, avec_hash, deja_traites, n_processus, taille_lot):
+    arret = threading.Event()
+    mesures = []
+    fichiers = queue.Queue(TAILLE_FILE_FICHIERS)
+    threads = [_lancer_etape(lambda: _decouvrir(chemin_dossier, avec_hash, deja_traites), fichiers, arret, mesures)]
+    try:
+        if n_processus > 1:
+            yield from _calculer_en_parallele(_vider(fichiers, arret), chemin_dossier, variantes, profil,
+                                              n_processus, taille_lot)
+            return
+
+        # En série, le décodage (qui libère le GIL) se fait dans un thread pendant le calcul
+        images = queue.Queue(TAILLE_FILE_IMAGES)
+        threads.append(_lancer_etape(lambda: _decoder(chemin_dossier, _vider(fichiers, arret)), images, arret, mesures))
+        for path_relative, etat, data, erreur in _vider(images, arret):
+            caracs = None
+            if data is not None:
+                try:
+                    caracs = calculer_variantes(data, variantes, profil)
+                except Exception as e:
+                    erreur = str(e).strip()
+            incrementer("fichiers_traites" if caracs is not None else "fichiers_echoues")
+            yield path_relative, etat, caracs, erreur
+    finally:
+        arret.set()
+        for thread in threads:
+            thread.join()
+        for brut in mesures:
+            collecteur().fusionner(brut)
+
+# Extraction de plusieurs variantes d'index en une seule passe sur le dossier
+# (chaque image est décodée une seule fois). Renvoie {(méthode, rgb): fichier .idx ou None}
+# profil : nom d'un profil de descripteurs.PROFILS ou dictionnaire {cote_max, niveaux}
+# Les résultats sont écrits par segments de taille_segment images ; avec reprendre, une extraction
+# interrompue reprend après le dernier segment terminé.
+# progression : fonction appelée avec (images traitées, total) au fil de l'extraction
+def extraction_signatures_multiples(chemin_dossier, variantes=VARIANTES, n_processus=1, taille_lot=None, avec_hash=False,
+                                    profil=None, taille_segment=TAILLE_SEGMENT, reprendre=True, progression=None):
+    debut = time.perf_counter()
+    with collecte(fusion=True) as mesures:
+        fichiers = _extraction_multiples(chemin_dossier, variantes, n_processus, taille_lot, avec_hash, profil,
+                                         taille_segment, reprendre, progression)
+    _journaliser_bilan("Extraction terminée", mesures, time.perf_counter() - debut)
+    return fichiers
+
+def _extraction_multiples(chemin_dossier, variantes, n_processus, taille_lot, avec_hash, profil, taille_segment, reprendre,
+                          progression=None):
+    variantes = tuple(variantes)
+    for methode, _ in variantes:
+        if methode not in METHODES:
+            raise ValueError(f"Méthode d'extraction non reconnue: {methode}")
+    profil = resoudre_profil(profil)
+    if n_processus is None:
+        n_processus = os.cpu_count() or 1
+    
+    # Dossier de travail de l'extraction ; reprise si les paramètres sont identiques
+    dossier = dossier_segments(nom_fichier_signatures(*variantes[0]) if len(variantes) == 1 else "Signatures")
+    parametres = {
+        "dossier": os.path.abspath(chemin_dossier),
+        "variantes": [[methode, bool(rgb)] for methode, rgb in variantes],
+        "profil": profil,
+        "avec_hash": bool(avec_hash),
+    }
+    segments = ouvrir_travail(dossier, parametres, reprendre)
+    deja_traites = fichiers_traites(segments)
+    if segments:
+        journal.info(f"Reprise de l'extraction: {len(deja_traites)} fichiers déjà traités dans {len(segments)} segments")
+    # Le total n'est compté (parcours du dossier sans lecture des images) que si la progression est suivie
+    total = sum(1 for _ in parcourir_images(chemin_dossier)) if progression else None
+    faits = len(deja_traites)
+    if progression:
+        progression(faits, total)
+    
+    en_attente = []
+    for resultat in _flux_extraction(chemin_dossier, variantes, profil, avec_hash, deja_traites, n_processus, taille_lot):
+        path_relative, _, caracs, erreur = resultat
+        faits += 1
+        if progression:
+            progression(faits, total)
+        if caracs is not None:
+            journal.debug("Signature extraite pour: %s", path_relative)
+        else:
+            journal.warning(f"Impossible d'extraire les caractéristiques pour: {path_relative} ({erreur})")
+        en_attente.append(resultat)
+        if len(en_attente) >= taille_segment:
+            segments.append(ecrire_segment(dossier, len(segments), en_attente, variantes))
+            en_attente = []
+    if en_attente:
+        segments.append(ecrire_segment(dossier, len(segments), en_attente, variantes))
+    
+    # Assemblage : les index ne sont remplacés qu'une fois tous les segments terminés. Après une reprise,
+    # les segments antérieurs peuvent contenir des images supprimées depuis : seules celles encore
+    # présentes sont conservées
+    presents = set(parcourir_images(chemin_dossier)) if deja_traites else None
+    chemins, entrees, echecs, masques = inventaire(segments, presents)
+    fichiers = {}
+    for variante in variantes:
+        fichier_sortie = nom_fichier_signatures(*variante)
+        blocs = BlocsSegments(segments, masques, variante)
+        fichiers[variante] = _sauvegarder_signatures(fichier_sortie, blocs, chemins, echecs, *variante, profil)
+        if fichiers[variante]:
+            ecrire_manifeste(chemin_manifeste(fichier_sortie), entrees)
+    supprimer_travail(dossier)
+    return fichiers
+
+# Mise à jour incrémentale d'un index à partir de son manifeste : seules les images nouvelles
+# ou modifiées sont extraites, les lignes des images supprimées sont retirées.
+# Sans profil, celui de l'index est conservé ; un profil différent entraîne une reconstruction complète.
+def mise_a_jour_signatures(chemin_dossier, methode="glcm", rgb=False, avec_hash=False, n_processus=1, taille_lot=None,
+                           profil=None, progression=None):
+    debut = time.perf_counter()
+    with collecte(fusion=True) as mesures:
+        fichier = _mise_a_jour(chemin_dossier, methode, rgb, avec_hash, n_processus, taille_lot, profil, progression)
+    _journaliser_bilan("Mise à jour terminée", mesures, time.perf_counter() - debut)
+    return fichier
+
+def _mise_a_jour(chemin_dossier, methode, rgb, avec_hash, n_processus, taille_lot, profil, progression=None):
+    fichier_sortie = nom_fichier_signatures(methode, rgb)
+    fichier_index = f'{fichier_sortie}{EXTENSION}'
+    fichier_manifeste = chemin_manifeste(fichier_sortie)
+    
+    if not (os.path.exists(fichier_index) and os.path.exists(fichier_manifeste)):
+        journal.info(f"Index ou manifeste absent pour {fichier_sortie}, reconstruction complète")
+        return extraction_signatures(chemin_dossier, methode, rgb, n_processus, taille_lot, avec_hash, profil,
+                                     progression=progression)
+    
+    entete = lire_entete(fichier_index)[0]
+    if decodage_obsolete(entete):
+        journal.info(f"{fichier_sortie} converti d'un ancien .npy en niveaux de gris, reconstruction complète")
+        return extraction_signatures(chemin_dossier, methode, rgb, n_processus, taille_lot, avec_hash, profil,
+                                     progression=progression)
+    
+    profil_index = resoudre_profil(entete.get("profil"))
+    if profil is not None and resoudre_profil(profil) != profil_index:
+        journal.info(f"Profil de {fichier_sortie} modifié ({nom_profil(profil_index)} -> {nom_profil(profil)}), reconstruction complète")
+        return extraction_signatures(chemin_dossier, methode, rgb, n_processus, taille_lot, avec_hash, profil,
+                                     progression=progression)
+    
+    ancien = lire_manifeste(fichier_manifeste)
+    actuel = scanner_dossier(chemin_dossier, lister_images(chemin_dossier), avec_hash, ancien)
+    nouveaux, modifies, supprimes = comparer_manifestes(ancien, actuel)
+    journal.info(f"Mise à jour de {fichier_sortie}: {len(nouveaux)} nouvelles, {len(modifies)} modifiées, {len(supprimes)} supprimées")
+    
+    if not (nouveaux or modifies or supprimes):
+        # Les dates ou hashs ont pu changer sans modifier le contenu
+        if actuel != ancien:
+            ecrire_manifeste(fichier_manifeste, actuel)
+        return fichier_index
+    
+    index = ouvrir_index(fichier_index)
+    retires = set(modifies) | set(supprimes)
+    masque = np.array([path_relative not in retires for path_relative in index.chemins], dtype=bool)
+    chemins = [path_relative for path_relative, garde in zip(index.chemins, masque) if garde]
+    caracteristiques = [np.asarray(index.caracteristiques[masque])]
+    entrees = {path_relative: actuel[path_relative] for path_relative in chemins if path_relative in actuel}
+    
+    nouvelles_carac = []
+    echecs = []
+    variante = (methode, rgb)
+    taches = [(chemin_dossier, path_relative, (variante,), profil_index) for path_relative in nouveaux + modifies]
+    if progression:
+        progression(0, len(taches))
+    for faits, (path_relative, caracs, erreur) in enumerate(_extraire_taches(taches, n_processus, taille_lot), 1):
+        if progression:
+            progression(faits, len(taches))
+        if caracs is not None:
+            nouvelles_carac.append(caracs[variante])
+            chemins.append(path_relative)
+            entrees[path_relative] = actuel[path_relative]
+            journal.debug("Signature extraite pour: %s", path_relative)
+        else:
+            echecs.append((path_relative, erreur))
+            journal.warning(f"Impossible d'extraire les caractéristiques pour: {path_relative} ({erreur})")
+    
+    if nouvelles_carac:
+        caracteristiques.append(np.asarray(nouvelles_carac, dtype=np.float32))
+    caracteristiques = np.concatenate(caracteristiques)
+    # Libérer la projection mémoire avant de remplacer le fichier
+    del index
+    
+    # Le CSV est régénéré depuis la matrice fusionnée : il reste identique à celui d'une extraction complète
+    fichier = _sauvegarder_signatures(fichier_sortie, [caracteristiques], chemins, echecs, methode, rgb, profil_index)
+    if fichier:
+        ecrire_manifeste(fichier_manifeste, entrees)
+    return fichier
+
+# Extraction des signatures pour toutes les images du dossier
+def extraction_signatures(chemin_dossier, methode="glcm", rgb=False, n_processus=1, taille_lot=None, avec_hash=False,
+                          profil=None, taille_segment=TAILLE_SEGMENT, reprendre=True, progression=None):
+
+    journal.info(f"Extraction des signatures {methode}{'_rgb' if rgb else ''} depuis {chemin_dossier}")
+    fichiers = extraction_signatures_multiples(chemin_dossier, [(methode, rgb)], n_processus, taille_lot, avec_hash, profil,
+                                               taille_segment, reprendre, progression)
+    return fichiers[(methode, rgb)]
+
+# Recherche d'image ; image_query peut être un chemin, un tableau décodé ou le contenu du fichier (bytes)
 def rechercher_image(image_query, fichier_signatures, distance="euclidienne", k=5):
+    debut = time.perf_counter()
+    with collecte(fusion=True) as mesures:
+        incrementer("requetes")
+        resultats = _rechercher_image(image_query, fichier_signatures, distance, k)
+    if journal.isEnabledFor(logging.DEBUG):
+        etapes = {etape: round(valeurs["total_s"] * 1000, 3) for etape, valeurs in mesures.instantane()["durees"].items()}
+        journaliser(logging.DEBUG, f"Requête traitée en {(time.perf_counter() - debut) * 1000:.1f} ms: {etapes}",
+                    distance=distance, k=k, resultats=len(resultats), etapes_ms=etapes)
+    return resultats
 
+def _rechercher_image(image_query, fichier_signatures, distance, k):
+
+    # Même image, même index (inchangé sur disque) et même distance : résultats mémorisés
     try:
-        signatures = np.load(fichier_signatures, allow_pickle=True)
-        print(f"Fichier de signatures chargé: {fichier_signatures} avec {len(signatures)} signatures")
+        cle_resultats = (empreinte_requete(image_query), version_index(fichier_signatures), distance)
+    except OSError as e:
+        journal.error(f"Erreur lors du chargement des signatures: {e}")
+        return []
+    if cle_resultats[0] is not None:
+        resultats = resultats_en_cache(cle_resultats, k)
+        if resultats is not None:
+            incrementer("cache_resultats")
+            return resultats
+
+    try:
+        with mesurer("chargement_index"):
+            index = obtenir_index(fichier_signatures)
+        journal.debug("Fichier de signatures chargé: %s avec %d signatures", fichier_signatures, len(index))
     except Exception as e:
-        print(f"Erreur lors du chargement des signatures: {e}")
+        journal.error(f"Erreur lors du chargement des signatures: {e}")
         return []
     
-    # Déterminer quelle méthode et RGB/non-RGB a été utilisée
-    methode = "glcm"
-    rgb = False
-    
-    if "Haralick" in fichier_signatures:
-        methode = "haralick"
-    elif "Bit" in fichier_signatures:
-        methode = "bit"
-    elif "Concat" in fichier_signatures:
-        methode = "concat"
+    # Méthode, RGB/non-RGB et profil d'extraction enregistrés dans l'en-tête de l'index
+    methode = index.methode
+    rgb = index.rgb
     
-    if "rgb" in fichier_signatures.lower():
-        rgb = True
-    
-    print(f"Utilisation de la méthode: {methode}, RGB: {rgb}")
+    journal.debug("Utilisation de la méthode: %s, RGB: %s, profil: %s", methode, rgb, nom_profil(index.profil))
     
     # Extraire les caractéristiques de l'image requête
-    query_features = extraire_caracteristiques(image_query, methode, rgb)
+    with mesurer("extraction_requete"):
+        query_features = caracteristiques_requete(image_query, methode, rgb, index.profil, cle_resultats[0])
     if query_features is None:
-        print(f"Impossible d'extraire les caractéristiques de l'image requête: {image_query}")
+        journal.warning(f"Impossible d'extraire les caractéristiques de l'image requête: {decrire_source(image_query)}")
         return []
     
-    resultats = []
-    
-    for signature in signatures:
-        try:
-            features = signature[:-1]  
-            chemin_image = signature[-1]  
-            
-            if len(query_features) != len(features):
-                print(f"Incompatibilité de dimensions: Query={len(query_features)}, Stockée={len(features)}")
-                continue
-            
-            dist = calculer_distance(query_features, features, methode=distance)
-            resultats.append((chemin_image, dist))
-        except Exception as e:
-            print(f"Erreur lors de la comparaison avec {chemin_image if 'chemin_image' in locals() else 'une image'}: {e}")
+    if len(index) == 0:
+        journal.warning("Aucune signature dans le fichier")
+        return []
     
-    resultats.sort(key=lambda x: x[1])  
-    print(f"{len(resultats)} résultats trouvés, retour des {min(k, len(resultats))} premiers")
-    return resultats[:k]  
+    if len(query_features) != index.dimension:
+        journal.warning(f"Incompatibilité de dimensions: Query={len(query_features)}, Stockée={index.dimension}")
+        return []
+
+    try:
+        resultats = rechercher_top_k(query_features, index.caracteristiques, index.chemins, distance, k)
+    except ValueError as e:
+        journal.error(f"Erreur lors de la comparaison: {e}")
+        return []
+    if cle_resultats[0] is not None:
+        memoriser_resultats(cle_resultats, k, resultats)
+    journal.debug("%d résultats trouvés, retour des %d premiers", len(index), len(resultats))
+    return resultats
 
 # Calcul des distances
 def calculer_distance(feature1, feature2, methode="euclidienne"):
+    from scipy.spatial.distance import euclidean, cityblock, chebyshev, canberra
 
     if methode == "euclidienne":
         return euclidean(feature1, feature2)
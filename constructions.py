@@ -0,0 +1,136 @@
+import threading
+import time
+from instrumentation import journal
+
+# Constructions d'index en arrière-plan : la page lance la construction et continue de servir
+# l'index précédent (remplacé de façon atomique à la fin), au lieu de bloquer la session.
+# Une seule construction par clé : les demandes simultanées pour le même index la partagent.
+
+class Construction:
+    def __init__(self, cle, total=None):
+        self.cle = cle
+        self.etat = "en_attente"
+        self.total = total
+        self.faits = 0
+        self.resultat = None
+        self.erreur = None
+        self.debut = None
+        self.fin = None
+        self._verrou = threading.Lock()
+        # Point de départ de l'estimation du débit (faits déjà acquis lors d'une reprise)
+        self._reference = None
+
+    # Appelée par la tâche : nombre d'éléments traités (et total s'il est connu)
+    def progression(self, faits, total=None):
+        with self._verrou:
+            maintenant = time.perf_counter()
+            if self._reference is None:
+                self._reference = (maintenant, faits)
+            self.faits = faits
+            if total is not None:
+                self.total = total
+
+    @property
+    def terminee(self):
+        return self.etat in ("terminee", "echec")
+
+    # Etat affichable : faits / total, fraction, durée écoulée et temps restant estimé
+    def instantane(self):
+        with self._verrou:
+            maintenant = time.perf_counter()
+            ecoule = (self.fin or maintenant) - self.debut if self.debut else 0.0
+            fraction = min(1.0, self.faits / self.total) if self.total else None
+            restant = None
+            if self.etat == "en_cours" and self.total and self._reference is not None:
+                instant, faits_initiaux = self._reference
+                debit = (self.faits - faits_initiaux) / max(maintenant - instant, 1e-9)
+                if debit > 0:
+                    restant = max(0, self.total - self.faits) / debit
+            return {
+                "cle": self.cle,
+                "etat": self.etat,
+                "faits": self.faits,
+                "total": self.total,
+                "fraction": fraction,
+                "ecoule_s": ecoule,
+                "restant_s": restant,
+                "erreur": self.erreur,
+            }
+
+class GestionnaireConstructions:
+    def __init__(self, max_simultanees=1):
+        self._verrou = threading.Lock()
+        self._constructions = {}
+        # Limite le nombre de constructions exécutées en même temps (les autres attendent)
+        self._places = threading.Semaphore(max_simultanees)
+
+    # Lancement de tache(progression) dans un thread, sauf si une construction de même clé est en cours :
+    # la construction existante est alors renvoyée
+    def lancer(self, cle, tache, total=None):
+        with self._verrou:
+            construction = self._constructions.get(cle)
+            if construction is not None and not construction.terminee:
+                return construction
+            construction = Construction(cle, total)
+            self._constructions[cle] = construction
+        thread = threading.Thread(target=self._executer, args=(construction, tache), daemon=True,
+                                  name=f"construction-{cle}")
+        thread.start()
+        return construction
+
+    def _executer(self, construction, tache):
+        with self._places:
+            construction.debut = time.perf_counter()
+            construction.etat = "en_cours"
+            try:
+                construction.resultat = tache(construction.progression)
+                construction.etat = "terminee"
+                journal.info(f"Construction {construction.cle} terminée")
+            except Exception as e:
+                construction.erreur = str(e)
+                construction.etat = "echec"
+                journal.error(f"Échec de la construction {construction.cle}: {e}")
+            finally:
+                construction.fin = time.perf_counter()
+
+    # Construction de clé donnée (la dernière lancée), ou None
+    def construction(self, cle):
+        with self._verrou:
+            return self._constructions.get(cle)
+
+    def en_cours(self):
+        with self._verrou:
+            return [construction for construction in self._constructions.values() if not construction.terminee]
+
+    # Attente de la fin d'une construction (tests, scripts) ; renvoie son résultat
+    def attendre(self, cle, delai=None, intervalle=0.1):
+        limite = None if delai is None else time.perf_counter() + delai
+        while True:
+            construction = self.construction(cle)
+            if construction is None or construction.terminee:
+                return construction.resultat if construction else None
+            if limite is not None and time.perf_counter() > limite:
+                raise TimeoutError(f"Construction {cle} non terminée")
+            time.sleep(intervalle)
+
+_gestionnaire = None
+_verrou_gestionnaire = threading.Lock()
+
+# Gestionnaire partagé par toutes les sessions du processus
+def obtenir_gestionnaire():
+    global _gestionnaire
+    with _verrou_gestionnaire:
+        if _gestionnaire is None:
+            _gestionnaire = GestionnaireConstructions()
+        return _gestionnaire
+
+# Temps lisible (secondes -> « 1 min 05 s »)
+def formater_duree(secondes):
+    if secondes is None:
+        return "?"
+    secondes = int(round(secondes))
+    if secondes < 60:
+        return f"{secondes} s"
+    if secondes < 3600:
+        return f"{secondes // 60} min {secondes % 60:02d} s"
+    return f"{secondes // 3600} h {secondes % 3600 // 60:02d} min"
@@ -1,12 +1,68 @@
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from utils import create_directory_if_not_exists
 
-def creer_base_donnees():
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
-       
-        cursor.execute('''
+CHEMIN_BASE = 'users.db'
+
+# Requêtes utilisées par l'application : le texte constant permet au module sqlite3
+# de réutiliser l'instruction préparée (cache par connexion)
+REQ_INSERER_UTILISATEUR = '''INSERT INTO utilisateurs (nom_utilisateur, email, mot_de_passe, descripteur_facial)
+                          VALUES (?, ?, ?, ?)'''
+REQ_VERIFIER_IDENTIFIANTS = 'SELECT 1 FROM utilisateurs WHERE email = ? AND mot_de_passe = ?'
+REQ_ENCODAGES_DEPUIS = 'SELECT id, email, descripteur_facial FROM utilisateurs WHERE id > ? ORDER BY id'
+REQ_LISTER_UTILISATEURS = 'SELECT nom_utilisateur, email, descripteur_facial FROM utilisateurs'
+
+# Connexions réutilisées d'un appel à l'autre : chaque appel emprunte une connexion libre et la rend
+# ensuite. Le pool n'est pas lié aux threads (Streamlit crée un thread par réexécution de page) et
+# garde au plus CONNEXIONS_LIBRES_MAX connexions ouvertes par base ; les autres sont fermées au retour
+CONNEXIONS_LIBRES_MAX = int(os.environ.get("CBIR_DB_CONNEXIONS", "4"))
+
+_connexions_libres = {}
+_verrou_connexions = threading.Lock()
+
+def _ouvrir_connexion(chemin_base):
+    # check_same_thread=False : une connexion rendue au pool peut être reprise par un autre thread
+    # (jamais par deux à la fois)
+    conn = sqlite3.connect(chemin_base, timeout=30, cached_statements=128, check_same_thread=False)
+    # WAL : les lectures (connexions) ne sont plus bloquées par une écriture (inscription)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+@contextmanager
+def obtenir_connexion(chemin_base=CHEMIN_BASE):
+    with _verrou_connexions:
+        libres = _connexions_libres.get(chemin_base)
+        conn = libres.pop() if libres else None
+    if conn is None:
+        conn = _ouvrir_connexion(chemin_base)
+    try:
+        yield conn
+    finally:
+        # Transaction laissée ouverte par une erreur : annulée avant de rendre la connexion
+        if conn.in_transaction:
+            conn.rollback()
+        with _verrou_connexions:
+            libres = _connexions_libres.setdefault(chemin_base, [])
+            if len(libres) < CONNEXIONS_LIBRES_MAX:
+                libres.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+# Fermeture des connexions libres d'une base (fin d'application, tests)
+def fermer_connexions(chemin_base=CHEMIN_BASE):
+    with _verrou_connexions:
+        libres = _connexions_libres.pop(chemin_base, [])
+    for conn in libres:
+        conn.close()
+
+def creer_base_donnees(chemin_base=CHEMIN_BASE):
+    with obtenir_connexion(chemin_base) as conn, conn:
+        conn.execute('''
         CREATE TABLE IF NOT EXISTS utilisateurs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nom_utilisateur TEXT UNIQUE,
@@ -16,14 +72,56 @@ def creer_base_donnees():
             date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
-        
-        conn.commit()
-        conn.close()
+
+# Message d'erreur pour une violation de contrainte d'unicité
+def _message_doublon(erreur):
+    if 'email' in str(erreur):
+        return "Cet email est déjà utilisé"
+    if 'nom_utilisateur' in str(erreur):
+        return "Ce nom d'utilisateur est déjà utilisé"
+    return str(erreur)
+
+# Insertion d'un utilisateur ; l'unicité est vérifiée par la base (pas de SELECT préalable).
+# Renvoie l'identifiant de la nouvelle ligne
+def inserer_utilisateur(nom_utilisateur, email, mot_de_passe_hash, descripteur, chemin_base=CHEMIN_BASE):
+    try:
+        with obtenir_connexion(chemin_base) as conn, conn:
+            cursor = conn.execute(REQ_INSERER_UTILISATEUR, (nom_utilisateur, email, mot_de_passe_hash, descripteur))
+    except sqlite3.IntegrityError as e:
+        raise ValueError(_message_doublon(e))
+    return cursor.lastrowid
+
+# Insertion de plusieurs utilisateurs dans une seule transaction.
+# lignes : (nom_utilisateur, email, mot_de_passe_hash, descripteur) ; les doublons sont rejetés sans
+# annuler le lot. Renvoie (insérés [(position dans lignes, id, email)], rejetés [(email, raison)])
+def inserer_utilisateurs_par_lot(lignes, chemin_base=CHEMIN_BASE):
+    inseres, rejetes = [], []
+    with obtenir_connexion(chemin_base) as conn, conn:
+        for position, ligne in enumerate(lignes):
+            try:
+                cursor = conn.execute(REQ_INSERER_UTILISATEUR, ligne)
+                inseres.append((position, cursor.lastrowid, ligne[1]))
+            except sqlite3.IntegrityError as e:
+                rejetes.append((ligne[1], _message_doublon(e)))
+    return inseres, rejetes
+
+def verifier_identifiants(email, mot_de_passe_hash, chemin_base=CHEMIN_BASE):
+    with obtenir_connexion(chemin_base) as conn:
+        return conn.execute(REQ_VERIFIER_IDENTIFIANTS, (email, mot_de_passe_hash)).fetchone() is not None
+
+# Encodages faciaux des utilisateurs d'identifiant supérieur à dernier_id
+def lire_encodages_depuis(dernier_id, chemin_base=CHEMIN_BASE):
+    with obtenir_connexion(chemin_base) as conn:
+        return conn.execute(REQ_ENCODAGES_DEPUIS, (dernier_id,)).fetchall()
+
+def lister_utilisateurs(chemin_base=CHEMIN_BASE):
+    with obtenir_connexion(chemin_base) as conn:
+        return conn.execute(REQ_LISTER_UTILISATEURS).fetchall()
 
 def verifier_structure_projet():
     dataset_path = create_directory_if_not_exists("./dataSet")
-    
+
     if not os.listdir(dataset_path):
         print("Attention: Le dossier dataSet est vide. Veuillez y ajouter des images pour la recherche.")
-    
-    return True
\ No newline at end of file
+
+    return True
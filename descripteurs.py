@@ -1,83 +1,292 @@
-from skimage.feature import graycomatrix, graycoprops
-from mahotas.features import haralick
-from BiT import bio_taxo
+from functools import lru_cache
+import hashlib
+import importlib
 import cv2
 import numpy as np
- 
-def glcm(chemin):
-    data = cv2.imread(chemin, 0)
-    co_matrice = graycomatrix(data, [1], [0], None, symmetric=False, normed=False)
-    contrast = float(graycoprops(co_matrice, 'contrast')[0, 0])
-    dissimilarity = float(graycoprops(co_matrice, 'dissimilarity')[0, 0])
-    correlation = float(graycoprops(co_matrice, 'correlation')[0, 0])
-    homogeneity = float(graycoprops(co_matrice, 'homogeneity')[0, 0])
-    ASM = float(graycoprops(co_matrice, 'ASM')[0, 0])
-    energy = float(graycoprops(co_matrice, 'energy')[0, 0])
-    return [contrast, dissimilarity, correlation, homogeneity, ASM, energy]
- 
- 
-def haralick_feat(chemin):
-    data = cv2.imread(chemin, 0)
-    features = haralick(data).mean(0).tolist()
-    features = [float(x) for x in features]
-    return features
- 
-def bitdesk_feat(chemin):
-    data = cv2.imread(chemin, 0)
-    features = bio_taxo(data)
-    features = [float(x) for x in features]
-    return features
- 
+import os
+from instrumentation import mesurer
+
+PROPRIETES_GLCM = ['contrast', 'dissimilarity', 'correlation', 'homogeneity', 'ASM', 'energy']
+
+# Méthodes d'extraction et variantes d'index (méthode, rgb), complétées par enregistrer_descripteur
+METHODES = []
+VARIANTES = []
+
+# Profils d'extraction : réduction de l'image (plus grand côté en pixels, None = taille d'origine)
+# et du nombre de niveaux de gris avant le calcul des descripteurs. Le profil est enregistré dans
+# l'en-tête de l'index, et les requêtes sont extraites avec le profil de l'index interrogé.
+PROFILS = {
+    'complet': {'cote_max': None, 'niveaux': 256},
+    'equilibre': {'cote_max': 512, 'niveaux': 64},
+    'rapide': {'cote_max': 256, 'niveaux': 32},
+}
+PROFIL_DEFAUT = 'complet'
+
+# Profil sous forme de dictionnaire à partir d'un nom, d'un dictionnaire ou de None (profil par défaut)
+def resoudre_profil(profil=None):
+    if profil is None:
+        profil = PROFIL_DEFAUT
+    if isinstance(profil, str):
+        if profil not in PROFILS:
+            raise ValueError(f"Profil d'extraction inconnu: {profil}")
+        return dict(PROFILS[profil])
+    cote_max = profil.get('cote_max')
+    niveaux = int(profil.get('niveaux', 256))
+    if not 2 <= niveaux <= 256:
+        raise ValueError(f"Nombre de niveaux de gris invalide: {niveaux}")
+    if cote_max is not None and int(cote_max) < 1:
+        raise ValueError(f"Côté maximal invalide: {cote_max}")
+    return {'cote_max': int(cote_max) if cote_max is not None else None, 'niveaux': niveaux}
+
+# Nom du profil s'il fait partie des profils prédéfinis, sinon sa description
+def nom_profil(profil=None):
+    profil = resoudre_profil(profil)
+    for nom, valeurs in PROFILS.items():
+        if valeurs == profil:
+            return nom
+    return f"cote_max={profil['cote_max']}, niveaux={profil['niveaux']}"
+
+# Décodage unique de l'image (BGR). La source peut être un chemin, un tableau déjà décodé
+# (BGR ou niveaux de gris, comme renvoyé par OpenCV) ou le contenu encodé du fichier (bytes)
+def charger_image(source):
+    if isinstance(source, np.ndarray):
+        if source.ndim == 2:
+            return cv2.cvtColor(source, cv2.COLOR_GRAY2BGR)
+        if source.ndim == 3 and source.shape[2] == 4:
+            return cv2.cvtColor(source, cv2.COLOR_BGRA2BGR)
+        if source.ndim == 3 and source.shape[2] == 3:
+            return source
+        raise ValueError(f"Image de forme non supportée: {source.shape}")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with mesurer('decodage'):
+            data = cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+        if data is None:
+            raise ValueError("Impossible de décoder l'image")
+        return data
+    with mesurer('decodage'):
+        data = cv2.imread(os.fspath(source))
+    if data is None:
+        raise ValueError(f"Impossible de lire l'image: {source}")
+    return data
+
+# Description courte d'une source d'image pour les messages
+def decrire_source(source):
+    if isinstance(source, np.ndarray):
+        return f"image en mémoire {source.shape}"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"image en mémoire ({len(source)} octets)"
+    return str(source)
+
+# Réduction de l'image pour que son plus grand côté ne dépasse pas cote_max (moyenne par zone)
+def reduire_image(data, cote_max=None):
+    if cote_max is None or max(data.shape[:2]) <= cote_max:
+        return data
+    echelle = cote_max / max(data.shape[:2])
+    taille = (max(1, round(data.shape[1] * echelle)), max(1, round(data.shape[0] * echelle)))
+    return cv2.resize(data, taille, interpolation=cv2.INTER_AREA)
+
+# Réduction à `niveaux` niveaux de gris (valeurs 0..niveaux-1) par table de correspondance
+def quantifier(canal, niveaux=256):
+    if niveaux == 256:
+        return canal
+    table = (np.arange(256) * niveaux // 256).astype(np.uint8)
+    return table[canal]
+
+# Empreinte du contenu d'une source d'image (clé des caches de requêtes)
+def empreinte_source(source):
+    empreinte = hashlib.blake2b(digest_size=16)
+    if isinstance(source, np.ndarray):
+        empreinte.update(f"{source.shape}{source.dtype}".encode())
+        empreinte.update(np.ascontiguousarray(source).data)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        empreinte.update(source)
+    else:
+        with open(os.fspath(source), "rb") as f:
+            for bloc in iter(lambda: f.read(1 << 20), b""):
+                empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+# Plans partagés entre les descripteurs : niveaux de gris et/ou canaux R, G, B
+# ('rgb_pile' : les trois canaux dans un seul tableau hauteur x largeur x 3)
+def preparer_plans(data, gris=True, rgb=True, niveaux=256):
+    plans = {}
+    if gris:
+        plans['gris'] = quantifier(cv2.cvtColor(data, cv2.COLOR_BGR2GRAY), niveaux)
+    if rgb:
+        img_rgb = quantifier(cv2.cvtColor(data, cv2.COLOR_BGR2RGB), niveaux)
+        plans['rgb_pile'] = img_rgb
+        plans['rgb'] = [img_rgb[:, :, i] for i in range(3)]
+    return plans
+
+#---------------------GLCM-------------------------------
+# Matrice de co-occurrence (distance 1, angle 0, non symétrique) et propriétés de graycoprops
+# (skimage), calculées pour tous les canaux en une passe
+
+# Pondérations des propriétés pour une matrice niveaux x niveaux : contraste, dissimilarité, homogénéité
+@lru_cache(maxsize=8)
+def _poids_glcm(niveaux):
+    i, j = np.ogrid[0:niveaux, 0:niveaux]
+    ecart = (i - j).astype(np.float64)
+    return np.stack([ecart ** 2, np.abs(ecart), 1.0 / (1.0 + ecart ** 2)]).reshape(3, -1)
+
+# Matrices de co-occurrence normalisées (canaux x niveaux x niveaux) d'une image hauteur x largeur x canaux :
+# histogramme 2D des paires (pixel, voisin de droite) de chaque canal, accumulé par cv2.calcHist
+# sur deux vues décalées de l'image (sans copie ni tableau de codes intermédiaire)
+def cooccurrences(canaux, niveaux=256):
+    n_canaux = canaux.shape[2]
+    gauche, droite = canaux[:, :-1], canaux[:, 1:]
+    comptes = np.stack([
+        cv2.calcHist([gauche, droite], [c, n_canaux + c], None, [niveaux, niveaux], [0, niveaux, 0, niveaux])
+        for c in range(n_canaux)
+    ]).astype(np.float64)
+    totaux = comptes.sum(axis=(1, 2), keepdims=True)
+    totaux[totaux == 0] = 1
+    return comptes / totaux
+
+# Propriétés GLCM (ordre de PROPRIETES_GLCM) de chaque canal, concaténées canal par canal
+def glcm_canaux(canaux, niveaux=256):
+    if canaux.ndim == 2:
+        canaux = canaux[:, :, None]
+    P = cooccurrences(canaux, niveaux)
+    plat = P.reshape(len(P), -1)
+    contraste, dissimilarite, homogeneite = (plat @ _poids_glcm(niveaux).T).T
+    asm = np.einsum('ij,ij->i', plat, plat)
+
+    # Corrélation à partir des distributions marginales (lignes i, colonnes j)
+    valeurs = np.arange(niveaux, dtype=np.float64)
+    marge_i, marge_j = P.sum(axis=2), P.sum(axis=1)
+    ecart_i = valeurs - (marge_i @ valeurs)[:, None]
+    ecart_j = valeurs - (marge_j @ valeurs)[:, None]
+    std_i = np.sqrt(np.einsum('ci,ci->c', marge_i, ecart_i ** 2))
+    std_j = np.sqrt(np.einsum('cj,cj->c', marge_j, ecart_j ** 2))
+    covariance = np.einsum('cij,ci,cj->c', P, ecart_i, ecart_j)
+    # Ecart-type quasi nul (image uniforme) : corrélation 1, comme graycoprops
+    constant = (std_i < 1e-15) | (std_j < 1e-15)
+    correlation = np.where(constant, 1.0, covariance / np.where(constant, 1.0, std_i * std_j))
+
+    proprietes = np.stack([contraste, dissimilarite, correlation, homogeneite, asm, np.sqrt(asm)], axis=1)
+    return [float(x) for x in proprietes.ravel()]
+
+#---------------------Descripteurs sur un plan-------------------------------
+# niveaux : nombre de niveaux de gris du plan (valeurs 0..niveaux-1)
+
+def glcm_plan(canal, niveaux=256):
+    return glcm_canaux(canal, niveaux)
+
+# Fonction d'une bibliothèque, importée au premier appel ("module:attribut")
+@lru_cache(maxsize=None)
+def charger_fonction(chemin):
+    module, attribut = chemin.split(':')
+    return getattr(importlib.import_module(module), attribut)
+
+# Haralick (mahotas) et BiT s'adaptent à la plage de valeurs du plan ; leurs bibliothèques ne sont
+# chargées que si le descripteur est utilisé
+def haralick_plan(canal, niveaux=256):
+    features = charger_fonction('mahotas.features:haralick')(canal).mean(0).tolist()
+    return [float(x) for x in features]
+
+def bitdesk_plan(canal, niveaux=256):
+    features = charger_fonction('BiT:bio_taxo')(canal)
+    return [float(x) for x in features]
+
+#---------------------Registre des descripteurs-------------------------------
+# nom -> {'plan': fonction(canal, niveaux) ou "module:fonction", 'pile': fonction sur les trois canaux
+# empilés (optionnelle), 'composantes': noms des descripteurs concaténés (descripteur composé)}.
+# Un chemin "module:fonction" n'est importé qu'au premier calcul du descripteur.
+DESCRIPTEURS = {}
+
+def enregistrer_descripteur(nom, plan=None, pile=None, composantes=None):
+    if (plan is None) == (composantes is None):
+        raise ValueError(f"Descripteur {nom}: fonction par plan ou composantes attendues")
+    for composante in composantes or ():
+        if composante not in DESCRIPTEURS or DESCRIPTEURS[composante]['composantes']:
+            raise ValueError(f"Descripteur {nom}: composante inconnue ou composée: {composante}")
+    DESCRIPTEURS[nom] = {'plan': plan, 'pile': pile, 'composantes': list(composantes) if composantes else None}
+    if nom not in METHODES:
+        METHODES.append(nom)
+        VARIANTES.extend([(nom, False), (nom, True)])
+
+def _fonction_plan(nom):
+    plan = DESCRIPTEURS[nom]['plan']
+    return charger_fonction(plan) if isinstance(plan, str) else plan
+
+enregistrer_descripteur('glcm', glcm_plan, pile=glcm_canaux)
+enregistrer_descripteur('haralick', haralick_plan)
+enregistrer_descripteur('bit', bitdesk_plan)
+enregistrer_descripteur('concat', composantes=['glcm', 'haralick', 'bit'])
+
+# Calcul de plusieurs variantes sur une image déjà décodée, avec le profil d'extraction donné.
+# Chaque descripteur de base n'est calculé qu'une fois par plan, et les Concat réutilisent ces résultats.
+def calculer_variantes(data, variantes=VARIANTES, profil=None):
+    profil = resoudre_profil(profil)
+    niveaux = profil['niveaux']
+    besoin_gris = any(not rgb for _, rgb in variantes)
+    besoin_rgb = any(rgb for _, rgb in variantes)
+    with mesurer('plans'):
+        data = reduire_image(data, profil['cote_max'])
+        plans = preparer_plans(data, gris=besoin_gris, rgb=besoin_rgb, niveaux=niveaux)
+
+    calcules = {}
+    def base(nom, rgb):
+        if (nom, rgb) not in calcules:
+            pile = DESCRIPTEURS[nom]['pile']
+            with mesurer(f'descripteur.{nom}'):
+                if rgb and pile is not None:
+                    # Les trois canaux en une seule passe
+                    carac = pile(plans['rgb_pile'], niveaux)
+                elif rgb:
+                    carac = []
+                    for canal in plans['rgb']:
+                        carac.extend(_fonction_plan(nom)(canal, niveaux))
+                else:
+                    carac = _fonction_plan(nom)(plans['gris'], niveaux)
+            calcules[(nom, rgb)] = carac
+        return calcules[(nom, rgb)]
+
+    resultats = {}
+    for methode, rgb in variantes:
+        if methode not in DESCRIPTEURS:
+            raise ValueError(f"Méthode d'extraction non reconnue: {methode}")
+        composantes = DESCRIPTEURS[methode]['composantes']
+        if composantes:
+            resultats[(methode, rgb)] = [x for nom in composantes for x in base(nom, rgb)]
+        else:
+            resultats[(methode, rgb)] = list(base(methode, rgb))
+    return resultats
+
+# Lecture + calcul de plusieurs variantes en un seul décodage
+def extraire_variantes(image, variantes=VARIANTES, profil=None):
+    return calculer_variantes(charger_image(image), variantes, profil)
+
+def _extraire(image, methode, rgb, profil=None):
+    return extraire_variantes(image, [(methode, rgb)], profil)[(methode, rgb)]
+
+def glcm(image, profil=None):
+    return _extraire(image, 'glcm', False, profil)
+
+def haralick_feat(image, profil=None):
+    return _extraire(image, 'haralick', False, profil)
+
+def bitdesk_feat(image, profil=None):
+    return _extraire(image, 'bit', False, profil)
+
 # Concatenation des trois--------------
- 
-def concat(chemin):
-    return glcm(chemin) + haralick_feat(chemin) + bitdesk_feat(chemin)
-   
+
+def concat(image, profil=None):
+    return _extraire(image, 'concat', False, profil)
+
 #---------------------RGB-------------------------------
- 
-def glcm_rgb(chemin):
-    data = cv2.imread(chemin)
-    img_rgb = cv2.cvtColor(data, cv2.COLOR_BGR2RGB)
-    canals = ['R', 'G', 'B']
-    carac = []
-    for i, canal_name in enumerate(canals):
-        canal = img_rgb[:, :, i]
-        co_matrice = graycomatrix(canal, [1], [0], None, symmetric=False, normed=False)
-        contrast = float(graycoprops(co_matrice, 'contrast')[0, 0])
-        dissimilarity = float(graycoprops(co_matrice, 'dissimilarity')[0, 0])
-        correlation = float(graycoprops(co_matrice, 'correlation')[0, 0])
-        homogeneity = float(graycoprops(co_matrice, 'homogeneity')[0, 0])
-        ASM = float(graycoprops(co_matrice, 'ASM')[0, 0])
-        energy = float(graycoprops(co_matrice, 'energy')[0, 0])
-        features = [contrast, dissimilarity, correlation, homogeneity, ASM, energy]
-        carac.extend(features)      
-    return carac
- 
-def haralick_feat_rgb(chemin):
-    data = cv2.imread(chemin)
-    img_rgb = cv2.cvtColor(data, cv2.COLOR_BGR2RGB)
-    canals = ['R', 'G', 'B']
-    carac = []
-    for i, _ in enumerate(canals):
-        canal = img_rgb[:, :, i]
-        features = haralick(canal).mean(0).tolist()
-        features = [float(x) for x in features]
-        carac.extend(features)      
-    return carac
- 
-def bitdesk_feat_rgb(chemin):
-    data = cv2.imread(chemin)
-    img_rgb = cv2.cvtColor(data, cv2.COLOR_BGR2RGB)
-    canals = ['R', 'G', 'B']
-    carac = []
-    for i, canal_name in enumerate(canals):
-        canal = img_rgb[:, :, i]
-        features = bio_taxo(canal)
-        features = [float(x) for x in features]
-        carac.extend(features)      
-    return carac
- 
+
+def glcm_rgb(image, profil=None):
+    return _extraire(image, 'glcm', True, profil)
+
+def haralick_feat_rgb(image, profil=None):
+    return _extraire(image, 'haralick', True, profil)
+
+def bitdesk_feat_rgb(image, profil=None):
+    return _extraire(image, 'bit', True, profil)
+
 # Concatenation des trois--------------
- 
-def concat_rgb(chemin):
-    return glcm_rgb(chemin) + haralick_feat_rgb(chemin) + bitdesk_feat_rgb(chemin)
\ No newline at end of file
+
+def concat_rgb(image, profil=None):
+    return _extraire(image, 'concat', True, profil)
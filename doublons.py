@@ -0,0 +1,324 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from cache import CacheLRU
+from instrumentation import journal, mesurer
+from moteur import DISTANCES, distances_paires
+from stockage import ouvrir_index
+
+# Détection des quasi-doublons par auto-jointure d'un index de signatures : chaque signature est
+# comparée à toutes les autres directement dans l'index, sans extraction ni rechargement par image.
+# Les lignes sont découpées en blocs de requêtes répartis entre processus (index projeté en mémoire) ;
+# chaque bloc parcourt la matrice par tuiles de colonnes et ne garde que ses k plus proches voisins
+# courants (ou ses paires sous le seuil) : la mémoire reste bornée par la taille d'une tuile.
+# La distance euclidienne passe par un produit matriciel sur les données centrées, les autres par
+# scipy.spatial.distance.cdist (boucle compilée, en float64) ; les distances retenues sont recalculées
+# comme dans la recherche exhaustive. Les distances autres qu'euclidienne restent bien plus coûteuses
+# (pas de produit matriciel) : compter une dizaine de fois la durée de l'euclidienne.
+# Les paires sous le seuil sont regroupées en composantes connexes (groupes de doublons) dans un rapport CSV.
+#   python -m doublons SignaturesGlcm.idx --k 10
+#   python -m doublons SignaturesGlcm.idx --seuil 0.5
+#   python -m doublons SignaturesGlcm.idx --k 5 --seuil 0.5 --processus 8
+
+TAILLE_BLOC_REQUETES = 1024
+TAILLE_BLOC_COLONNES = 8192
+
+# Noms scipy des distances calculées par cdist
+DISTANCES_SCIPY = {"manhattan": "cityblock", "tchebychev": "chebyshev", "canberra": "canberra"}
+
+# Marges des comparaisons sur les distances des tuiles : la recherche exhaustive arrondit les écarts
+# en float32 (relative), le produit matriciel de l'euclidienne cumule des arrondis sur les normes
+# (absolue). Un voisin à la limite n'est pas écarté avant le recalcul exact
+MARGE_RELATIVE = 1e-6
+MARGE_PRODUIT = 1e-12
+# Voisins supplémentaires gardés par ligne : le classement final se fait sur les distances exactes
+VOISINS_SUPPLEMENTAIRES = 8
+
+def chemin_rapport_doublons(fichier_signatures):
+    return f"{os.path.splitext(fichier_signatures)[0]}.doublons.csv"
+
+def chemin_voisins(fichier_signatures):
+    return f"{os.path.splitext(fichier_signatures)[0]}.voisins.csv"
+
+# Index ouverts par processus (projection mémoire : le cache de pages est partagé entre processus)
+_index_ouverts = CacheLRU(4)
+
+def _ouvrir(fichier):
+    stat = os.stat(fichier)
+    cle = (fichier, stat.st_mtime_ns, stat.st_size)
+    index = _index_ouverts.obtenir(cle)
+    if index is None:
+        index = ouvrir_index(fichier)
+        _index_ouverts.ajouter(cle, index)
+    return index
+
+# Lignes prêtes pour le calcul, en float64 : centrées avec leurs normes au carré pour l'euclidienne,
+# telles quelles (normes nulles) pour les autres distances
+def _preparer(lignes, distance, centre):
+    if distance != "euclidienne":
+        return lignes.astype(np.float64), np.zeros(len(lignes))
+    centrees = lignes.astype(np.float64) - centre
+    return centrees, np.einsum("ij,ij->i", centrees, centrees)
+
+# Distances d'un bloc de requêtes à une tuile de colonnes (q x c). Pour l'euclidienne, distances au carré
+# moins la norme au carré de la requête (||b||² - 2 a.b : même classement par ligne, une passe de moins) ;
+# les requêtes sont alors passées multipliées par -2
+def _distances_tuile(requetes, colonnes, normes_colonnes, distance):
+    if distance != "euclidienne":
+        from scipy.spatial.distance import cdist
+        return cdist(requetes, colonnes, DISTANCES_SCIPY[distance])
+    tuile = requetes @ colonnes.T
+    tuile += normes_colonnes
+    return tuile
+
+# Cases (ligne, colonne) de la tuile sous la limite de leur ligne (flatnonzero : bien plus rapide que
+# nonzero sur un masque à deux dimensions)
+def _sous_limites(tuile, limites):
+    return np.divmod(np.flatnonzero(tuile <= limites[:, None]), tuile.shape[1])
+
+# Fusion des voisins courants (q x k, triés) et de candidats (ligne du bloc, identifiant, valeur) :
+# les k plus petites valeurs de chaque ligne, égalités départagées par l'identifiant (comme selection_top_k)
+def _fusionner(valeurs, voisins, lignes, identifiants, candidats):
+    q, k = valeurs.shape
+    lignes = np.concatenate([np.repeat(np.arange(q), k), lignes])
+    identifiants = np.concatenate([voisins.ravel(), identifiants])
+    candidats = np.concatenate([valeurs.ravel(), candidats])
+    ordre = np.lexsort((identifiants, candidats, lignes))
+    comptes = np.bincount(lignes, minlength=q)
+    rangs = np.arange(len(ordre)) - np.repeat(np.cumsum(comptes) - comptes, comptes)
+    garder = ordre[rangs < k]
+    return candidats[garder].reshape(q, k), identifiants[garder].reshape(q, k)
+
+# Auto-jointure des lignes [debut, fin) de l'index contre toutes les lignes.
+# k > 0 : (identifiants, distances) des k plus proches voisins (sous le seuil s'il est donné, -1 sinon) ;
+# k = 0 : paires (i, j) avec i < j et distance <= seuil, et leurs distances
+def _joindre_bloc(fichier, debut, fin, distance, k, seuil, centre, taille_colonnes):
+    matrice = _ouvrir(fichier).caracteristiques
+    n = len(matrice)
+    q = fin - debut
+    euclidienne = distance == "euclidienne"
+    limite = np.inf if seuil is None else (seuil * seuil if euclidienne else seuil)
+    requetes, normes_requetes = _preparer(np.asarray(matrice[debut:fin]), distance, centre)
+    if euclidienne:
+        requetes = -2 * requetes
+    lignes_bloc = np.arange(debut, fin)[:, None]
+    k_final = k
+    if k:
+        k += VOISINS_SUPPLEMENTAIRES
+        valeurs = np.full((q, k), limite * (1 + MARGE_RELATIVE))
+        # n : place libre, classée après tout voisin réel à valeur égale
+        voisins = np.full((q, k), n, dtype=np.int64)
+    else:
+        paires, distances = [], []
+
+    # Seuil seul : chaque paire n'est calculée qu'une fois, depuis sa plus petite ligne
+    for d0 in range(0 if k else debut, n, taille_colonnes):
+        d1 = min(d0 + taille_colonnes, n)
+        bloc = np.asarray(matrice[d0:d1])
+        colonnes, normes_colonnes = _preparer(bloc, distance, centre)
+        with mesurer("distance"):
+            tuile = _distances_tuile(requetes, colonnes, normes_colonnes, distance)
+        if d0 < fin and debut < d1:
+            colonnes_tuile = np.arange(d0, d1)
+            tuile[(colonnes_tuile == lignes_bloc) if k else (colonnes_tuile <= lignes_bloc)] = np.inf
+        relative = 1 + MARGE_RELATIVE
+        marge = MARGE_PRODUIT * (normes_requetes.max() + normes_colonnes.max()) if euclidienne else 0.0
+
+        with mesurer("selection"):
+            if not k:
+                i, j = _sous_limites(tuile, limite * relative + marge - normes_requetes)
+                if len(i):
+                    exactes = distances_paires(bloc[j], matrice[debut + i], distance)
+                    garder = exactes <= seuil
+                    paires.append(np.stack([debut + i[garder], d0 + j[garder]], axis=1))
+                    distances.append(exactes[garder])
+                continue
+
+            bornes = valeurs[:, -1]
+            if np.isinf(bornes).any():
+                # Première tuile : sa k-ième plus petite valeur borne déjà la sélection
+                rang = min(k, d1 - d0) - 1
+                bornes = np.minimum(bornes, np.partition(tuile, rang, axis=1)[:, rang] + normes_requetes)
+            i, j = _sous_limites(tuile, bornes * relative + marge - normes_requetes)
+            if len(i):
+                valeurs, voisins = _fusionner(valeurs, voisins, i, d0 + j, tuile[i, j] + normes_requetes[i])
+
+    if not k:
+        if not paires:
+            return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(paires).astype(np.int64), np.concatenate(distances)
+
+    # Distances exactes des voisins retenus, puis tri final (distance, identifiant)
+    trouves = voisins < n
+    exactes = np.full((q, k), np.inf)
+    exactes[trouves] = distances_paires(matrice[voisins[trouves]],
+                                        matrice[np.broadcast_to(lignes_bloc, (q, k))[trouves]], distance)
+    if seuil is not None:
+        exactes[exactes > seuil] = np.inf
+    voisins[np.isinf(exactes)] = n
+    ordre = np.lexsort((voisins, exactes), axis=1)
+    voisins = np.take_along_axis(voisins, ordre, axis=1)[:, :k_final]
+    exactes = np.take_along_axis(exactes, ordre, axis=1)[:, :k_final]
+    voisins[voisins == n] = -1
+    return voisins, exactes
+
+# Blocs de lignes de l'index traités dans n_processus processus (1 : dans ce processus).
+# Renvoie les résultats des blocs dans l'ordre des lignes ; progression(lignes traitées, total)
+def _joindre(fichier_signatures, distance, k, seuil, n_processus, taille_bloc, taille_colonnes, progression):
+    if distance not in DISTANCES:
+        raise ValueError("Méthode de distance non reconnue")
+    if not k and seuil is None:
+        raise ValueError("Nombre de voisins ou seuil de distance attendu")
+    fichier_signatures = os.path.abspath(fichier_signatures)
+    matrice = _ouvrir(fichier_signatures).caracteristiques
+    n = len(matrice)
+    k = min(k, max(n - 1, 0))
+    if k == 0 and seuil is None:
+        raise ValueError(f"Index trop petit pour une recherche de voisins: {fichier_signatures}")
+    centre = matrice.mean(axis=0, dtype=np.float64) if distance == "euclidienne" else None
+    blocs = [(debut, min(debut + taille_bloc, n)) for debut in range(0, n, taille_bloc)]
+    arguments = [(fichier_signatures, debut, fin, distance, k, seuil, centre, taille_colonnes) for debut, fin in blocs]
+
+    if n_processus is None:
+        n_processus = os.cpu_count() or 1
+    resultats = []
+    with mesurer("auto_jointure"):
+        if n_processus <= 1 or len(blocs) <= 1:
+            for (_, fin), argument in zip(blocs, arguments):
+                resultats.append(_joindre_bloc(*argument))
+                if progression:
+                    progression(fin, n)
+        else:
+            with ProcessPoolExecutor(max_workers=n_processus) as executor:
+                futurs = [executor.submit(_joindre_bloc, *argument) for argument in arguments]
+                for (_, fin), futur in zip(blocs, futurs):
+                    resultats.append(futur.result())
+                    if progression:
+                        progression(fin, n)
+    return resultats
+
+# k plus proches voisins de chaque signature de l'index (elle-même exclue) : identifiants (n x k,
+# -1 si aucun voisin, par exemple au-delà du seuil) et distances (n x k, inf si aucun voisin)
+def voisins_index(fichier_signatures, distance="euclidienne", k=10, seuil=None, n_processus=None,
+                  taille_bloc=TAILLE_BLOC_REQUETES, taille_colonnes=TAILLE_BLOC_COLONNES, progression=None):
+    if k <= 0:
+        raise ValueError("Nombre de voisins attendu (k > 0)")
+    resultats = _joindre(fichier_signatures, distance, k, seuil, n_processus, taille_bloc, taille_colonnes, progression)
+    if not resultats:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float64)
+    return np.concatenate([r[0] for r in resultats]), np.concatenate([r[1] for r in resultats])
+
+# Toutes les paires (i < j) de signatures à une distance <= seuil : paires (m x 2) et distances (m)
+def paires_sous_seuil(fichier_signatures, seuil, distance="euclidienne", n_processus=None,
+                      taille_bloc=TAILLE_BLOC_REQUETES, taille_colonnes=TAILLE_BLOC_COLONNES, progression=None):
+    resultats = _joindre(fichier_signatures, distance, 0, seuil, n_processus, taille_bloc, taille_colonnes, progression)
+    if not resultats:
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate([r[0] for r in resultats]), np.concatenate([r[1] for r in resultats])
+
+# Paires distinctes (i < j) présentes dans une table de voisins
+def paires_depuis_voisins(voisins, distances):
+    lignes = np.repeat(np.arange(len(voisins)), voisins.shape[1])
+    colonnes = voisins.ravel()
+    valeurs = distances.ravel()
+    trouves = colonnes >= 0
+    paires = np.sort(np.stack([lignes[trouves], colonnes[trouves]], axis=1), axis=1)
+    if len(paires) == 0:
+        return paires.astype(np.int64), valeurs[trouves]
+    paires, premieres = np.unique(paires, axis=0, return_index=True)
+    return paires, valeurs[trouves][premieres]
+
+# Groupes de doublons : composantes connexes du graphe des paires (au moins deux signatures),
+# du plus grand au plus petit ; chaque groupe est un tableau trié d'identifiants
+def regrouper_doublons(n, paires):
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if len(paires) == 0:
+        return []
+    graphe = coo_matrix((np.ones(len(paires), dtype=np.int8), (paires[:, 0], paires[:, 1])), shape=(n, n))
+    _, composantes = connected_components(graphe, directed=False)
+    ordre = np.argsort(composantes, kind="stable")
+    tailles = np.bincount(composantes)
+    groupes = [groupe for groupe in np.split(ordre, np.cumsum(tailles)[:-1]) if len(groupe) > 1]
+    groupes.sort(key=lambda groupe: (-len(groupe), groupe[0]))
+    return groupes
+
+# Rapport des groupes : une ligne par image (groupe, taille du groupe, chemin, plus proche doublon, distance)
+def ecrire_rapport_doublons(fichier, chemins, groupes, paires, distances):
+    # Plus proche doublon de chaque image parmi les paires retenues
+    noeuds = np.concatenate([paires[:, 0], paires[:, 1]])
+    autres = np.concatenate([paires[:, 1], paires[:, 0]])
+    valeurs = np.concatenate([distances, distances])
+    ordre = np.lexsort((autres, valeurs, noeuds))
+    uniques, premiers = np.unique(noeuds[ordre], return_index=True)
+    plus_proches = dict(zip(uniques.tolist(), zip(autres[ordre][premiers].tolist(), valeurs[ordre][premiers].tolist())))
+
+    with open(fichier, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["groupe", "taille", "path_relative", "plus_proche", "distance"])
+        for numero, groupe in enumerate(groupes, 1):
+            for identifiant in groupe.tolist():
+                voisin, distance = plus_proches[identifiant]
+                writer.writerow([numero, len(groupe), chemins[identifiant], chemins[voisin], f"{distance:.6g}"])
+
+# Table des voisins : une ligne par (image, rang)
+def ecrire_voisins(fichier, chemins, voisins, distances):
+    with open(fichier, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path_relative", "rang", "voisin", "distance"])
+        for i, (ligne, valeurs) in enumerate(zip(voisins.tolist(), distances.tolist())):
+            for rang, (voisin, distance) in enumerate(zip(ligne, valeurs), 1):
+                if voisin >= 0:
+                    writer.writerow([chemins[i], rang, chemins[voisin], f"{distance:.6g}"])
+
+#---------------------Outil en ligne de commande-------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Voisins et groupes de quasi-doublons d'un index de signatures")
+    parser.add_argument("fichier", help="Index .idx")
+    parser.add_argument("--distance", default="euclidienne", choices=DISTANCES)
+    parser.add_argument("--k", type=int, default=0, help="Nombre de voisins par image")
+    parser.add_argument("--seuil", type=float, help="Distance maximale entre deux doublons")
+    parser.add_argument("--processus", type=int, help="Nombre de processus (tous les coeurs par défaut)")
+    parser.add_argument("--taille-bloc", type=int, default=TAILLE_BLOC_REQUETES, help="Lignes par bloc de requêtes")
+    parser.add_argument("--rapport", help="Rapport des groupes de doublons (CSV)")
+    parser.add_argument("--voisins", help="Table des voisins (CSV)")
+    args = parser.parse_args()
+    if not args.k and args.seuil is None:
+        parser.error("--k ou --seuil attendu")
+
+    def progression(faits, total):
+        journal.info(f"Auto-jointure: {faits}/{total} signatures")
+
+    debut = time.perf_counter()
+    chemins = ouvrir_index(args.fichier).chemins
+    if args.k:
+        voisins, distances = voisins_index(args.fichier, args.distance, args.k, args.seuil, args.processus,
+                                           args.taille_bloc, progression=progression)
+        fichier_voisins = args.voisins or chemin_voisins(args.fichier)
+        ecrire_voisins(fichier_voisins, chemins, voisins, distances)
+        premiers = distances[:, 0][np.isfinite(distances[:, 0])]
+        if len(premiers):
+            quantiles = np.percentile(premiers, [1, 5, 25, 50])
+            print(f"Distance au plus proche voisin: 1% {quantiles[0]:.4g}, 5% {quantiles[1]:.4g}, "
+                  f"25% {quantiles[2]:.4g}, médiane {quantiles[3]:.4g}")
+        print(f"Voisins écrits dans {fichier_voisins}")
+        paires, distances = paires_depuis_voisins(voisins, distances)
+    else:
+        paires, distances = paires_sous_seuil(args.fichier, args.seuil, args.distance, args.processus,
+                                              args.taille_bloc, progression=progression)
+
+    if args.seuil is not None:
+        groupes = regrouper_doublons(len(chemins), paires)
+        fichier_rapport = args.rapport or chemin_rapport_doublons(args.fichier)
+        ecrire_rapport_doublons(fichier_rapport, chemins, groupes, paires, distances)
+        print(f"{len(paires)} paires sous le seuil, {len(groupes)} groupes de doublons "
+              f"({sum(len(groupe) for groupe in groupes)} images), rapport écrit dans {fichier_rapport}")
+    print(f"{len(chemins)} signatures, {args.distance}, {time.perf_counter() - debut:.1f} s")
+
+if __name__ == "__main__":
+    main()
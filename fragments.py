@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from cache import CacheLRU, memoriser_resultats, resultats_en_cache, version_index
+from cbir import caracteristiques_requete, empreinte_requete, rechercher_image
+from descripteurs import decrire_source
+from instrumentation import incrementer, journal, mesurer
+from moteur import rechercher_top_k
+from stockage import ecrire_index_par_blocs, ouvrir_index
+
+# Index fragmenté : les signatures d'un index sont réparties dans plusieurs fichiers .idx
+# (par nombre de lignes ou par sous-dossier de ./dataSet), décrits par un manifeste JSON
+# (SignaturesGlcm.fragments.json). Une requête est cherchée dans tous les fragments en parallèle,
+# dans des processus qui projettent les fragments en mémoire, puis les top-k sont fusionnés.
+#   python -m fragments creer SignaturesGlcm.idx --taille 500000
+#   python -m fragments creer SignaturesGlcm.idx --par-dossier
+#   python -m fragments reequilibrer SignaturesGlcm.fragments.json --nombre 8
+#   python -m fragments info SignaturesGlcm.fragments.json
+
+EXTENSION_FRAGMENTS = ".fragments.json"
+VERSION_FRAGMENTS = 1
+TAILLE_FRAGMENT = 500000
+
+# Manifeste des fragments associé à un index (SignaturesGlcm.idx -> SignaturesGlcm.fragments.json)
+def chemin_fragments(fichier_signatures):
+    return os.path.splitext(fichier_signatures)[0] + EXTENSION_FRAGMENTS
+
+def est_index_fragmente(fichier):
+    return fichier.endswith(EXTENSION_FRAGMENTS)
+
+def lire_fragments(fichier_fragments):
+    with open(fichier_fragments, encoding="utf-8") as f:
+        manifeste = json.load(f)
+    if manifeste.get("version", 0) > VERSION_FRAGMENTS:
+        raise ValueError(f"Version d'index fragmenté non supportée: {manifeste.get('version')}")
+    return manifeste
+
+# Empreinte de l'index source d'une fragmentation (chemin relatif au manifeste, date et taille)
+def _empreinte_source(fichier_signatures, fichier_fragments):
+    stat = os.stat(fichier_signatures)
+    dossier = os.path.dirname(os.path.abspath(fichier_fragments))
+    return {"source": os.path.relpath(os.path.abspath(fichier_signatures), dossier),
+            "source_mtime_ns": stat.st_mtime_ns, "source_taille": stat.st_size}
+
+# Index source d'un manifeste (chemin absolu) ; pour un manifeste sans source enregistrée,
+# l'index voisin de même nom (SignaturesGlcm.fragments.json -> SignaturesGlcm.idx)
+def source_fragments(fichier_fragments, manifeste=None):
+    manifeste = manifeste or lire_fragments(fichier_fragments)
+    if "source" in manifeste:
+        return os.path.join(os.path.dirname(os.path.abspath(fichier_fragments)), manifeste["source"])
+    return os.path.abspath(fichier_fragments[:-len(EXTENSION_FRAGMENTS)] + ".idx")
+
+# Vrai si les fragments reflètent encore leur index source : l'index .idx n'a pas été réécrit depuis la
+# fragmentation (mise à jour incrémentale, reconstruction). Sans empreinte enregistrée, l'index ne doit
+# pas être plus récent que le manifeste ; sans index source, les fragments sont la seule copie
+def fragments_a_jour(fichier_fragments, manifeste=None):
+    manifeste = manifeste or lire_fragments(fichier_fragments)
+    source = source_fragments(fichier_fragments, manifeste)
+    if not os.path.exists(source):
+        return True
+    stat = os.stat(source)
+    if "source_mtime_ns" in manifeste:
+        return (stat.st_mtime_ns, stat.st_size) == (manifeste["source_mtime_ns"], manifeste["source_taille"])
+    return stat.st_mtime_ns <= os.stat(fichier_fragments).st_mtime_ns
+
+# Chemins absolus des fichiers de fragments (enregistrés relativement au manifeste)
+def fichiers_fragments(fichier_fragments, manifeste=None):
+    manifeste = manifeste or lire_fragments(fichier_fragments)
+    dossier = os.path.dirname(os.path.abspath(fichier_fragments))
+    return [os.path.join(dossier, fragment["fichier"]) for fragment in manifeste["fragments"]]
+
+# Clé de fragment d'un chemin relatif : son premier sous-dossier
+def _sous_dossier(path_relative):
+    parties = os.path.normpath(path_relative).split(os.sep)
+    return parties[0] if len(parties) > 1 else "."
+
+# Répartition des lignes : [(clé, indices)] en tranches consécutives de taille_fragment lignes,
+# ou par sous-dossier (dans l'ordre de première apparition)
+def _repartir(chemins, taille_fragment=None, n_fragments=None, par_dossier=False):
+    n = len(chemins)
+    if par_dossier:
+        groupes = {}
+        for i, path_relative in enumerate(chemins):
+            groupes.setdefault(_sous_dossier(path_relative), []).append(i)
+        return [(cle, np.asarray(indices, dtype=np.int64)) for cle, indices in groupes.items()]
+    if n_fragments:
+        taille_fragment = -(-n // max(1, n_fragments))
+    taille_fragment = max(1, taille_fragment or TAILLE_FRAGMENT)
+    return [(str(numero), np.arange(debut, min(debut + taille_fragment, n)))
+            for numero, debut in enumerate(range(0, n, taille_fragment))]
+
+# Ecriture d'une nouvelle génération de fragments puis remplacement atomique du manifeste ;
+# sources : liste d'index ouverts, lus bloc par bloc (la collection n'est jamais chargée en entier)
+def _ecrire_fragments(fichier_fragments, sources, repartition, entete, generation):
+    base = os.path.basename(fichier_fragments)[:-len(EXTENSION_FRAGMENTS)]
+    dossier_manifeste = os.path.dirname(os.path.abspath(fichier_fragments))
+    nom_dossier = f"{base}.fragments.{generation}"
+    dossier = os.path.join(dossier_manifeste, nom_dossier)
+    if os.path.exists(dossier):
+        shutil.rmtree(dossier)
+    os.makedirs(dossier)
+
+    # Position de chaque ligne globale dans les sources
+    bornes = np.cumsum([0] + [len(source) for source in sources])
+    chemins = [path_relative for source in sources for path_relative in source.chemins]
+
+    def blocs(indices):
+        for s, source in enumerate(sources):
+            locaux = indices[(indices >= bornes[s]) & (indices < bornes[s + 1])] - bornes[s]
+            if len(locaux):
+                yield np.asarray(source.caracteristiques[locaux])
+
+    fragments = []
+    for numero, (cle, indices) in enumerate(repartition):
+        nom = f"{numero:05d}.idx"
+        ecrire_index_par_blocs(os.path.join(dossier, nom), blocs(indices), [chemins[i] for i in indices],
+                               entete["methode"], entete["rgb"], entete["dimension"], profil=entete.get("profil"))
+        fragments.append({"fichier": f"{nom_dossier}/{nom}", "nombre": int(len(indices)), "cle": cle})
+
+    manifeste = dict(entete)
+    manifeste.update({"version": VERSION_FRAGMENTS, "generation": generation,
+                      "nombre": int(sum(fragment["nombre"] for fragment in fragments)), "fragments": fragments})
+    temporaire = f"{fichier_fragments}.tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(manifeste, f, ensure_ascii=False, indent=2)
+    os.replace(temporaire, fichier_fragments)
+    return manifeste
+
+# Création d'un index fragmenté à partir d'un index .idx : par tranches de taille_fragment lignes,
+# en n_fragments fragments de même taille, ou un fragment par sous-dossier
+def fragmenter_index(fichier_signatures, taille_fragment=None, n_fragments=None, par_dossier=False, fichier_fragments=None):
+    fichier_fragments = fichier_fragments or chemin_fragments(fichier_signatures)
+    index = ouvrir_index(fichier_signatures)
+    entete = {"methode": index.methode, "rgb": index.rgb, "dimension": index.dimension, "profil": index.profil,
+              "critere": "dossier" if par_dossier else "nombre"}
+    entete.update(_empreinte_source(fichier_signatures, fichier_fragments))
+    generation = lire_fragments(fichier_fragments)["generation"] + 1 if os.path.exists(fichier_fragments) else 0
+    ancien = _dossiers_generations(fichier_fragments)
+    manifeste = _ecrire_fragments(fichier_fragments, [index], _repartir(index.chemins, taille_fragment, n_fragments,
+                                                                        par_dossier), entete, generation)
+    del index
+    _supprimer_generations(ancien)
+    journal.info(f"Index fragmenté créé: {fichier_fragments} ({len(manifeste['fragments'])} fragments, "
+                 f"{manifeste['nombre']} signatures)")
+    return fichier_fragments
+
+# Rééquilibrage : les fragments existants sont relus dans l'ordre et redistribués
+# (nouvelle génération de fichiers ; l'ancienne est supprimée après le remplacement du manifeste)
+def reequilibrer_fragments(fichier_fragments, taille_fragment=None, n_fragments=None, par_dossier=False):
+    manifeste = lire_fragments(fichier_fragments)
+    sources = [ouvrir_index(fichier) for fichier in fichiers_fragments(fichier_fragments, manifeste)]
+    chemins = [path_relative for source in sources for path_relative in source.chemins]
+    entete = {cle: manifeste.get(cle) for cle in ("methode", "rgb", "dimension", "profil")}
+    # Même contenu redistribué : la source d'origine reste celle des fragments
+    entete.update({cle: manifeste[cle] for cle in ("source", "source_mtime_ns", "source_taille") if cle in manifeste})
+    entete["critere"] = "dossier" if par_dossier else "nombre"
+    ancien = _dossiers_generations(fichier_fragments)
+    nouveau = _ecrire_fragments(fichier_fragments, sources, _repartir(chemins, taille_fragment, n_fragments, par_dossier),
+                                entete, manifeste["generation"] + 1)
+    del sources
+    _supprimer_generations(ancien)
+    journal.info(f"Fragments rééquilibrés: {len(manifeste['fragments'])} -> {len(nouveau['fragments'])} "
+                 f"({nouveau['nombre']} signatures)")
+    return nouveau
+
+def _dossiers_generations(fichier_fragments):
+    if not os.path.exists(fichier_fragments):
+        return []
+    return sorted({os.path.dirname(fichier) for fichier in fichiers_fragments(fichier_fragments)})
+
+def _supprimer_generations(dossiers):
+    for dossier in dossiers:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+#---------------------Recherche-------------------------------
+
+# Fragments ouverts par processus (projection mémoire : le cache de pages est partagé entre processus)
+_fragments_ouverts = CacheLRU(256)
+
+def _ouvrir_fragment(fichier):
+    stat = os.stat(fichier)
+    cle = (fichier, stat.st_mtime_ns, stat.st_size)
+    index = _fragments_ouverts.obtenir(cle)
+    if index is None:
+        index = ouvrir_index(fichier)
+        _fragments_ouverts.ajouter(cle, index)
+    return index
+
+# Top-k d'un fragment : liste de (chemin, distance)
+def _rechercher_fragment(fichier, requete, distance, k):
+    index = _ouvrir_fragment(fichier)
+    if len(index) == 0:
+        return []
+    return rechercher_top_k(requete, index.caracteristiques, index.chemins, distance, k)
+
+# Fusion des top-k des fragments : tri stable, les égalités gardent l'ordre des fragments
+def fusionner_top_k(resultats_fragments, k):
+    return sorted((resultat for resultats in resultats_fragments for resultat in resultats), key=lambda r: r[1])[:k]
+
+# Pool de processus partagé par les requêtes, créé au premier appel
+_pool = None
+_taille_pool = 0
+_verrou_pool = threading.Lock()
+
+def _initialiser_processus():
+    import cv2
+    cv2.setNumThreads(1)
+
+def obtenir_pool(n_processus=None):
+    global _pool, _taille_pool
+    n_processus = n_processus or os.cpu_count() or 1
+    with _verrou_pool:
+        if _pool is None or _taille_pool != n_processus:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=n_processus, initializer=_initialiser_processus)
+            _taille_pool = n_processus
+        return _pool
+
+def fermer_pool():
+    global _pool
+    with _verrou_pool:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+# Recherche par vecteur dans un index fragmenté ; n_processus=1 : fragments parcourus dans ce processus
+def rechercher_vecteur_fragments(requete, fichier_fragments, distance="euclidienne", k=5, n_processus=None):
+    requete = np.asarray(requete, dtype=np.float32).ravel()
+    fichiers = fichiers_fragments(fichier_fragments)
+    if n_processus is None:
+        n_processus = os.cpu_count() or 1
+    with mesurer("fragments"):
+        if n_processus <= 1 or len(fichiers) <= 1:
+            resultats = [_rechercher_fragment(fichier, requete, distance, k) for fichier in fichiers]
+        else:
+            pool = obtenir_pool(n_processus)
+            futurs = [pool.submit(_rechercher_fragment, fichier, requete, distance, k) for fichier in fichiers]
+            resultats = [futur.result() for futur in futurs]
+    with mesurer("fusion"):
+        return fusionner_top_k(resultats, k)
+
+# Même API que rechercher_image, sur un index fragmenté. Si l'index source a changé depuis la
+# fragmentation, les fragments sont ignorés et la recherche porte sur l'index source
+def rechercher_image_fragments(image_query, fichier_fragments, distance="euclidienne", k=5, n_processus=None):
+    try:
+        a_jour = fragments_a_jour(fichier_fragments)
+    except Exception as e:
+        journal.error(f"Erreur lors du chargement des signatures: {e}")
+        return []
+    if not a_jour:
+        source = source_fragments(fichier_fragments)
+        journal.warning(f"Fragments de {fichier_fragments} antérieurs à {source}, recherche dans l'index "
+                        f"(python -m fragments creer pour les régénérer)")
+        return rechercher_image(image_query, source, distance, k)
+
+    try:
+        # Le manifeste est remplacé à chaque modification des fragments : sa version identifie l'index
+        cle_resultats = (empreinte_requete(image_query), version_index(fichier_fragments), distance)
+        manifeste = lire_fragments(fichier_fragments)
+    except Exception as e:
+        journal.error(f"Erreur lors du chargement des signatures: {e}")
+        return []
+    if cle_resultats[0] is not None:
+        resultats = resultats_en_cache(cle_resultats, k)
+        if resultats is not None:
+            incrementer("cache_resultats")
+            return resultats
+
+    with mesurer("extraction_requete"):
+        query_features = caracteristiques_requete(image_query, manifeste["methode"], manifeste["rgb"],
+                                                  manifeste.get("profil"), cle_resultats[0])
+    if query_features is None:
+        journal.warning(f"Impossible d'extraire les caractéristiques de l'image requête: {decrire_source(image_query)}")
+        return []
+    if len(query_features) != manifeste["dimension"]:
+        journal.warning(f"Incompatibilité de dimensions: Query={len(query_features)}, Stockée={manifeste['dimension']}")
+        return []
+
+    try:
+        resultats = rechercher_vecteur_fragments(query_features, fichier_fragments, distance, k, n_processus)
+    except (OSError, ValueError) as e:
+        journal.error(f"Erreur lors de la comparaison: {e}")
+        return []
+    if cle_resultats[0] is not None:
+        memoriser_resultats(cle_resultats, k, resultats)
+    return resultats
+
+#---------------------Outil en ligne de commande-------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Création et rééquilibrage des index fragmentés")
+    commandes = parser.add_subparsers(dest="commande", required=True)
+
+    creer = commandes.add_parser("creer", help="Fragmenter un index .idx")
+    creer.add_argument("fichier", help="Index .idx")
+    reequilibrer = commandes.add_parser("reequilibrer", help="Redistribuer les fragments d'un index fragmenté")
+    reequilibrer.add_argument("fichier", help="Manifeste .fragments.json")
+    for commande in (creer, reequilibrer):
+        critere = commande.add_mutually_exclusive_group()
+        critere.add_argument("--taille", type=int, help="Nombre maximal de signatures par fragment")
+        critere.add_argument("--nombre", type=int, help="Nombre de fragments de même taille")
+        critere.add_argument("--par-dossier", action="store_true", help="Un fragment par sous-dossier du dataset")
+    info = commandes.add_parser("info", help="Afficher les fragments")
+    info.add_argument("fichier", help="Manifeste .fragments.json")
+    args = parser.parse_args()
+
+    if args.commande == "creer":
+        fragmenter_index(args.fichier, args.taille, args.nombre, args.par_dossier)
+    elif args.commande == "reequilibrer":
+        reequilibrer_fragments(args.fichier, args.taille, args.nombre, args.par_dossier)
+    fichier_fragments = args.fichier if args.commande != "creer" else chemin_fragments(args.fichier)
+    manifeste = lire_fragments(fichier_fragments)
+    print(f"{manifeste['methode']}{'_rgb' if manifeste['rgb'] else ''}: {manifeste['nombre']} signatures, "
+          f"{len(manifeste['fragments'])} fragments ({manifeste['critere']})")
+    for fragment in manifeste["fragments"]:
+        print(f"  {fragment['fichier']}: {fragment['nombre']} ({fragment['cle']})")
+    if not fragments_a_jour(fichier_fragments, manifeste):
+        print(f"Attention: {source_fragments(fichier_fragments, manifeste)} a changé depuis la fragmentation, "
+              f"la recherche utilise l'index (python -m fragments creer pour régénérer)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import threading
+import numpy as np
+from db import CHEMIN_BASE, lire_encodages_depuis
+
+# Tolérance de reconnaissance faciale (distance euclidienne entre encodages)
+TOLERANCE = 0.7
+
+DIMENSION_ENCODAGE = 128
+
+# Galerie des encodages faciaux en mémoire : une matrice contiguë (une ligne par utilisateur),
+# chargée une fois depuis la base puis complétée au fil des inscriptions
+class GalerieFaciale:
+    def __init__(self, chemin_base=CHEMIN_BASE):
+        self.chemin_base = chemin_base
+        self._verrou = threading.Lock()
+        self._encodages = np.empty((0, DIMENSION_ENCODAGE), dtype=np.float64)
+        self._emails = []
+        self._connus = set()
+        self._dernier_id = 0
+
+    def __len__(self):
+        return len(self._emails)
+
+    # Ajout en fin de matrice, capacité doublée si nécessaire
+    def _ajouter(self, emails, encodages):
+        n = len(self._emails)
+        total = n + len(emails)
+        if total > len(self._encodages):
+            capacite = max(total, 2 * len(self._encodages), 64)
+            agrandie = np.empty((capacite, DIMENSION_ENCODAGE), dtype=np.float64)
+            agrandie[:n] = self._encodages[:n]
+            self._encodages = agrandie
+        self._encodages[n:total] = encodages
+        self._emails.extend(emails)
+        self._connus.update(emails)
+
+    # Chargement des utilisateurs inscrits depuis le dernier rafraîchissement (tous au premier appel).
+    # La requête porte sur la clé primaire : elle ne renvoie en général aucune ligne.
+    def rafraichir(self):
+        lignes = lire_encodages_depuis(self._dernier_id, self.chemin_base)
+
+        with self._verrou:
+            emails, encodages = [], []
+            for id_utilisateur, email, descripteur_binaire in lignes:
+                if id_utilisateur <= self._dernier_id:
+                    continue
+                self._dernier_id = id_utilisateur
+                if not descripteur_binaire or email in self._connus:
+                    continue
+                emails.append(email)
+                encodages.append(np.frombuffer(descripteur_binaire, dtype=np.float64))
+            if emails:
+                self._ajouter(emails, np.stack(encodages))
+        return len(lignes)
+
+    # Ajout d'un utilisateur qui vient d'être inscrit (id : clé primaire de sa ligne)
+    def ajouter(self, email, encodage, id_utilisateur=None):
+        with self._verrou:
+            if email in self._connus:
+                return
+            self._ajouter([email], np.asarray(encodage, dtype=np.float64).reshape(1, -1))
+            # Sans trou dans les identifiants, le prochain rafraîchissement n'a pas à relire cette ligne
+            if id_utilisateur is not None and id_utilisateur == self._dernier_id + 1:
+                self._dernier_id = id_utilisateur
+
+    # Utilisateur le plus proche de l'encodage : (email, distance), email à None au-delà de la tolérance
+    def identifier(self, encodage, tolerance=TOLERANCE):
+        with self._verrou:
+            n = len(self._emails)
+            if n == 0:
+                return None, None
+            diff = self._encodages[:n] - np.asarray(encodage, dtype=np.float64)
+            distances = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            meilleur = int(np.argmin(distances))
+            email = self._emails[meilleur]
+        distance = float(distances[meilleur])
+        return (email if distance <= tolerance else None), distance
+
+_galerie = None
+_verrou_galerie = threading.Lock()
+
+# Galerie partagée par tout le processus, chargée au premier appel
+def obtenir_galerie(chemin_base=CHEMIN_BASE):
+    global _galerie
+    with _verrou_galerie:
+        if _galerie is None or _galerie.chemin_base != chemin_base:
+            _galerie = GalerieFaciale(chemin_base)
+            _galerie.rafraichir()
+        return _galerie
+
+# Mise à jour de la galerie après une inscription (sans effet si elle n'est pas encore chargée)
+def signaler_inscription(email, encodage, id_utilisateur=None):
+    with _verrou_galerie:
+        galerie = _galerie
+    if galerie is not None:
+        galerie.ajouter(email, encodage, id_utilisateur)
@@ -0,0 +1,201 @@
+import json
+import os
+import numpy as np
+from cache import CacheLRU, obtenir_index, version_index
+from cbir import extraire_caracteristiques
+from descripteurs import decrire_source
+from instrumentation import journal
+from moteur import calculer_distances, selection_top_k
+from stockage import ouvrir_index
+
+# Index approximatif à listes inversées (IVF) avec quantification scalaire 8 bits (SQ8) :
+# les signatures sont regroupées par k-means, seules les n_sondes listes les plus proches
+# de la requête sont parcourues, sur des vecteurs codés sur un octet par dimension.
+# Les meilleurs candidats peuvent ensuite être reclassés avec les distances exactes.
+
+EXTENSION_APPROX = ".ivf.npz"
+VERSION_APPROX = 1
+
+# Fichier de l'index approximatif associé à un index (SignaturesGlcm.idx -> SignaturesGlcm.ivf.npz)
+def chemin_index_approx(fichier_signatures):
+    return os.path.splitext(fichier_signatures)[0] + EXTENSION_APPROX
+
+# Affectation de chaque vecteur au centroïde le plus proche (euclidien), par blocs
+def _affecter(donnees, centroides, taille_bloc=65536):
+    normes_centroides = np.einsum("ij,ij->i", centroides, centroides)
+    etiquettes = np.empty(len(donnees), dtype=np.int32)
+    for debut in range(0, len(donnees), taille_bloc):
+        bloc = donnees[debut:debut + taille_bloc]
+        scores = normes_centroides - 2.0 * (bloc @ centroides.T)
+        etiquettes[debut:debut + taille_bloc] = np.argmin(scores, axis=1)
+    return etiquettes
+
+# K-means de Lloyd sur un échantillon des données
+def _kmeans(donnees, n_listes, iterations=20, echantillon=100000, graine=0):
+    generateur = np.random.default_rng(graine)
+    if len(donnees) > echantillon:
+        donnees = donnees[np.sort(generateur.choice(len(donnees), echantillon, replace=False))]
+    donnees = np.asarray(donnees, dtype=np.float32)
+    centroides = donnees[generateur.choice(len(donnees), n_listes, replace=False)].copy()
+
+    for _ in range(iterations):
+        etiquettes = _affecter(donnees, centroides)
+        comptes = np.bincount(etiquettes, minlength=n_listes)
+        sommes = np.stack([np.bincount(etiquettes, weights=donnees[:, j], minlength=n_listes)
+                           for j in range(donnees.shape[1])], axis=1)
+        non_vides = comptes > 0
+        centroides[non_vides] = (sommes[non_vides] / comptes[non_vides, None]).astype(np.float32)
+        # Les listes vides sont réinitialisées sur des points aléatoires
+        vides = np.flatnonzero(~non_vides)
+        if len(vides):
+            centroides[vides] = donnees[generateur.choice(len(donnees), len(vides), replace=False)]
+    return centroides
+
+# Construction de l'index approximatif à partir d'un fichier de signatures .idx
+def construire_index_approx(fichier_signatures, n_listes=None, iterations=20, echantillon=100000, graine=0):
+    index = ouvrir_index(fichier_signatures)
+    donnees = np.asarray(index.caracteristiques, dtype=np.float32)
+    n = len(donnees)
+    if n == 0:
+        raise ValueError(f"Index vide: {fichier_signatures}")
+
+    if n_listes is None:
+        n_listes = int(np.sqrt(n))
+    n_listes = max(1, min(n_listes, n))
+
+    centroides = _kmeans(donnees, n_listes, iterations, echantillon, graine)
+    etiquettes = _affecter(donnees, centroides)
+
+    # Identifiants des signatures regroupés par liste ; offsets[l]:offsets[l+1] = liste l
+    identifiants = np.argsort(etiquettes, kind="stable").astype(np.int64)
+    offsets = np.zeros(n_listes + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(etiquettes, minlength=n_listes))
+
+    # Quantification scalaire 8 bits par dimension
+    minimum = donnees.min(axis=0)
+    echelle = (donnees.max(axis=0) - minimum) / 255.0
+    echelle[echelle == 0] = 1.0
+    codes = np.clip(np.rint((donnees[identifiants] - minimum) / echelle), 0, 255).astype(np.uint8)
+
+    stat = os.stat(fichier_signatures)
+    entete = {
+        "version": VERSION_APPROX,
+        "source": os.path.basename(fichier_signatures),
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_taille": stat.st_size,
+        "methode": index.methode,
+        "rgb": index.rgb,
+        "dimension": index.dimension,
+        "n_listes": n_listes,
+        "quantification": "sq8",
+    }
+    fichier_approx = chemin_index_approx(fichier_signatures)
+    temporaire = f"{fichier_approx}.tmp.npz"
+    np.savez(temporaire, entete=np.array(json.dumps(entete)), centroides=centroides, offsets=offsets,
+             identifiants=identifiants, codes=codes, minimum=minimum, echelle=echelle.astype(np.float32))
+    os.replace(temporaire, fichier_approx)
+    journal.info(f"Index approximatif créé: {fichier_approx} ({n_listes} listes, {n} signatures)")
+    return fichier_approx
+
+def lire_entete_approx(fichier):
+    with np.load(fichier) as donnees:
+        return json.loads(str(donnees["entete"]))
+
+# Vrai si l'index de signatures a changé depuis la construction de l'index décrit par l'en-tête
+def _source_modifiee(entete, fichier_signatures):
+    stat = os.stat(fichier_signatures)
+    return (stat.st_mtime_ns, stat.st_size) != (entete["source_mtime_ns"], entete["source_taille"])
+
+class IndexApprox:
+    def __init__(self, fichier):
+        with np.load(fichier) as donnees:
+            self.entete = json.loads(str(donnees["entete"]))
+            self.centroides = donnees["centroides"]
+            self.offsets = donnees["offsets"]
+            self.identifiants = donnees["identifiants"]
+            self.codes = donnees["codes"]
+            self.minimum = donnees["minimum"]
+            self.echelle = donnees["echelle"]
+        self.fichier = fichier
+
+    # Vrai si l'index de signatures a changé depuis la construction
+    def est_obsolete(self, fichier_signatures):
+        return _source_modifiee(self.entete, fichier_signatures)
+
+    # Renvoie (identifiants, distances) des k plus proches voisins approximatifs.
+    # n_sondes règle le compromis précision/vitesse ; avec des caractéristiques exactes,
+    # les reclassement * k meilleurs candidats sont reclassés avec les vraies distances.
+    def rechercher(self, requete, distance="euclidienne", k=5, n_sondes=8, caracteristiques=None, reclassement=4):
+        requete = np.asarray(requete, dtype=np.float32).ravel()
+        n_sondes = max(1, min(n_sondes, len(self.centroides)))
+        listes = selection_top_k(calculer_distances(requete, self.centroides, distance), n_sondes)
+
+        positions = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in listes])
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        approximations = self.codes[positions].astype(np.float32) * self.echelle + self.minimum
+        distances = calculer_distances(requete, approximations, distance)
+        candidats = self.identifiants[positions]
+
+        if caracteristiques is not None and reclassement:
+            meilleurs = selection_top_k(distances, k * reclassement)
+            candidats = candidats[meilleurs]
+            distances = calculer_distances(requete, caracteristiques[np.sort(candidats)], distance)
+            candidats = np.sort(candidats)
+
+        meilleurs = selection_top_k(distances, k)
+        return candidats[meilleurs], distances[meilleurs]
+
+# Index approximatifs chargés (peu nombreux, petits par rapport aux signatures)
+_cache_approx = CacheLRU(8)
+
+# Index approximatif d'un index de signatures ; construit s'il manque, reconstruit si l'index a changé
+# depuis (ses identifiants ne correspondraient plus aux lignes). La clé du cache comprend la version
+# de l'index source : un index chargé n'est jamais utilisé avec des signatures réécrites depuis
+def obtenir_index_approx(fichier_signatures):
+    fichier_approx = chemin_index_approx(fichier_signatures)
+    if not os.path.exists(fichier_approx):
+        construire_index_approx(fichier_signatures)
+    stat = os.stat(fichier_approx)
+    cle = (os.path.abspath(fichier_approx), stat.st_mtime_ns, version_index(fichier_signatures))
+    approx = _cache_approx.obtenir(cle)
+    if approx is None:
+        if _source_modifiee(lire_entete_approx(fichier_approx), fichier_signatures):
+            journal.info(f"Index approximatif de {fichier_signatures} antérieur à l'index, reconstruction")
+            construire_index_approx(fichier_signatures)
+            return obtenir_index_approx(fichier_signatures)
+        approx = IndexApprox(fichier_approx)
+        _cache_approx.ajouter(cle, approx)
+    return approx
+
+# Recherche approximative par vecteur de caractéristiques : liste de (chemin, distance)
+def rechercher_vecteur_approx(requete, fichier_signatures, distance="euclidienne", k=5, n_sondes=8, reclassement=4):
+    index = obtenir_index(fichier_signatures)
+    approx = obtenir_index_approx(fichier_signatures)
+    identifiants, distances = approx.rechercher(requete, distance, k, n_sondes, index.caracteristiques, reclassement)
+    chemins = index.chemins
+    return [(chemins[i], float(d)) for i, d in zip(identifiants, distances)]
+
+# Même API que rechercher_image, avec l'index approximatif
+def rechercher_image_approx(image_query, fichier_signatures, distance="euclidienne", k=5, n_sondes=8, reclassement=4):
+    try:
+        index = obtenir_index(fichier_signatures)
+        obtenir_index_approx(fichier_signatures)
+    except Exception as e:
+        journal.error(f"Erreur lors du chargement des signatures: {e}")
+        return []
+
+    query_features = extraire_caracteristiques(image_query, index.methode, index.rgb, index.profil)
+    if query_features is None:
+        journal.warning(f"Impossible d'extraire les caractéristiques de l'image requête: {decrire_source(image_query)}")
+        return []
+    if len(query_features) != index.dimension:
+        journal.warning(f"Incompatibilité de dimensions: Query={len(query_features)}, Stockée={index.dimension}")
+        return []
+
+    try:
+        return rechercher_vecteur_approx(query_features, fichier_signatures, distance, k, n_sondes, reclassement)
+    except ValueError as e:
+        journal.error(f"Erreur lors de la comparaison: {e}")
+        return []
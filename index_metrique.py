@@ -0,0 +1,225 @@
+import heapq
+import json
+import os
+import numpy as np
+from cache import CacheLRU, obtenir_index, version_index
+from cbir import extraire_caracteristiques
+from descripteurs import decrire_source
+from instrumentation import journal, mesurer
+from moteur import DISTANCES, calculer_distances
+from stockage import ouvrir_index
+
+# Index exact par arbre de points de vue (VP-tree) : chaque noeud partage ses signatures selon leur
+# distance à un point de vue et garde, pour chaque enfant, l'intervalle [min, max] de ces distances.
+# Les quatre distances étant des métriques, l'inégalité triangulaire donne une borne inférieure de la
+# distance entre la requête et tout un sous-arbre : les sous-arbres qui ne peuvent pas améliorer le
+# k-ième voisin courant sont ignorés. Les feuilles (TAILLE_FEUILLE signatures contiguës) sont
+# parcourues avec le calcul vectorisé habituel ; le résultat est celui de la recherche exhaustive.
+# Un arbre par distance : SignaturesGlcm.idx -> SignaturesGlcm.vpt_euclidienne.npz
+
+VERSION_METRIQUE = 1
+TAILLE_FEUILLE = 256
+
+# Marge relative sur les bornes : les distances sont calculées en flottants, l'inégalité triangulaire
+# n'est exacte qu'à l'arrondi près ; la marge évite d'écarter un voisin à égalité
+MARGE_ARRONDI = 1e-5
+
+def chemin_index_metrique(fichier_signatures, distance="euclidienne"):
+    return f"{os.path.splitext(fichier_signatures)[0]}.vpt_{distance}.npz"
+
+# Construction de l'arbre sur une matrice (n x dimension). Renvoie les tableaux de l'arbre :
+# ordre (permutation des lignes : chaque feuille est une plage contiguë), points de vue, enfants,
+# bornes des distances des enfants au point de vue, plages des feuilles
+def construire_arbre(donnees, distance="euclidienne", taille_feuille=TAILLE_FEUILLE, graine=0):
+    if distance not in DISTANCES:
+        raise ValueError("Méthode de distance non reconnue")
+    generateur = np.random.default_rng(graine)
+    n, dimension = donnees.shape
+    ordre = np.arange(n, dtype=np.int64)
+    points_de_vue, enfants, bornes, plages = [], [], [], []
+
+    def nouveau_noeud(debut, fin):
+        points_de_vue.append(np.zeros(dimension, dtype=np.float32))
+        enfants.append((-1, -1))
+        bornes.append(((0.0, 0.0), (0.0, 0.0)))
+        plages.append((debut, fin))
+        return len(plages) - 1
+
+    pile = [nouveau_noeud(0, n)]
+    while pile:
+        noeud = pile.pop()
+        debut, fin = plages[noeud]
+        if fin - debut <= taille_feuille:
+            continue
+        lignes = ordre[debut:fin]
+        bloc = donnees[lignes]
+        # Point de vue : la signature la plus éloignée d'une signature tirée au hasard (en périphérie)
+        depart = bloc[generateur.integers(len(bloc))]
+        point_de_vue = bloc[int(np.argmax(calculer_distances(depart, bloc, distance)))].copy()
+        distances = calculer_distances(point_de_vue, bloc, distance)
+
+        # Partage à la médiane : plus proches dans l'enfant gauche, plus éloignées dans le droit
+        milieu = len(lignes) // 2
+        rangs = np.argpartition(distances, milieu)
+        ordre[debut:fin] = lignes[rangs]
+        distances = distances[rangs]
+        if distances.min() == distances.max():
+            # Toutes les signatures à la même distance (doublons) : la feuille reste telle quelle
+            continue
+
+        points_de_vue[noeud] = point_de_vue
+        gauche = nouveau_noeud(debut, debut + milieu)
+        droite = nouveau_noeud(debut + milieu, fin)
+        enfants[noeud] = (gauche, droite)
+        bornes[noeud] = ((distances[:milieu].min(), distances[:milieu].max()),
+                         (distances[milieu:].min(), distances[milieu:].max()))
+        pile.extend((gauche, droite))
+
+    return {
+        "ordre": ordre,
+        "points_de_vue": np.asarray(points_de_vue, dtype=np.float32).reshape(-1, dimension),
+        "enfants": np.asarray(enfants, dtype=np.int64),
+        "bornes": np.asarray(bornes, dtype=np.float64),
+        "plages": np.asarray(plages, dtype=np.int64),
+    }
+
+# Construction et écriture de l'arbre d'un fichier de signatures .idx pour une distance
+def construire_index_metrique(fichier_signatures, distance="euclidienne", taille_feuille=TAILLE_FEUILLE, graine=0):
+    index = ouvrir_index(fichier_signatures)
+    if len(index) == 0:
+        raise ValueError(f"Index vide: {fichier_signatures}")
+    with mesurer("construction_vpt"):
+        arbre = construire_arbre(np.asarray(index.caracteristiques), distance, taille_feuille, graine)
+
+    stat = os.stat(fichier_signatures)
+    entete = {
+        "version": VERSION_METRIQUE,
+        "source": os.path.basename(fichier_signatures),
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_taille": stat.st_size,
+        "distance": distance,
+        "dimension": index.dimension,
+        "taille_feuille": taille_feuille,
+    }
+    fichier_metrique = chemin_index_metrique(fichier_signatures, distance)
+    temporaire = f"{fichier_metrique}.tmp.npz"
+    np.savez(temporaire, entete=np.array(json.dumps(entete)), **arbre)
+    os.replace(temporaire, fichier_metrique)
+    journal.info(f"Index métrique créé: {fichier_metrique} ({len(arbre['plages'])} noeuds, {len(index)} signatures)")
+    return fichier_metrique
+
+def lire_entete_metrique(fichier):
+    with np.load(fichier) as donnees:
+        return json.loads(str(donnees["entete"]))
+
+# Vrai si l'index de signatures a changé depuis la construction de l'arbre décrit par l'en-tête
+def _source_modifiee(entete, fichier_signatures):
+    stat = os.stat(fichier_signatures)
+    return (stat.st_mtime_ns, stat.st_size) != (entete["source_mtime_ns"], entete["source_taille"])
+
+class IndexMetrique:
+    # caracteristiques : matrice de l'index source, recopiée dans l'ordre des feuilles
+    def __init__(self, fichier, caracteristiques):
+        with np.load(fichier) as donnees:
+            self.entete = json.loads(str(donnees["entete"]))
+            self.ordre = donnees["ordre"]
+            self.points_de_vue = donnees["points_de_vue"]
+            self.enfants = donnees["enfants"]
+            self.bornes = donnees["bornes"]
+            self.plages = donnees["plages"]
+        self.fichier = fichier
+        self.distance = self.entete["distance"]
+        self.donnees = np.ascontiguousarray(caracteristiques[self.ordre], dtype=np.float32)
+
+    # Vrai si l'index de signatures a changé depuis la construction
+    def est_obsolete(self, fichier_signatures):
+        return _source_modifiee(self.entete, fichier_signatures)
+
+    # k plus proches voisins exacts : (identifiants dans l'index source, distances, signatures évaluées).
+    # Parcours du meilleur d'abord : les noeuds sont visités par borne inférieure croissante
+    def rechercher(self, requete, k=5):
+        requete = np.asarray(requete, dtype=np.float32).ravel()
+        identifiants = np.empty(0, dtype=np.int64)
+        distances = np.empty(0, dtype=np.float64)
+        rayon = np.inf
+        evaluees = 0
+        file = [(0.0, 0)]
+        while file:
+            borne, noeud = heapq.heappop(file)
+            if borne > rayon:
+                break
+            gauche, droite = self.enfants[noeud]
+            if gauche < 0:
+                debut, fin = self.plages[noeud]
+                evaluees += fin - debut
+                identifiants = np.concatenate([identifiants, self.ordre[debut:fin]])
+                distances = np.concatenate([distances, calculer_distances(requete, self.donnees[debut:fin],
+                                                                          self.distance)])
+                if len(distances) >= k:
+                    # Egalités départagées par l'ordre de l'index, comme la recherche exhaustive
+                    garder = np.lexsort((identifiants, distances))[:k]
+                    identifiants, distances = identifiants[garder], distances[garder]
+                    rayon = distances[-1]
+                continue
+
+            distance_vue = calculer_distances(requete, self.points_de_vue[noeud:noeud + 1], self.distance)[0]
+            for enfant, (minimum, maximum) in ((gauche, self.bornes[noeud, 0]), (droite, self.bornes[noeud, 1])):
+                marge = MARGE_ARRONDI * (distance_vue + maximum)
+                borne_enfant = max(borne, minimum - distance_vue - marge, distance_vue - maximum - marge, 0.0)
+                if borne_enfant <= rayon:
+                    heapq.heappush(file, (borne_enfant, int(enfant)))
+
+        ordre = np.lexsort((identifiants, distances))[:k]
+        return identifiants[ordre], distances[ordre], evaluees
+
+# Index métriques chargés (une copie des signatures chacun)
+_cache_metrique = CacheLRU(4)
+
+# Arbre d'un index pour une distance ; construit s'il manque ou si l'index a changé depuis.
+# La clé du cache comprend la version de l'index source : un arbre chargé n'est jamais utilisé
+# avec des signatures réécrites depuis (mise à jour en arrière-plan par exemple)
+def obtenir_index_metrique(fichier_signatures, distance="euclidienne"):
+    fichier_metrique = chemin_index_metrique(fichier_signatures, distance)
+    if not os.path.exists(fichier_metrique):
+        construire_index_metrique(fichier_signatures, distance)
+    stat = os.stat(fichier_metrique)
+    cle = (os.path.abspath(fichier_metrique), stat.st_mtime_ns, version_index(fichier_signatures))
+    metrique = _cache_metrique.obtenir(cle)
+    if metrique is None:
+        # Vérifié avant le chargement : l'ordre d'un arbre obsolète ne correspond plus aux signatures
+        if _source_modifiee(lire_entete_metrique(fichier_metrique), fichier_signatures):
+            journal.info(f"Index métrique de {fichier_signatures} antérieur à l'index, reconstruction")
+            construire_index_metrique(fichier_signatures, distance)
+            return obtenir_index_metrique(fichier_signatures, distance)
+        metrique = IndexMetrique(fichier_metrique, obtenir_index(fichier_signatures).caracteristiques)
+        _cache_metrique.ajouter(cle, metrique)
+    return metrique
+
+# Recherche exacte par vecteur de caractéristiques : liste de (chemin, distance)
+def rechercher_vecteur_metrique(requete, fichier_signatures, distance="euclidienne", k=5):
+    index = obtenir_index(fichier_signatures)
+    identifiants, distances, _ = obtenir_index_metrique(fichier_signatures, distance).rechercher(requete, k)
+    chemins = index.chemins
+    return [(chemins[i], float(d)) for i, d in zip(identifiants, distances)]
+
+# Même API et mêmes résultats que rechercher_image, avec l'arbre de la distance choisie
+def rechercher_image_metrique(image_query, fichier_signatures, distance="euclidienne", k=5):
+    try:
+        index = obtenir_index(fichier_signatures)
+    except Exception as e:
+        journal.error(f"Erreur lors du chargement des signatures: {e}")
+        return []
+
+    query_features = extraire_caracteristiques(image_query, index.methode, index.rgb, index.profil)
+    if query_features is None:
+        journal.warning(f"Impossible d'extraire les caractéristiques de l'image requête: {decrire_source(image_query)}")
+        return []
+    if len(query_features) != index.dimension:
+        journal.warning(f"Incompatibilité de dimensions: Query={len(query_features)}, Stockée={index.dimension}")
+        return []
+
+    try:
+        return rechercher_vecteur_metrique(query_features, fichier_signatures, distance, k)
+    except ValueError as e:
+        journal.error(f"Erreur lors de la comparaison: {e}")
+        return []
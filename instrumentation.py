@@ -0,0 +1,125 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Instrumentation de l'indexation et de la recherche :
+# - durées cumulées par étape (décodage, descripteurs, distances, sélection...) et compteurs ;
+# - journal "cbir" (niveau via CBIR_VERBOSITE, format texte ou json via CBIR_JOURNAL_FORMAT).
+
+journal = logging.getLogger("cbir")
+
+class Metriques:
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._durees = {}
+        self._compteurs = {}
+
+    def ajouter_duree(self, etape, duree):
+        with self._verrou:
+            n, total, maximum = self._durees.get(etape, (0, 0.0, 0.0))
+            self._durees[etape] = (n + 1, total + duree, max(maximum, duree))
+
+    def incrementer(self, compteur, valeur=1):
+        with self._verrou:
+            self._compteurs[compteur] = self._compteurs.get(compteur, 0) + valeur
+
+    # Données brutes, transmissibles entre processus et fusionnables
+    def brut(self):
+        with self._verrou:
+            return {"durees": dict(self._durees), "compteurs": dict(self._compteurs)}
+
+    def fusionner(self, brut):
+        with self._verrou:
+            for etape, (n, total, maximum) in brut["durees"].items():
+                n0, total0, maximum0 = self._durees.get(etape, (0, 0.0, 0.0))
+                self._durees[etape] = (n0 + n, total0 + total, max(maximum0, maximum))
+            for compteur, valeur in brut["compteurs"].items():
+                self._compteurs[compteur] = self._compteurs.get(compteur, 0) + valeur
+
+    def instantane(self):
+        brut = self.brut()
+        return {
+            "durees": {
+                etape: {"appels": n, "total_s": total, "moyenne_ms": total / n * 1000, "max_ms": maximum * 1000}
+                for etape, (n, total, maximum) in sorted(brut["durees"].items())
+            },
+            "compteurs": dict(sorted(brut["compteurs"].items())),
+        }
+
+    def reinitialiser(self):
+        with self._verrou:
+            self._durees.clear()
+            self._compteurs.clear()
+
+# Métriques globales du processus
+metriques = Metriques()
+
+# Collecteur courant (par thread) : les métriques globales, sauf dans un bloc collecte()
+_local = threading.local()
+
+def collecteur():
+    return getattr(_local, "collecteur", metriques)
+
+# Mesure la durée d'un bloc dans le collecteur courant
+@contextlib.contextmanager
+def mesurer(etape):
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        collecteur().ajouter_duree(etape, time.perf_counter() - debut)
+
+def incrementer(compteur, valeur=1):
+    collecteur().incrementer(compteur, valeur)
+
+# Collecte isolée (une extraction, une requête, un fichier traité dans un processus du pool).
+# Avec fusion, les mesures sont ensuite ajoutées au collecteur englobant.
+@contextlib.contextmanager
+def collecte(fusion=False):
+    precedent = getattr(_local, "collecteur", None)
+    local = Metriques()
+    _local.collecteur = local
+    try:
+        yield local
+    finally:
+        if precedent is None:
+            del _local.collecteur
+        else:
+            _local.collecteur = precedent
+        if fusion:
+            collecteur().fusionner(local.brut())
+
+#---------------------Journal-------------------------------
+
+class FormatteurJson(logging.Formatter):
+    def format(self, record):
+        ligne = {
+            "temps": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "niveau": record.levelname,
+            "message": record.getMessage(),
+        }
+        ligne.update(getattr(record, "champs", {}))
+        return json.dumps(ligne, ensure_ascii=False, default=str)
+
+# Configuration du journal "cbir" ; sans argument, lit CBIR_VERBOSITE et CBIR_JOURNAL_FORMAT
+def configurer_journal(niveau=None, format_journal=None):
+    niveau = niveau or os.environ.get("CBIR_VERBOSITE", "INFO")
+    format_journal = format_journal or os.environ.get("CBIR_JOURNAL_FORMAT", "texte")
+    for handler in list(journal.handlers):
+        journal.removeHandler(handler)
+    handler = logging.StreamHandler()
+    handler.setFormatter(FormatteurJson() if format_journal == "json" else logging.Formatter("%(message)s"))
+    journal.addHandler(handler)
+    journal.setLevel(niveau.upper() if isinstance(niveau, str) else niveau)
+    journal.propagate = False
+
+# Message de journal avec champs structurés (repris tels quels en format json)
+def journaliser(niveau, message, **champs):
+    if journal.isEnabledFor(niveau):
+        journal.log(niveau, message, extra={"champs": champs})
+
+if not journal.handlers:
+    configurer_journal()
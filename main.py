@@ -1,14 +1,20 @@
-import sqlite3
 import cv2
 import numpy as np
 import streamlit as st
-import pandas as pd
 from auth import enregistrer_utilisateur, authentification_par_facial, authentifier_utilisateur
-from cbir import extraction_signatures, rechercher_image
-from db import creer_base_donnees, verifier_structure_projet
+from cbir import extraction_signatures, mise_a_jour_signatures, rechercher_image
+from descripteurs import PROFILS, PROFIL_DEFAUT, nom_profil, empreinte_source
+from fragments import chemin_fragments, fragments_a_jour, rechercher_image_fragments
+from stockage import convertir_npy, decodage_obsolete, lire_entete
+from instrumentation import metriques
+from cache import etat_cache_index, etat_caches_requetes
+from db import creer_base_donnees, verifier_structure_projet, lister_utilisateurs
 from utils import preprocess_image_for_face_recognition
+from vignettes import mettre_a_jour_vignettes, obtenir_vignette
+from constructions import obtenir_gestionnaire, formater_duree
+from service import URL_SERVICE, ClientRecherche
 import os
-import tempfile
+import time
 
 # Fonction pour initialiser la session
 def init_session():
@@ -96,18 +102,45 @@ def interface_connexion():
 
 def inspecter_utilisateurs():
     try:
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT nom_utilisateur, email, descripteur_facial FROM utilisateurs")
-        utilisateurs = cursor.fetchall()
+        utilisateurs = lister_utilisateurs()
         print(f"Nombre d'utilisateurs: {len(utilisateurs)}")
         for utilisateur in utilisateurs:
             print(f"Nom: {utilisateur[0]}, Email: {utilisateur[1]}, Descripteur: {len(utilisateur[2]) if utilisateur[2] else 'Non défini'}")
-        conn.close()
     except Exception as e:
         print(f"Erreur lors de l'inspection des utilisateurs: {e}")
 
 
+# Construction (ou mise à jour) de l'index en arrière-plan, vignettes comprises ; une seule
+# construction par fichier d'index, partagée par les sessions qui la demandent en même temps
+def lancer_construction(signatures_file, methode, use_rgb, profil, mise_a_jour=False):
+    def construire(progression):
+        if mise_a_jour:
+            fichier = mise_a_jour_signatures("./dataSet", methode, use_rgb, n_processus=None, profil=profil,
+                                             progression=progression)
+        else:
+            fichier = extraction_signatures("./dataSet", methode, use_rgb, n_processus=None, profil=profil,
+                                            progression=progression)
+        if not fichier:
+            raise RuntimeError("Échec de la génération des signatures.")
+        mettre_a_jour_vignettes("./dataSet", n_processus=None)
+        return fichier
+    return obtenir_gestionnaire().lancer(signatures_file, construire)
+
+# Etat d'une construction : barre de progression et temps restant estimé
+def afficher_construction(construction):
+    etat = construction.instantane()
+    if etat["etat"] == "echec":
+        st.error(f"Erreur lors de la construction de l'index : {etat['erreur']}")
+    elif etat["etat"] == "terminee":
+        st.caption(f"Index construit en {formater_duree(etat['ecoule_s'])}.")
+    elif etat["etat"] == "en_attente":
+        st.info("Construction de l'index en attente...")
+    else:
+        texte = f"Construction de l'index : {etat['faits']}"
+        if etat["total"]:
+            texte += f" / {etat['total']} images, temps restant estimé {formater_duree(etat['restant_s'])}"
+        st.progress(etat["fraction"] or 0.0, text=texte)
+
 def interface_application():
     if not st.session_state["connected"]:
         st.warning("Veuillez vous connecter pour accéder à la recherche d'images.")
@@ -133,6 +166,24 @@ def interface_application():
         
         # Utiliser RGB ou non
         use_rgb = st.checkbox("Utiliser RGB", value=True)
+        
+        # Nom du fichier de signatures attendu
+        suffix = "_rgb" if use_rgb else ""
+        signatures_file = f"Signatures{signature_type.capitalize().replace(' (tous)', '')}{suffix}.idx"
+        
+        # Profil d'extraction utilisé pour générer ou reconstruire l'index ; par défaut celui de l'index
+        # existant : une mise à jour reste incrémentale et ne reconstruit tout l'index que si un autre
+        # profil est choisi
+        profil_existant = PROFIL_DEFAUT
+        if os.path.exists(signatures_file):
+            profil_existant = nom_profil(lire_entete(signatures_file)[0].get("profil"))
+        noms_profils = list(PROFILS) if profil_existant in PROFILS else list(PROFILS) + [profil_existant]
+        profil = st.selectbox(
+            "Profil d'extraction",
+            noms_profils,
+            index=noms_profils.index(profil_existant),
+            help="Réduction de la taille et des niveaux de gris des images avant le calcul des descripteurs"
+        )
     
     with col2:
         # Choix de la méthode de distance
@@ -154,50 +205,88 @@ def interface_application():
     }
     methode = methode_map[signature_type]
     
-    # Nom du fichier de signatures attendu
-    suffix = "_rgb" if use_rgb else ""
-    signatures_file = f"Signatures{signature_type.capitalize().replace(' (tous)', '')}{suffix}.npy"
+    # Conversion d'un ancien fichier de signatures .npy vers le format .idx. Les anciennes signatures en
+    # niveaux de gris ne correspondent plus à l'extraction des requêtes : elles doivent être réextraites
+    ancien_fichier = signatures_file[:-len(".idx")] + ".npy"
+    if not os.path.exists(signatures_file) and os.path.exists(ancien_fichier):
+        if not use_rgb:
+            st.warning(f"'{ancien_fichier}' (niveaux de gris) n'est pas converti : générez à nouveau les signatures.")
+        else:
+            try:
+                convertir_npy(ancien_fichier, signatures_file, methode, use_rgb)
+            except Exception as e:
+                st.error(f"Erreur lors de la conversion de '{ancien_fichier}' : {e}")
+    if os.path.exists(signatures_file) and decodage_obsolete(lire_entete(signatures_file)[0]):
+        st.warning(f"'{signatures_file}' a été converti d'un ancien fichier .npy en niveaux de gris : "
+                   "mettez à jour l'index pour le réextraire.")
     
     # Information sur les signatures disponibles
     st.info(f"Utilisation du descripteur: {signature_type}{' (RGB)' if use_rgb else ''}")
+    if os.path.exists(signatures_file):
+        st.caption(f"Profil de l'index existant : {profil_existant} (les requêtes utilisent ce profil)")
+    
+    # Mise à jour incrémentale de l'index (seules les images ajoutées/modifiées sont extraites), en
+    # arrière-plan : l'index actuel reste utilisé jusqu'à son remplacement par le nouveau fichier
+    construction = obtenir_gestionnaire().construction(signatures_file)
+    if os.path.exists(signatures_file) and st.button("Mettre à jour l'index"):
+        # Profil transmis seulement s'il a été changé (sinon celui de l'index est conservé)
+        construction = lancer_construction(signatures_file, methode, use_rgb,
+                                           None if profil == profil_existant else profil, mise_a_jour=True)
+    if construction is not None:
+        afficher_construction(construction)
+        if not construction.terminee:
+            st.button("Actualiser la progression")
     
     # Téléchargement de l'image de requête
     image_query = st.file_uploader("Téléversez une image pour la recherche", type=["jpg", "png", "jpeg", "bmp"])
 
     if image_query:
         try:
-            # Lire l'image téléchargée
-            image = cv2.imdecode(np.frombuffer(image_query.read(), np.uint8), cv2.IMREAD_COLOR)
-            if image is None:
-                st.error("Impossible de charger l'image.")
-                return
+            # Contenu de l'image téléchargée ; la recherche le décode elle-même et mémorise
+            # caractéristiques et résultats d'après son empreinte (changement de k ou de distance immédiat)
+            contenu = image_query.getvalue()
+            empreinte = empreinte_source(contenu)
+            if st.session_state.get("requete_valide") != empreinte:
+                if cv2.imdecode(np.frombuffer(contenu, np.uint8), cv2.IMREAD_COLOR) is None:
+                    st.error("Impossible de charger l'image.")
+                    return
+                st.session_state["requete_valide"] = empreinte
             
             # Afficher l'image de requête
-            st.image(image, caption="Image de requête")
+            st.image(contenu, caption="Image de requête")
             
-            # Sauvegarder temporairement l'image pour le traitement
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-                temp_path = temp_file.name
-                cv2.imwrite(temp_path, image)
-            
-            # Vérifier si le fichier de signatures existe sinon le générer
+            # Vérifier si le fichier de signatures existe sinon le générer en arrière-plan ;
+            # la page se rafraîchit jusqu'à ce que l'index soit disponible
             if not os.path.exists(signatures_file):
                 st.warning(f"Base de signatures '{signatures_file}' non trouvée. Génération en cours...")
-                with st.spinner("Extraction des caractéristiques..."):
-                    try:
-                        signatures_file = extraction_signatures("./dataSet", methode, use_rgb)
-                        if signatures_file:
-                            st.success(f"Signatures générées avec succès!")
-                        else:
-                            st.error("Échec de la génération des signatures.")
-                            return
-                    except Exception as e:
-                        st.error(f"Erreur lors de la génération des signatures : {e}")
-                        return
+                if construction is not None and construction.etat == "echec" and not st.button("Relancer la construction"):
+                    return
+                construction = lancer_construction(signatures_file, methode, use_rgb, profil)
+                if not construction.terminee:
+                    time.sleep(1)
+                    st.rerun()
+                return
             
             # Recherche d'images
             with st.spinner("Recherche en cours..."):
-                resultats = rechercher_image(temp_path, signatures_file, distance, k_results)
+                # Index fragmenté (python -m fragments creer ...) s'il existe et reflète encore l'index
+                # (ignoré après une mise à jour ou une reconstruction), recherche parallèle
+                fichier_fragments = chemin_fragments(signatures_file)
+                avec_fragments = os.path.exists(fichier_fragments) and fragments_a_jour(fichier_fragments)
+                resultats = None
+                # Service de recherche (python -m service) si CBIR_SERVICE_URL est défini : index résidents
+                # et requêtes simultanées regroupées ; recherche dans ce processus s'il ne répond pas
+                if URL_SERVICE:
+                    fichier_recherche = fichier_fragments if avec_fragments else signatures_file
+                    try:
+                        resultats = ClientRecherche().rechercher(contenu, fichier_recherche, distance, k_results)
+                    except (OSError, ValueError) as e:
+                        # ValueError : requête refusée par le service (fichier hors de sa racine, index invalide...)
+                        st.warning(f"Service de recherche indisponible ({e}), recherche locale.")
+                if resultats is None and avec_fragments:
+                    resultats = rechercher_image_fragments(contenu, fichier_fragments, distance, k_results)
+                elif resultats is None:
+                    resultats = rechercher_image(contenu, signatures_file, distance, k_results)
             
             if not resultats:
                 st.warning("Aucun résultat trouvé.")
@@ -214,10 +303,10 @@ def interface_application():
                         try:
                             img_path = os.path.join("./dataSet", chemin)
                             if os.path.exists(img_path):
-                                img = cv2.imread(img_path)
-                                if img is not None:
-                                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                                    st.image(img, caption=f"Distance: {score:.2f}")
+                                # Vignette JPEG précalculée, transmise telle quelle au navigateur
+                                vignette = obtenir_vignette("./dataSet", chemin)
+                                if vignette is not None:
+                                    st.image(vignette, caption=f"Distance: {score:.2f}")
                                     st.text(os.path.basename(chemin))
                                 else:
                                     st.error(f"Impossible de charger {os.path.basename(chemin)}")
@@ -227,12 +316,11 @@ def interface_application():
                             st.error(f"Erreur: {e}")
         except Exception as e:
             st.error(f"Erreur lors de la recherche : {e}")
-        finally:
-            if 'temp_path' in locals():
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
+    
+    # Temps cumulés par étape et compteurs du processus (indexation et recherche)
+    with st.expander("Métriques"):
+        st.json(metriques.instantane())
+        st.json({"index": etat_cache_index(), "requetes": etat_caches_requetes()})
 
 if __name__ == "__main__":
     # Initialisation de la base de données
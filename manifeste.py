@@ -0,0 +1,73 @@
+import csv
+import hashlib
+import os
+
+COLONNES = ["chemin", "taille", "mtime_ns", "hash"]
+
+# Fichier manifeste associé à un index (SignaturesGlcm.npy -> SignaturesGlcm_manifeste.csv)
+def chemin_manifeste(fichier_signatures):
+    base = os.path.splitext(fichier_signatures)[0]
+    return f"{base}_manifeste.csv"
+
+# Empreinte du contenu d'un fichier
+def hash_fichier(chemin, taille_bloc=1 << 20):
+    empreinte = hashlib.blake2b(digest_size=16)
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b""):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+# Etat actuel des images : {chemin relatif: (taille, mtime_ns, hash)}.
+# Avec avec_hash, le contenu n'est relu que pour les fichiers dont la taille ou la date a changé
+# par rapport au manifeste précédent ; un fichier simplement « touché » garde alors son hash.
+def scanner_dossier(chemin_dossier, chemins_relatifs, avec_hash=False, precedent=None):
+    precedent = precedent or {}
+    etat = {}
+    for path_relative in chemins_relatifs:
+        path = os.path.join(chemin_dossier, path_relative)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        taille, mtime_ns = stat.st_size, stat.st_mtime_ns
+        empreinte = ""
+        if avec_hash:
+            ancien = precedent.get(path_relative)
+            if ancien and ancien[0] == taille and ancien[1] == mtime_ns and ancien[2]:
+                empreinte = ancien[2]
+            else:
+                empreinte = hash_fichier(path)
+        etat[path_relative] = (taille, mtime_ns, empreinte)
+    return etat
+
+def lire_manifeste(fichier):
+    entrees = {}
+    with open(fichier, newline="", encoding="utf-8") as f:
+        for ligne in csv.DictReader(f):
+            entrees[ligne["chemin"]] = (int(ligne["taille"]), int(ligne["mtime_ns"]), ligne["hash"])
+    return entrees
+
+# Ecriture via un fichier temporaire pour ne jamais laisser un manifeste tronqué
+def ecrire_manifeste(fichier, entrees):
+    temporaire = f"{fichier}.tmp"
+    with open(temporaire, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLONNES)
+        for path_relative, (taille, mtime_ns, empreinte) in entrees.items():
+            writer.writerow([path_relative, taille, mtime_ns, empreinte])
+    os.replace(temporaire, fichier)
+
+# Différences entre le manifeste de l'index et l'état du dossier : (nouveaux, modifiés, supprimés)
+def comparer_manifestes(ancien, actuel):
+    nouveaux, modifies = [], []
+    for path_relative, (taille, mtime_ns, empreinte) in actuel.items():
+        entree = ancien.get(path_relative)
+        if entree is None:
+            nouveaux.append(path_relative)
+        elif empreinte and entree[2]:
+            if empreinte != entree[2]:
+                modifies.append(path_relative)
+        elif (taille, mtime_ns) != entree[:2]:
+            modifies.append(path_relative)
+    supprimes = [path_relative for path_relative in ancien if path_relative not in actuel]
+    return nouveaux, modifies, supprimes
@@ -0,0 +1,182 @@
+import numpy as np
+from instrumentation import journal, mesurer
+
+# Nombre de lignes traitées par bloc lors du calcul des distances (limite la mémoire temporaire)
+TAILLE_BLOC_DEFAUT = 65536
+# Bloc plus petit pour les recherches groupées : il reste en cache pendant le passage de toutes les requêtes
+TAILLE_BLOC_LOT = 4096
+
+DISTANCES = ("euclidienne", "manhattan", "tchebychev", "canberra")
+
+# Conversion du tableau de signatures (objet : caractéristiques + chemin) en matrice float32 contiguë
+def preparer_matrice(signatures, dimension=None):
+    if len(signatures) == 0:
+        return np.empty((0, dimension or 0), dtype=np.float32), []
+
+    if dimension is None:
+        dimension = len(signatures[0]) - 1
+
+    lignes = []
+    chemins = []
+    ignorees = 0
+    for signature in signatures:
+        if len(signature) - 1 != dimension:
+            ignorees += 1
+            continue
+        lignes.append(signature[:-1])
+        chemins.append(signature[-1])
+
+    if ignorees:
+        journal.warning(f"{ignorees} signatures ignorées (dimension différente de {dimension})")
+
+    if not lignes:
+        return np.empty((0, dimension), dtype=np.float32), []
+
+    matrice = np.ascontiguousarray(np.asarray(lignes, dtype=np.float32))
+    return matrice, chemins
+
+# Calcul d'une distance entre un bloc de caractéristiques et la requête
+def _distances_bloc(bloc, requete, methode):
+    diff = bloc - requete
+    np.abs(diff, out=diff)
+
+    if methode == "euclidienne":
+        return np.sqrt(np.einsum("ij,ij->i", diff, diff, dtype=np.float64))
+    elif methode == "manhattan":
+        return diff.sum(axis=1, dtype=np.float64)
+    elif methode == "tchebychev":
+        return diff.max(axis=1).astype(np.float64)
+    elif methode == "canberra":
+        denominateur = np.abs(bloc) + np.abs(requete)
+        # Comme scipy : les termes 0/0 sont ignorés
+        with np.errstate(divide="ignore", invalid="ignore"):
+            termes = np.where(denominateur > 0, diff / denominateur, 0.0)
+        return termes.sum(axis=1, dtype=np.float64)
+    else:
+        raise ValueError("Méthode de distance non reconnue")
+
+# Distances entre la requête et toutes les lignes de la matrice, par blocs
+def calculer_distances(requete, matrice, methode="euclidienne", taille_bloc=TAILLE_BLOC_DEFAUT):
+    if methode not in DISTANCES:
+        raise ValueError("Méthode de distance non reconnue")
+
+    requete = np.asarray(requete, dtype=np.float32).ravel()
+    if matrice.shape[1] != requete.shape[0]:
+        raise ValueError(f"Incompatibilité de dimensions: Query={requete.shape[0]}, Stockée={matrice.shape[1]}")
+
+    n = matrice.shape[0]
+    if not taille_bloc or taille_bloc >= n:
+        return _distances_bloc(matrice, requete, methode)
+
+    distances = np.empty(n, dtype=np.float64)
+    for debut in range(0, n, taille_bloc):
+        fin = min(debut + taille_bloc, n)
+        distances[debut:fin] = _distances_bloc(matrice[debut:fin], requete, methode)
+    return distances
+
+# Distances ligne à ligne entre deux matrices de même forme (mêmes calculs que calculer_distances)
+def distances_paires(lignes, autres, methode="euclidienne"):
+    if methode not in DISTANCES:
+        raise ValueError("Méthode de distance non reconnue")
+    return _distances_bloc(np.asarray(lignes, dtype=np.float32), np.asarray(autres, dtype=np.float32), methode)
+
+# Sélection partielle des k plus petites distances, triées (ordre d'origine en cas d'égalité).
+# argpartition choisit arbitrairement parmi les ex aequo de la k-ième valeur : ceux-ci sont
+# départagés explicitement par leur position
+def selection_top_k(distances, k):
+    n = len(distances)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < n:
+        limite = np.partition(distances, k - 1)[k - 1]
+        indices = np.flatnonzero(distances < limite)
+        ex_aequo = np.flatnonzero(distances == limite)[:k - len(indices)]
+        indices = np.concatenate([indices, ex_aequo])
+        indices.sort()
+    else:
+        indices = np.arange(n)
+    return indices[np.argsort(distances[indices], kind="stable")]
+
+# Recherche des k plus proches voisins dans une matrice de caractéristiques
+def rechercher_top_k(requete, matrice, chemins, distance="euclidienne", k=5, taille_bloc=TAILLE_BLOC_DEFAUT):
+    with mesurer("distance"):
+        distances = calculer_distances(requete, matrice, distance, taille_bloc)
+    with mesurer("selection"):
+        indices = selection_top_k(distances, k)
+    return [(chemins[i], float(distances[i])) for i in indices]
+
+# Marges de la présélection euclidienne des recherches groupées : le produit matriciel diffère de
+# calculer_distances par l'arrondi relatif des écarts float32 et par une erreur absolue proportionnelle
+# aux normes (||a||² + ||b||² - 2 a.b), d'au plus ~1e-7 x norme sur la distance
+MARGE_RELATIVE_LOT = 1e-6
+MARGE_NORMES_LOT = 1e-6
+
+# Distances entre plusieurs requêtes (q x dimension) et toutes les lignes de la matrice : (q x n).
+# Chaque bloc de la matrice n'est lu qu'une fois pour toutes les requêtes ; la distance euclidienne
+# passe par un produit matriciel en float64 (||a||² + ||b||² - 2 a.b), approché aux arrondis près
+def calculer_distances_lot(requetes, matrice, methode="euclidienne", taille_bloc=TAILLE_BLOC_LOT):
+    if methode not in DISTANCES:
+        raise ValueError("Méthode de distance non reconnue")
+
+    requetes = np.atleast_2d(np.asarray(requetes, dtype=np.float32))
+    if matrice.shape[1] != requetes.shape[1]:
+        raise ValueError(f"Incompatibilité de dimensions: Query={requetes.shape[1]}, Stockée={matrice.shape[1]}")
+
+    n = matrice.shape[0]
+    distances = np.empty((len(requetes), n), dtype=np.float64)
+    if methode == "euclidienne":
+        requetes64 = requetes.astype(np.float64)
+        normes_requetes = np.einsum("ij,ij->i", requetes64, requetes64)[:, None]
+    taille_bloc = taille_bloc or n
+    for debut in range(0, n, max(1, taille_bloc)):
+        fin = min(debut + taille_bloc, n)
+        bloc = matrice[debut:fin]
+        if methode == "euclidienne":
+            bloc64 = bloc.astype(np.float64)
+            carres = normes_requetes + np.einsum("ij,ij->i", bloc64, bloc64) - 2 * (requetes64 @ bloc64.T)
+            np.maximum(carres, 0, out=carres)
+            np.sqrt(carres, out=distances[:, debut:fin])
+        else:
+            for i, requete in enumerate(requetes):
+                distances[i, debut:fin] = _distances_bloc(bloc, requete, methode)
+    return distances
+
+# Recherche groupée : k plus proches voisins de chaque requête (ks : un k par requête)
+def rechercher_top_k_lot(requetes, matrice, chemins, distance="euclidienne", ks=5, taille_bloc=TAILLE_BLOC_LOT):
+    if np.isscalar(ks):
+        ks = [ks] * len(requetes)
+    # Une seule requête : recherche simple (calcul direct des écarts, sans produit matriciel)
+    if len(requetes) == 1:
+        return [rechercher_top_k(requetes[0], matrice, chemins, distance, ks[0])]
+    with mesurer("distance"):
+        distances = calculer_distances_lot(requetes, matrice, distance, taille_bloc)
+    norme_max = 0.0
+    if distance == "euclidienne" and len(matrice):
+        norme_max = np.sqrt(np.einsum("ij,ij->i", matrice, matrice, dtype=np.float64).max())
+    resultats = []
+    with mesurer("selection"):
+        for requete, ligne, k in zip(requetes, distances, ks):
+            if distance == "euclidienne":
+                indices, valeurs = _affiner_top_k(requete, matrice, ligne, k, norme_max)
+            else:
+                indices = selection_top_k(ligne, k)
+                valeurs = ligne[indices]
+            resultats.append([(chemins[i], float(v)) for i, v in zip(indices, valeurs)])
+    return resultats
+
+# k plus proches voisins à partir des distances euclidiennes du produit matriciel : les candidats
+# sous la k-ième distance, plus la marge d'arrondi, sont recalculés comme dans rechercher_top_k
+# (mêmes distances et même ordre que la recherche simple)
+def _affiner_top_k(requete, matrice, approchees, k, norme_max):
+    k = min(k, len(approchees))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    requete = np.asarray(requete, dtype=np.float32)
+    limite = np.partition(approchees, k - 1)[k - 1]
+    marge = MARGE_RELATIVE_LOT * limite + MARGE_NORMES_LOT * (norme_max + np.linalg.norm(requete))
+    candidats = np.flatnonzero(approchees <= limite + marge)
+    exactes = _distances_bloc(matrice[candidats], requete, "euclidienne")
+    choisis = selection_top_k(exactes, k)
+    return candidats[choisis], exactes[choisis]
@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import numpy as np
+
+# Extraction par segments : les résultats sont écrits sur disque au fil de l'eau, par groupes
+# d'images, dans un dossier de travail (SignaturesGlcm.segments/). Après un arrêt (plantage, manque
+# de mémoire), une extraction relancée avec les mêmes paramètres reprend après le dernier segment
+# terminé ; l'index final est ensuite assemblé à partir des segments.
+
+TAILLE_SEGMENT = 2000
+FICHIER_TRAVAIL = "travail.json"
+
+# Dossier de travail associé à un fichier de signatures (SignaturesGlcm -> SignaturesGlcm.segments)
+def dossier_segments(fichier_sortie):
+    return f"{os.path.splitext(fichier_sortie)[0]}.segments"
+
+def cle_variante(methode, rgb):
+    return f"{methode}_rgb" if rgb else methode
+
+def lister_segments(dossier):
+    return sorted(os.path.join(dossier, nom) for nom in os.listdir(dossier)
+                  if nom.startswith("segment_") and nom.endswith(".npz"))
+
+# Ouverture du dossier de travail. Les segments d'un travail aux paramètres différents sont effacés.
+# Renvoie la liste des segments déjà terminés (vide pour un nouveau travail)
+def ouvrir_travail(dossier, parametres, reprendre=True):
+    fichier = os.path.join(dossier, FICHIER_TRAVAIL)
+    if reprendre and os.path.exists(fichier):
+        with open(fichier, encoding="utf-8") as f:
+            if json.load(f) == parametres:
+                return lister_segments(dossier)
+    if os.path.exists(dossier):
+        shutil.rmtree(dossier)
+    os.makedirs(dossier)
+    with open(f"{fichier}.tmp", "w", encoding="utf-8") as f:
+        json.dump(parametres, f, ensure_ascii=False)
+    os.replace(f"{fichier}.tmp", fichier)
+    return []
+
+def supprimer_travail(dossier):
+    shutil.rmtree(dossier, ignore_errors=True)
+
+# Ecriture atomique d'un segment.
+# resultats : [(chemin relatif, (taille, mtime_ns, hash), {(méthode, rgb): caractéristiques} ou None, erreur)]
+def ecrire_segment(dossier, numero, resultats, variantes):
+    chemins = [path_relative for path_relative, _, _, _ in resultats]
+    etats = [etat for _, etat, _, _ in resultats]
+    reussis = [caracs for _, _, caracs, _ in resultats if caracs is not None]
+    tableaux = {
+        "chemins": np.array(chemins, dtype=str),
+        "tailles": np.array([etat[0] for etat in etats], dtype=np.int64),
+        "mtimes": np.array([etat[1] for etat in etats], dtype=np.int64),
+        "hashs": np.array([etat[2] for etat in etats], dtype=str),
+        "succes": np.array([caracs is not None for _, _, caracs, _ in resultats], dtype=bool),
+        "erreurs": np.array([erreur or "" for _, _, _, erreur in resultats], dtype=str),
+    }
+    for variante in variantes:
+        if reussis:
+            tableaux[cle_variante(*variante)] = np.asarray([caracs[variante] for caracs in reussis], dtype=np.float32)
+
+    fichier = os.path.join(dossier, f"segment_{numero:06d}.npz")
+    temporaire = os.path.join(dossier, f"tmp_segment_{numero:06d}.npz")
+    np.savez(temporaire, **tableaux)
+    os.replace(temporaire, fichier)
+    return fichier
+
+# Etat des fichiers déjà traités (réussis ou en échec) dans les segments : {chemin relatif: (taille, mtime_ns, hash)}
+def fichiers_traites(segments):
+    etats = {}
+    for fichier in segments:
+        with np.load(fichier) as segment:
+            for path_relative, taille, mtime_ns, empreinte in zip(segment["chemins"], segment["tailles"],
+                                                                  segment["mtimes"], segment["hashs"]):
+                etats[str(path_relative)] = (int(taille), int(mtime_ns), str(empreinte))
+    return etats
+
+# Bilan des segments pour l'assemblage. Un fichier traité plusieurs fois (modifié entre un arrêt et
+# la reprise) ne garde que son dernier résultat ; si presents (chemins relatifs du dossier) est donné,
+# les fichiers supprimés depuis leur traitement sont écartés. Renvoie (chemins, entrées du manifeste,
+# échecs, masques des lignes conservées par segment)
+def inventaire(segments, presents=None):
+    derniers = {}
+    for i, fichier in enumerate(segments):
+        with np.load(fichier) as segment:
+            for j, path_relative in enumerate(segment["chemins"]):
+                derniers[str(path_relative)] = (i, j)
+
+    chemins, entrees, echecs, masques = [], {}, [], []
+    for i, fichier in enumerate(segments):
+        with np.load(fichier) as segment:
+            succes = segment["succes"]
+            masque = []
+            for j, path_relative in enumerate(segment["chemins"]):
+                path_relative = str(path_relative)
+                garde = derniers[path_relative] == (i, j) and (presents is None or path_relative in presents)
+                if succes[j]:
+                    masque.append(garde)
+                    if garde:
+                        chemins.append(path_relative)
+                        entrees[path_relative] = (int(segment["tailles"][j]), int(segment["mtimes"][j]),
+                                                  str(segment["hashs"][j]))
+                elif garde:
+                    echecs.append((path_relative, str(segment["erreurs"][j])))
+            masques.append(np.array(masque, dtype=bool))
+    return chemins, entrees, echecs, masques
+
+# Caractéristiques d'une variante, segment par segment (blocs nombre x dimension) ;
+# peut être parcouru plusieurs fois (index puis CSV) sans tout charger en mémoire
+class BlocsSegments:
+    def __init__(self, segments, masques, variante):
+        self.segments = segments
+        self.masques = masques
+        self.cle = cle_variante(*variante)
+
+    def __iter__(self):
+        for fichier, masque in zip(self.segments, self.masques):
+            if not masque.any():
+                continue
+            with np.load(fichier) as segment:
+                yield segment[self.cle][masque]
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import Request, urlopen
+import numpy as np
+from cbir import caracteristiques_requete, empreinte_requete, extraire_caracteristiques
+from cache import (obtenir_index, version_index, resultats_en_cache, memoriser_resultats, etat_cache_index,
+                   etat_caches_requetes)
+from fragments import rechercher_image_fragments
+from moteur import DISTANCES, rechercher_top_k_lot
+from instrumentation import journal, mesurer, incrementer, metriques
+
+# Service de recherche local : un processus garde les index en mémoire (cache d'index) pour
+# toutes les sessions Streamlit, et regroupe les requêtes simultanées sur un même index et une
+# même distance en un seul calcul matriciel (moteur.rechercher_top_k_lot).
+#   python -m service --port 8765 --prechargement SignaturesGlcm.idx
+# Côté page : CBIR_SERVICE_URL=http://127.0.0.1:8765 streamlit run main.py
+
+HOTE_SERVICE = "127.0.0.1"
+PORT_SERVICE = 8765
+URL_SERVICE = os.environ.get("CBIR_SERVICE_URL")
+
+# Attente maximale (secondes) pour compléter un lot après la première requête, et taille maximale d'un lot
+DELAI_REGROUPEMENT = 0.002
+TAILLE_LOT_MAX = 64
+
+# Requêtes en attente sur un index et une distance, traitées par lots dans un thread dédié
+class Regroupeur:
+    def __init__(self, fichier, distance, delai=DELAI_REGROUPEMENT, taille_max=TAILLE_LOT_MAX):
+        self.fichier = fichier
+        self.distance = distance
+        self.delai = delai
+        self.taille_max = taille_max
+        self._file = queue.Queue()
+        threading.Thread(target=self._boucler, daemon=True, name=f"regroupeur-{distance}").start()
+
+    # Ajout d'une requête (vecteur de la dimension de l'index) ; le futur reçoit [(chemin, distance)]
+    def soumettre(self, vecteur, k):
+        futur = Future()
+        self._file.put((vecteur, k, futur))
+        return futur
+
+    def _boucler(self):
+        while True:
+            lot = [self._file.get()]
+            limite = time.perf_counter() + self.delai
+            while len(lot) < self.taille_max:
+                restant = limite - time.perf_counter()
+                try:
+                    lot.append(self._file.get(timeout=restant) if restant > 0 else self._file.get_nowait())
+                except queue.Empty:
+                    break
+            self._traiter(lot)
+
+    def _traiter(self, lot):
+        try:
+            index = obtenir_index(self.fichier)
+            requetes = np.stack([vecteur for vecteur, _, _ in lot])
+            with mesurer("recherche_lot"):
+                resultats = rechercher_top_k_lot(requetes, index.caracteristiques, index.chemins, self.distance,
+                                                 [k for _, k, _ in lot])
+            incrementer("lots_recherche")
+            incrementer("requetes_regroupees", len(lot))
+        except Exception as e:
+            for _, _, futur in lot:
+                futur.set_exception(e)
+            return
+        for (_, _, futur), resultat in zip(lot, resultats):
+            futur.set_result(resultat)
+
+class ServiceRecherche:
+    def __init__(self, racine=".", delai=DELAI_REGROUPEMENT, taille_max=TAILLE_LOT_MAX):
+        self.racine = os.path.realpath(racine)
+        self.delai = delai
+        self.taille_max = taille_max
+        self._regroupeurs = {}
+        self._verrou = threading.Lock()
+
+    # Chemin d'un index demandé par un client, limité aux fichiers sous la racine du service
+    def _chemin(self, fichier):
+        chemin = os.path.realpath(os.path.join(self.racine, fichier))
+        if os.path.commonpath([chemin, self.racine]) != self.racine:
+            raise ValueError(f"Fichier hors du dossier du service: {fichier}")
+        return chemin
+
+    def _regroupeur(self, chemin, distance):
+        with self._verrou:
+            cle = (chemin, distance)
+            if cle not in self._regroupeurs:
+                self._regroupeurs[cle] = Regroupeur(chemin, distance, self.delai, self.taille_max)
+            return self._regroupeurs[cle]
+
+    def precharger(self, fichier):
+        index = obtenir_index(self._chemin(fichier))
+        journal.info(f"Index {fichier} chargé: {len(index)} signatures")
+
+    def _rechercher_vecteur(self, vecteur, chemin, distance, k):
+        if distance not in DISTANCES:
+            raise ValueError("Méthode de distance non reconnue")
+        if k < 1:
+            raise ValueError("k doit être positif")
+        index = obtenir_index(chemin)
+        vecteur = np.asarray(vecteur, dtype=np.float32).ravel()
+        if len(vecteur) != index.dimension:
+            raise ValueError(f"Incompatibilité de dimensions: Query={len(vecteur)}, Stockée={index.dimension}")
+        return self._regroupeur(chemin, distance).soumettre(vecteur, k).result()
+
+    # Recherche par vecteur de caractéristiques (déjà extrait par le client)
+    def rechercher_vecteur(self, vecteur, fichier, distance="euclidienne", k=5):
+        incrementer("requetes")
+        return self._rechercher_vecteur(vecteur, self._chemin(fichier), distance, k)
+
+    # Extraction (méthode, RGB et profil de l'index) puis recherche ; contenu : fichier image (bytes).
+    # Un index fragmenté (.fragments.json) est parcouru par fragments, sans regroupement
+    def rechercher(self, contenu, fichier, distance="euclidienne", k=5):
+        incrementer("requetes")
+        chemin = self._chemin(fichier)
+        if chemin.endswith(".fragments.json"):
+            return rechercher_image_fragments(contenu, chemin, distance, k)
+
+        cle_resultats = (empreinte_requete(contenu), version_index(chemin), distance)
+        resultats = resultats_en_cache(cle_resultats, k)
+        if resultats is not None:
+            incrementer("cache_resultats")
+            return resultats
+
+        index = obtenir_index(chemin)
+        with mesurer("extraction_requete"):
+            vecteur = caracteristiques_requete(contenu, index.methode, index.rgb, index.profil, cle_resultats[0])
+        if vecteur is None:
+            raise ValueError("Impossible d'extraire les caractéristiques de l'image requête")
+        resultats = self._rechercher_vecteur(vecteur, chemin, distance, k)
+        memoriser_resultats(cle_resultats, k, resultats)
+        return resultats
+
+    def extraire(self, contenu, methode="glcm", rgb=False, profil=None):
+        vecteur = extraire_caracteristiques(contenu, methode, rgb, profil)
+        if vecteur is None:
+            raise ValueError("Impossible d'extraire les caractéristiques de l'image")
+        return np.asarray(vecteur, dtype=np.float64).tolist()
+
+    def etat(self):
+        return {"index": etat_cache_index(), "requetes": etat_caches_requetes(), "metriques": metriques.instantane()}
+
+#---------------------Serveur HTTP-------------------------------
+
+# Points d'accès (JSON en sortie) :
+#   POST /rechercher?fichier=&distance=&k=          corps : fichier image
+#   POST /rechercher_vecteur                        corps : {"vecteur", "fichier", "distance", "k"}
+#   POST /extraire?methode=&rgb=&profil=            corps : fichier image
+#   GET  /etat, GET /sante
+class _Requetes(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        journal.debug("service: " + format, *args)
+
+    def _repondre(self, code, donnees):
+        corps = json.dumps(donnees, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def _traiter(self, action):
+        try:
+            self._repondre(200, action())
+        except ValueError as e:
+            self._repondre(400, {"erreur": str(e)})
+        except FileNotFoundError as e:
+            self._repondre(404, {"erreur": str(e)})
+        except Exception as e:
+            journal.error(f"Erreur du service de recherche: {e}")
+            self._repondre(500, {"erreur": str(e)})
+
+    def do_GET(self):
+        service = self.server.service
+        chemin = urlparse(self.path).path
+        if chemin == "/sante":
+            self._traiter(lambda: {"ok": True})
+        elif chemin == "/etat":
+            self._traiter(service.etat)
+        else:
+            self._repondre(404, {"erreur": f"Point d'accès inconnu: {chemin}"})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        parametres = {cle: valeurs[-1] for cle, valeurs in parse_qs(url.query).items()}
+        corps = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path == "/rechercher":
+            self._traiter(lambda: {"resultats": service.rechercher(
+                corps, parametres.get("fichier", ""), parametres.get("distance", "euclidienne"),
+                int(parametres.get("k", 5)))})
+        elif url.path == "/rechercher_vecteur":
+            def rechercher_vecteur():
+                requete = json.loads(corps)
+                return {"resultats": service.rechercher_vecteur(
+                    requete["vecteur"], requete["fichier"], requete.get("distance", "euclidienne"),
+                    int(requete.get("k", 5)))}
+            self._traiter(rechercher_vecteur)
+        elif url.path == "/extraire":
+            self._traiter(lambda: {"vecteur": service.extraire(
+                corps, parametres.get("methode", "glcm"), parametres.get("rgb", "0") in ("1", "true"),
+                parametres.get("profil"))})
+        else:
+            self._repondre(404, {"erreur": f"Point d'accès inconnu: {url.path}"})
+
+# Serveur prêt à l'emploi (port 0 : port libre choisi par le système, cf. serveur.server_port)
+def creer_serveur(service=None, hote=HOTE_SERVICE, port=PORT_SERVICE):
+    serveur = ThreadingHTTPServer((hote, port), _Requetes)
+    serveur.daemon_threads = True
+    serveur.service = service or ServiceRecherche()
+    return serveur
+
+#---------------------Client-------------------------------
+
+# Client du service ; les erreurs de requête (paramètres, fichier absent) lèvent ValueError,
+# un service injoignable lève OSError
+class ClientRecherche:
+    def __init__(self, url=None, delai=60):
+        self.url = (url or URL_SERVICE or f"http://{HOTE_SERVICE}:{PORT_SERVICE}").rstrip("/")
+        self.delai = delai
+
+    def _appeler(self, chemin, parametres=None, corps=None, type_contenu="application/octet-stream"):
+        url = f"{self.url}{chemin}"
+        if parametres:
+            url += "?" + urlencode(parametres)
+        requete = Request(url, data=corps, headers={"Content-Type": type_contenu} if corps is not None else {})
+        try:
+            with urlopen(requete, timeout=self.delai) as reponse:
+                return json.loads(reponse.read())
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("erreur", str(e))
+            except ValueError:
+                message = str(e)
+            raise ValueError(message) from None
+
+    def sante(self):
+        return self._appeler("/sante").get("ok", False)
+
+    def etat(self):
+        return self._appeler("/etat")
+
+    # Même résultat que cbir.rechercher_image : [(chemin, distance)]
+    def rechercher(self, contenu, fichier, distance="euclidienne", k=5):
+        reponse = self._appeler("/rechercher", {"fichier": fichier, "distance": distance, "k": k}, bytes(contenu))
+        return [(chemin, score) for chemin, score in reponse["resultats"]]
+
+    def rechercher_vecteur(self, vecteur, fichier, distance="euclidienne", k=5):
+        corps = json.dumps({"vecteur": np.asarray(vecteur, dtype=np.float64).tolist(), "fichier": fichier,
+                            "distance": distance, "k": k}).encode("utf-8")
+        reponse = self._appeler("/rechercher_vecteur", corps=corps, type_contenu="application/json")
+        return [(chemin, score) for chemin, score in reponse["resultats"]]
+
+    def extraire(self, contenu, methode="glcm", rgb=False, profil=None):
+        parametres = {"methode": methode, "rgb": int(bool(rgb))}
+        if profil is not None:
+            parametres["profil"] = profil
+        return np.asarray(self._appeler("/extraire", parametres, bytes(contenu))["vecteur"], dtype=np.float32)
+
+#---------------------Outil en ligne de commande-------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Service local de recherche d'images")
+    parser.add_argument("--hote", default=HOTE_SERVICE)
+    parser.add_argument("--port", type=int, default=PORT_SERVICE)
+    parser.add_argument("--delai", type=float, default=DELAI_REGROUPEMENT * 1000,
+                        help="Attente maximale (ms) pour regrouper les requêtes simultanées")
+    parser.add_argument("--lot", type=int, default=TAILLE_LOT_MAX, help="Nombre maximal de requêtes par lot")
+    parser.add_argument("--prechargement", nargs="*", default=[], help="Index à charger au démarrage")
+    args = parser.parse_args()
+
+    service = ServiceRecherche(delai=args.delai / 1000, taille_max=args.lot)
+    for fichier in args.prechargement:
+        service.precharger(fichier)
+    serveur = creer_serveur(service, args.hote, args.port)
+    journal.info(f"Service de recherche sur http://{args.hote}:{serveur.server_port}")
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+
+if __name__ == "__main__":
+    main()
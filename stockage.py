@@ -0,0 +1,202 @@
+import contextlib
+import json
+import os
+import struct
+import numpy as np
+from moteur import preparer_matrice
+from instrumentation import journal
+
+# Format d'index typé (.idx) :
+#   MAGIE (8 octets) | longueur de l'en-tête (uint64) | en-tête JSON | bourrage (alignement 64)
+#   | caractéristiques float32 (nombre x dimension, petit-boutiste)
+#   | table des chemins (UTF-8 séparés par des octets nuls)
+# Les caractéristiques s'ouvrent en mémoire projetée (np.memmap), sans copie ni pickle.
+
+MAGIE = b"CBIRIDX\x00"
+VERSION = 1
+EXTENSION = ".idx"
+ALIGNEMENT = 64
+DTYPE = np.dtype("<f4")
+
+def _aligner(position):
+    return (position + ALIGNEMENT - 1) // ALIGNEMENT * ALIGNEMENT
+
+# Fichier .idx correspondant à un fichier de signatures (SignaturesGlcm.npy -> SignaturesGlcm.idx)
+def chemin_index(fichier_signatures):
+    return os.path.splitext(fichier_signatures)[0] + EXTENSION
+
+class IndexSignatures:
+    def __init__(self, fichier, entete, caracteristiques, octets_chemins=b"", chemins=None):
+        self.fichier = fichier
+        self.entete = entete
+        self.caracteristiques = caracteristiques
+        self._octets_chemins = octets_chemins
+        self._chemins = chemins
+
+    @property
+    def methode(self):
+        return self.entete["methode"]
+
+    @property
+    def rgb(self):
+        return self.entete["rgb"]
+
+    @property
+    def dimension(self):
+        return self.entete["dimension"]
+
+    # Profil d'extraction des signatures (None : pleine résolution, 256 niveaux)
+    @property
+    def profil(self):
+        return self.entete.get("profil")
+
+    # Table des chemins, décodée au premier accès
+    @property
+    def chemins(self):
+        if self._chemins is None:
+            if self.entete["nombre"] == 0:
+                self._chemins = []
+            else:
+                self._chemins = bytes(self._octets_chemins).decode("utf-8").split("\x00")
+        return self._chemins
+
+    def __len__(self):
+        return self.entete["nombre"]
+
+# Ecriture atomique d'un index (fichier temporaire puis remplacement)
+def ecrire_index(fichier, caracteristiques, chemins, methode, rgb, **metadonnees):
+    caracteristiques = np.ascontiguousarray(caracteristiques, dtype=DTYPE)
+    if caracteristiques.ndim != 2 or caracteristiques.shape[0] != len(chemins):
+        raise ValueError(f"Caractéristiques {caracteristiques.shape} incompatibles avec {len(chemins)} chemins")
+    return ecrire_index_par_blocs(fichier, [caracteristiques], chemins, methode, rgb, caracteristiques.shape[1],
+                                  **metadonnees)
+
+# Ecriture atomique d'un index à partir de blocs de lignes (nombre x dimension) produits au fil de l'eau,
+# sans assembler la matrice complète en mémoire
+def ecrire_index_par_blocs(fichier, blocs, chemins, methode, rgb, dimension, **metadonnees):
+    table = "\x00".join(chemins).encode("utf-8")
+    entete = dict(metadonnees)
+    entete.update({
+        "version": VERSION,
+        "methode": methode,
+        "rgb": bool(rgb),
+        "dimension": int(dimension),
+        "nombre": len(chemins),
+        "octets_chemins": len(table),
+    })
+    octets_entete = json.dumps(entete, ensure_ascii=False).encode("utf-8")
+    debut = len(MAGIE) + 8 + len(octets_entete)
+
+    temporaire = f"{fichier}.tmp"
+    try:
+        with open(temporaire, "wb") as f:
+            f.write(MAGIE)
+            f.write(struct.pack("<Q", len(octets_entete)))
+            f.write(octets_entete)
+            f.write(b"\x00" * (_aligner(debut) - debut))
+            nombre = 0
+            for bloc in blocs:
+                bloc = np.ascontiguousarray(bloc, dtype=DTYPE)
+                if bloc.ndim != 2 or bloc.shape[1] != dimension:
+                    raise ValueError(f"Bloc {bloc.shape} incompatible avec la dimension {dimension}")
+                f.write(bloc.tobytes())
+                nombre += len(bloc)
+            if nombre != len(chemins):
+                raise ValueError(f"{nombre} lignes de caractéristiques pour {len(chemins)} chemins")
+            f.write(table)
+    except BaseException:
+        # Le fichier temporaire n'existe pas si l'échec précède sa création (dossier absent...)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporaire)
+        raise
+    os.replace(temporaire, fichier)
+    return fichier
+
+# Lecture de l'en-tête seul : (en-tête, position des caractéristiques)
+def lire_entete(fichier):
+    with open(fichier, "rb") as f:
+        if f.read(len(MAGIE)) != MAGIE:
+            raise ValueError(f"{fichier} n'est pas un index de signatures")
+        (longueur,) = struct.unpack("<Q", f.read(8))
+        entete = json.loads(f.read(longueur).decode("utf-8"))
+    if entete.get("version", 0) > VERSION:
+        raise ValueError(f"Version d'index non supportée: {entete.get('version')}")
+    return entete, _aligner(len(MAGIE) + 8 + longueur)
+
+# Les signatures en niveaux de gris des anciens .npy viennent d'images décodées directement en gris
+# (IMREAD_GRAYSCALE) ; les requêtes passent par cvtColor(BGR2GRAY), qui donne des caractéristiques
+# différentes (jusqu'à ~6 % pour BiT). Ces index doivent être réextraits, pas convertis
+def decodage_obsolete(entete):
+    return not entete["rgb"] and str(entete.get("source", "")).endswith(".npy")
+
+def _refuser_decodage_obsolete(entete, fichier):
+    if decodage_obsolete(entete):
+        raise ValueError(f"{fichier} : signatures en niveaux de gris d'un ancien fichier .npy, incompatibles "
+                         "avec l'extraction actuelle des requêtes ; réextraire l'index")
+
+# Ouverture d'un index ; avec mmap, les caractéristiques restent sur disque (cache de pages partagé).
+# Les index en niveaux de gris convertis d'un ancien .npy sont refusés
+def ouvrir_index(fichier, mmap=True):
+    entete, position = lire_entete(fichier)
+    _refuser_decodage_obsolete(entete, fichier)
+    nombre, dimension = entete["nombre"], entete["dimension"]
+    taille = nombre * dimension * DTYPE.itemsize
+
+    if nombre == 0:
+        return IndexSignatures(fichier, entete, np.empty((0, dimension), dtype=DTYPE), b"")
+
+    if mmap:
+        caracteristiques = np.memmap(fichier, dtype=DTYPE, mode="r", offset=position, shape=(nombre, dimension))
+        octets_chemins = np.memmap(fichier, dtype=np.uint8, mode="r", offset=position + taille,
+                                   shape=(entete["octets_chemins"],))
+    else:
+        with open(fichier, "rb") as f:
+            f.seek(position)
+            caracteristiques = np.frombuffer(f.read(taille), dtype=DTYPE).reshape(nombre, dimension)
+            octets_chemins = f.read(entete["octets_chemins"])
+    return IndexSignatures(fichier, entete, caracteristiques, octets_chemins)
+
+# Méthode et mode RGB déduits du nom d'un ancien fichier .npy
+def _deviner_variante(fichier_npy):
+    nom = os.path.basename(fichier_npy)
+    methode = "glcm"
+    if "Haralick" in nom:
+        methode = "haralick"
+    elif "Bit" in nom:
+        methode = "bit"
+    elif "Concat" in nom:
+        methode = "concat"
+    return methode, "rgb" in nom.lower()
+
+# Lecture en mémoire d'un ancien fichier de signatures .npy (tableau objet caractéristiques + chemin) ;
+# seules les variantes RGB sont acceptées (voir decodage_obsolete)
+def index_depuis_npy(fichier_npy, methode=None, rgb=None):
+    methode_devinee, rgb_devine = _deviner_variante(fichier_npy)
+    rgb = rgb_devine if rgb is None else bool(rgb)
+    _refuser_decodage_obsolete({"rgb": rgb, "source": os.path.basename(fichier_npy)}, fichier_npy)
+    signatures = np.load(fichier_npy, allow_pickle=True)
+    caracteristiques, chemins = preparer_matrice(signatures)
+    entete = {
+        "version": VERSION,
+        "methode": methode or methode_devinee,
+        "rgb": rgb,
+        "dimension": int(caracteristiques.shape[1]),
+        "nombre": len(chemins),
+        "source": os.path.basename(fichier_npy),
+    }
+    return IndexSignatures(fichier_npy, entete, caracteristiques, chemins=chemins)
+
+# Conversion d'un ancien fichier .npy vers le format .idx
+def convertir_npy(fichier_npy, fichier_index=None, methode=None, rgb=None):
+    index = index_depuis_npy(fichier_npy, methode, rgb)
+    fichier_index = fichier_index or chemin_index(fichier_npy)
+    ecrire_index(fichier_index, index.caracteristiques, index.chemins, index.methode, index.rgb,
+                 source=index.entete["source"])
+    journal.info(f"Index converti: {fichier_npy} -> {fichier_index} ({len(index)} signatures)")
+    return fichier_index
+
+# Ouverture d'un fichier de signatures quel que soit son format (.idx ou ancien .npy)
+def charger_index(fichier, mmap=True):
+    if fichier.endswith(".npy"):
+        return index_depuis_npy(fichier)
+    return ouvrir_index(fichier, mmap)
@@ -0,0 +1,24 @@
+import numpy as np
+import auth
+import db
+import galerie_faciale
+
+# Un email présent deux fois dans un lot : seule la première ligne est inscrite, avec son propre visage
+def test_lot_avec_email_en_double(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(galerie_faciale, "_galerie", None)
+    db.creer_base_donnees()
+    galerie = galerie_faciale.obtenir_galerie()
+
+    alice = np.full(galerie_faciale.DIMENSION_ENCODAGE, 0.1)
+    mallory = np.full(galerie_faciale.DIMENSION_ENCODAGE, -0.1)
+    inscrits, rejets = auth._inscrire_encodages([
+        ("alice", "x@y", "mdp", alice, None),
+        ("mallory", "x@y", "autre", mallory, None),
+    ])
+
+    assert inscrits == ["x@y"]
+    assert [email for email, _ in rejets] == ["x@y"]
+    assert galerie.identifier(alice) == ("x@y", 0.0)
+    assert galerie.identifier(mallory)[0] is None
+    db.fermer_connexions()
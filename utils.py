@@ -26,4 +26,23 @@ def preprocess_image_for_face_recognition(image):
         scale = max_size / max(height, width)
         image = cv2.resize(image, (int(width * scale), int(height * scale)))
     
-    return image
\ No newline at end of file
+    return image
+
+# Côté maximal de la copie réduite sur laquelle les visages sont cherchés ; l'encodage se fait
+# ensuite sur l'image prétraitée (800 px au plus), dans la boîte ramenée à son échelle
+COTE_DETECTION = 400
+
+# Copie réduite de l'image pour la détection ; renvoie (copie, échelle appliquée)
+def reduire_pour_detection(image, cote_max=COTE_DETECTION):
+    height, width = image.shape[:2]
+    scale = cote_max / max(height, width)
+    if scale >= 1:
+        return image, 1.0
+    taille = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, taille, interpolation=cv2.INTER_AREA), scale
+
+# Boîte (haut, droite, bas, gauche) trouvée sur la copie réduite, ramenée aux coordonnées de l'image
+def agrandir_boite(boite, scale, forme):
+    haut, droite, bas, gauche = (int(round(v / scale)) for v in boite)
+    height, width = forme[:2]
+    return max(0, haut), min(width, droite), min(height, bas), max(0, gauche)
@@ -0,0 +1,107 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from cbir import lister_images
+from instrumentation import journal, mesurer
+from manifeste import scanner_dossier, lire_manifeste, ecrire_manifeste, comparer_manifestes
+
+# Vignettes des images du dataset pour l'affichage des résultats : JPEG de COTE_VIGNETTE pixels
+# au plus, rangés dans Vignettes_<côté>/ sous un nom dérivé du chemin relatif de l'image.
+# Un manifeste (même format que celui des index) permet de ne régénérer que les images
+# nouvelles ou modifiées.
+
+COTE_VIGNETTE = 256
+QUALITE_JPEG = 85
+
+def dossier_vignettes(cote=COTE_VIGNETTE):
+    return f"Vignettes_{cote}"
+
+# Fichier de la vignette d'une image (sous-dossiers par préfixe pour limiter la taille des dossiers)
+def chemin_vignette(path_relative, dossier):
+    cle = os.path.normpath(path_relative).replace(os.sep, "/")
+    nom = hashlib.blake2b(cle.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(dossier, nom[:2], f"{nom}.jpg")
+
+# Vignette encodée (JPEG) d'une image BGR
+def creer_vignette(data, cote=COTE_VIGNETTE):
+    echelle = cote / max(data.shape[:2])
+    if echelle < 1:
+        taille = (max(1, round(data.shape[1] * echelle)), max(1, round(data.shape[0] * echelle)))
+        data = cv2.resize(data, taille, interpolation=cv2.INTER_AREA)
+    ok, contenu = cv2.imencode(".jpg", data, [cv2.IMWRITE_JPEG_QUALITY, QUALITE_JPEG])
+    if not ok:
+        raise ValueError("Impossible d'encoder la vignette")
+    return contenu.tobytes()
+
+# Génération et écriture (atomique) de la vignette d'une image ; renvoie (chemin relatif, erreur)
+def _generer_vignette(tache):
+    chemin_dossier, path_relative, dossier, cote = tache
+    try:
+        data = cv2.imread(os.path.join(chemin_dossier, path_relative))
+        if data is None:
+            raise ValueError(f"Impossible de lire l'image: {path_relative}")
+        fichier = chemin_vignette(path_relative, dossier)
+        os.makedirs(os.path.dirname(fichier), exist_ok=True)
+        with open(f"{fichier}.tmp", "wb") as f:
+            f.write(creer_vignette(data, cote))
+        os.replace(f"{fichier}.tmp", fichier)
+        return path_relative, None
+    except Exception as e:
+        return path_relative, str(e).strip()
+
+def _initialiser_processus():
+    cv2.setNumThreads(1)
+
+# Création ou mise à jour des vignettes d'un dossier : seules les images nouvelles ou modifiées
+# depuis la dernière mise à jour sont traitées, les vignettes des images supprimées sont retirées
+def mettre_a_jour_vignettes(chemin_dossier, cote=COTE_VIGNETTE, n_processus=1):
+    dossier = dossier_vignettes(cote)
+    fichier_manifeste = os.path.join(dossier, "manifeste.csv")
+    ancien = lire_manifeste(fichier_manifeste) if os.path.exists(fichier_manifeste) else {}
+    actuel = scanner_dossier(chemin_dossier, lister_images(chemin_dossier))
+    nouveaux, modifies, supprimes = comparer_manifestes(ancien, actuel)
+
+    taches = [(chemin_dossier, path_relative, dossier, cote) for path_relative in nouveaux + modifies]
+    if n_processus is None:
+        n_processus = os.cpu_count() or 1
+    with mesurer("vignettes"):
+        if n_processus <= 1 or len(taches) <= 1:
+            resultats = list(map(_generer_vignette, taches))
+        else:
+            taille_lot = max(1, min(64, len(taches) // (n_processus * 8)))
+            with ProcessPoolExecutor(max_workers=n_processus, initializer=_initialiser_processus) as executor:
+                resultats = list(executor.map(_generer_vignette, taches, chunksize=taille_lot))
+
+    a_generer = set(nouveaux + modifies)
+    entrees = {path_relative: etat for path_relative, etat in actuel.items() if path_relative not in a_generer}
+    for path_relative, erreur in resultats:
+        if erreur is None:
+            entrees[path_relative] = actuel[path_relative]
+        else:
+            journal.warning(f"Vignette non créée pour {path_relative}: {erreur}")
+    for path_relative in supprimes:
+        try:
+            os.remove(chemin_vignette(path_relative, dossier))
+        except OSError:
+            pass
+
+    os.makedirs(dossier, exist_ok=True)
+    ecrire_manifeste(fichier_manifeste, entrees)
+    journal.info(f"Vignettes à jour dans {dossier}: {len(taches)} générées, {len(supprimes)} supprimées")
+    return dossier
+
+# Vignette (JPEG) d'une image du dataset ; créée à la demande si elle n'existe pas encore.
+# Renvoie None si l'image ne peut pas être lue.
+def obtenir_vignette(chemin_dossier, path_relative, cote=COTE_VIGNETTE):
+    fichier = chemin_vignette(path_relative, dossier_vignettes(cote))
+    try:
+        with open(fichier, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    _, erreur = _generer_vignette((chemin_dossier, path_relative, dossier_vignettes(cote), cote))
+    if erreur is not None:
+        return None
+    with open(fichier, "rb") as f:
+        return f.read()